@@ -0,0 +1,124 @@
+""" Automatic switching between dense and sparse evolution.
+
+    At low densities, late in a long run most of the grid is dead, yet a
+    dense evolve still visits every cell and every adjacency slot. An
+    AdaptiveGrid is kept either dense (an int8 grid with its dead last row
+    and column, evolved as usual) or sparse: the sorted flat indices of its
+    live cells. A sparse generation only looks at the live cells and the
+    cells that have them as neighbors (through the reverse adjacency, so
+    rewired small-world edges are handled): every live cell adds one to the
+    count of each cell it neighbors, and only cells with a count can be
+    alive next generation. It costs time proportional to the population
+    rather than to the size of the grid.
+
+    Which one a generation is written in is decided by the population of
+    the generation before (see countLiveCells): grids go sparse once the
+    density drops below SPARSE_BELOW and dense again once it rises above
+    DENSE_ABOVE. The gap keeps a population near the threshold from
+    switching every generation. """
+import numpy as np
+from incremental import ReverseAdjacency, gatherRows
+from gridtools import countLiveCells
+
+# densities (live cells per real cell) to switch at; a sparse generation
+# costs about as much as a dense NumPy one at a density of a quarter, on one
+# thread, so these leave room for a dense evolve on several
+SPARSE_BELOW = 0.1
+DENSE_ABOVE = 0.2
+
+
+class AdaptiveGrid:
+    """ A grid of the given shape (with its dead last row and column), which
+        is sparse if live holds its live cells, and dense (in dense)
+        otherwise. dense is kept while sparse, to be reused as a buffer. """
+    def __init__(self, shape, dense=None, live=None):
+        self.shape = tuple(shape)
+        self.dense = dense
+        self.live = live
+
+    @property
+    def sparse(self):
+        return self.live is not None
+
+    @property
+    def numCells(self):
+        return (self.shape[0] - 1) * (self.shape[1] - 1)
+
+    def population(self):
+        if self.sparse:
+            return len(self.live)
+        return countLiveCells(self.dense)
+
+    def liveCells(self):
+        """ Returns the sorted flat indices of the live cells. """
+        if self.sparse:
+            return self.live
+        return np.flatnonzero(self.dense[0:-1, 0:-1])
+
+    def denseBuffer(self):
+        """ Returns the dense grid, allocated (zeroed) if there is none yet.
+            The grid is dense from now on. """
+        if self.dense is None:
+            self.dense = np.zeros(self.shape, dtype=np.int8)
+        self.live = None
+        return self.dense
+
+    def setLive(self, live, sparse):
+        """ Makes the grid hold the sorted flat live cells live, as a
+            sparse grid if sparse. """
+        if sparse:
+            self.live = live
+            return
+        grid = self.denseBuffer()
+        grid[...] = 0
+        cols = self.shape[1] - 1
+        grid[live // cols, live % cols] = 1
+
+    def toGrid(self):
+        if not self.sparse:
+            return self.dense.copy()
+        grid = np.zeros(self.shape, dtype=np.int8)
+        cols = self.shape[1] - 1
+        grid[self.live // cols, self.live % cols] = 1
+        return grid
+
+
+class AdaptiveAdjacency:
+    """ An adjacency grid (padded or CSRGraph) for the dense evolve, and
+        its reverse adjacency for the sparse one, built the first time a
+        grid goes sparse. """
+    def __init__(self, adjGrid):
+        self.adjGrid = adjGrid
+        self._reverse = None
+
+    @property
+    def reverse(self):
+        if self._reverse is None:
+            self._reverse = ReverseAdjacency(self.adjGrid)
+        return self._reverse
+
+
+def goSparse(grid):
+    """ Returns whether the generation after the AdaptiveGrid grid should be
+        sparse. """
+    density = grid.population() / max(grid.numCells, 1)
+    if grid.sparse:
+        return density <= DENSE_ABOVE
+    return density < SPARSE_BELOW
+
+def stepSparse(live, adj, metrics=False):
+    """ Returns the sorted flat live cells one generation after the sorted
+        flat live cells live, through adj (a ReverseAdjacency). If metrics,
+        also returns (live, matches, total) for live, as evolve2DMetrics
+        does. """
+    # every cell a live cell is a neighbor of, once per edge
+    targets, _ = gatherRows(adj.reverse, live)
+    candidates, counts = np.unique(targets, return_counts=True)
+    position = np.searchsorted(live, candidates)
+    wasAlive = position < len(live)
+    wasAlive[wasAlive] = live[position[wasAlive]] == candidates[wasAlive]
+    new = candidates[(counts == 3) | ((counts == 2) & wasAlive)]
+    if not metrics:
+        return new
+    return new, (len(live), int(counts[wasAlive].sum(dtype=np.int64)),
+                 int(adj.degrees[live].sum(dtype=np.int64)))
@@ -0,0 +1,122 @@
+""" Persistent, content-keyed cache of adjacency grids.
+
+    Building the torus adjacency grid, and rewiring it for every swc, is
+    the same work in every run of a sweep with the same parameters and
+    seed. A cache entry is a directory named after a hash of everything the
+    graph depends on, holding the graph as .npy files: adjGrid.npy for a
+    padded adjacency grid, or dim.npy, indptr.npy and indices.npy for a
+    CSRGraph. Entries are loaded memory-mapped (read-only, with no copy),
+    so the operating system shares them between the workers of a sweep.
+
+    Entries are written to a temporary directory that is then renamed, so
+    concurrent runs never see a partial entry. Loading an entry touches
+    it; once the cache is over its size budget, the least recently used
+    entries are removed. """
+import hashlib
+import os
+import shutil
+import numpy as np
+from csrgraph import CSRGraph
+
+
+# bumped whenever graphs built from the same parameters would change, so
+# stale entries are never used
+VERSION = 1
+
+
+def graphKey(**params):
+    """ Returns the cache key of the graph built with the given parameters
+        (any values with a stable repr, such as numbers, strings and
+        tuples). """
+    text = repr((VERSION, sorted(params.items())))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AdjCache:
+    """ A cache of adjacency grids in the directory root (created if
+        needed), holding at most budget bytes. """
+    def __init__(self, root, budget):
+        self.root = root
+        self.budget = budget
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        """ Returns the adjacency grid (padded or CSRGraph) stored under key,
+            memory-mapped read-only, or None if there is none. """
+        path = self.path(key)
+        try:
+            if os.path.exists(os.path.join(path, "adjGrid.npy")):
+                adjGrid = np.load(os.path.join(path, "adjGrid.npy"),
+                                  mmap_mode="r")
+            else:
+                dim = np.load(os.path.join(path, "dim.npy"))
+                adjGrid = CSRGraph(dim,
+                                   np.load(os.path.join(path, "indptr.npy"),
+                                           mmap_mode="r"),
+                                   np.load(os.path.join(path, "indices.npy"),
+                                           mmap_mode="r"))
+            # most recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # not cached, or evicted by another run as it was being loaded
+            return None
+        return adjGrid
+
+    def store(self, key, adjGrid):
+        """ Stores an adjacency grid under key, then evicts entries until the
+            cache is within its budget. """
+        path = self.path(key)
+        tmp = path + ".tmp" + str(os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+        if isinstance(adjGrid, CSRGraph):
+            np.save(os.path.join(tmp, "dim.npy"), np.asarray(adjGrid.dim))
+            np.save(os.path.join(tmp, "indptr.npy"), adjGrid.indptr)
+            np.save(os.path.join(tmp, "indices.npy"), adjGrid.indices)
+        else:
+            np.save(os.path.join(tmp, "adjGrid.npy"), adjGrid)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # another run stored the same graph first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def get(self, key, build):
+        """ Returns the adjacency grid stored under key, or builds it with
+            build() and stores it. """
+        adjGrid = self.load(key)
+        if adjGrid is None:
+            adjGrid = build()
+            self.store(key, adjGrid)
+        return adjGrid
+
+    def entries(self):
+        """ Returns (last use, size in bytes, key) for every entry. """
+        entries = []
+        for key in os.listdir(self.root):
+            path = self.path(key)
+            if ".tmp" in key or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, key))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries (other than keep) until
+            the cache is within its budget. """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            # a run that has it mapped keeps its pages until it is done
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
@@ -0,0 +1,149 @@
+""" Asynchronous output for the result files of main.py.
+
+    The simulation loop hands finished text to an AsyncWriter instead of
+    opening and writing files itself; a background thread takes the records
+    off a bounded queue and writes them out in batches, grouping the text
+    for each file into a single write. The simulations then only wait on
+    the filesystem when the queue is full (backpressure), which is counted
+    so slow output directories can be reported. """
+import atexit
+import queue
+import threading
+from timeit import default_timer as timer
+
+# record kinds
+WRITE = 0
+CLOSE = 1
+STOP = 2
+KEEP = 3
+
+
+class AsyncWriter:
+    """ Writes text files on a background thread.
+
+        write(path, text) appends text to the file at path (the first write
+        to a path truncates it); closeFile(path) closes it once it is
+        complete; keepFile(path) makes writes append to a file that already
+        exists. sync waits until everything queued is written. At most
+        maxRecords records wait in the queue; write blocks when it is full,
+        and stalls and stallTime count how often and for how long.
+        Everything is flushed by close, which is also called on exit. An
+        error on the writer thread stops it, and is raised by the next
+        call. """
+    def __init__(self, maxRecords=1024, batchSize=256):
+        self.records = queue.Queue(maxRecords)
+        self.batchSize = batchSize
+        self.stalls = 0
+        self.stallTime = 0.0
+        self.error = None
+        self.closed = False
+        # open files, and paths that were written and closed (and so are
+        # appended to, not truncated, if written again)
+        self.files = {}
+        self.done = set()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, record):
+        self.raiseError()
+        if self.closed:
+            raise ValueError("The writer is closed.")
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            # the disk is not keeping up; wait for room
+            start = timer()
+            self.records.put(record)
+            self.stalls += 1
+            self.stallTime += timer() - start
+
+    def raiseError(self):
+        """ Raises the error from the writer thread, if there was one, after
+            stopping it. """
+        if self.error is not None:
+            error, self.error = self.error, None
+            self.stop()
+            raise error
+
+    def write(self, path, text):
+        """ Queues text to be appended to the file at path. """
+        self.put((WRITE, path, text))
+
+    def closeFile(self, path):
+        """ Queues the file at path to be closed, once everything written to
+            it before is out. """
+        self.put((CLOSE, path, None))
+
+    def keepFile(self, path):
+        """ Queues the existing file at path to be appended to, rather than
+            truncated by the first write. """
+        self.put((KEEP, path, None))
+
+    def sync(self):
+        """ Waits until everything queued so far has been written. """
+        self.raiseError()
+        self.records.join()
+        self.raiseError()
+
+    def stop(self):
+        if not self.closed:
+            self.closed = True
+            self.records.put((STOP, None, None))
+            self.thread.join()
+
+    def close(self):
+        """ Writes out everything that was queued, closes every file, and
+            stops the writer thread. """
+        self.stop()
+        self.raiseError()
+
+    def loop(self):
+        """ The writer thread: writes out batches of records until stopped. """
+        stopped = False
+        while not stopped:
+            batch = [self.records.get()]
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            stopped = any(kind == STOP for kind, _, _ in batch)
+            # an error stops the writing, but the queue is still drained,
+            # so the simulations are not blocked
+            if self.error is None:
+                try:
+                    self.writeBatch(batch)
+                except Exception as error:
+                    self.error = error
+            for _ in batch:
+                self.records.task_done()
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+    def writeBatch(self, batch):
+        """ Writes a batch of records, joining consecutive writes to the same
+            file. """
+        pending = {}
+        for kind, path, text in batch:
+            if kind == WRITE:
+                pending.setdefault(path, []).append(text)
+            elif kind == CLOSE:
+                self.flushPath(path, pending.pop(path, []))
+                if path in self.files:
+                    self.files.pop(path).close()
+                self.done.add(path)
+            elif kind == KEEP:
+                self.done.add(path)
+        for path, texts in pending.items():
+            self.flushPath(path, texts)
+        for file in self.files.values():
+            file.flush()
+
+    def flushPath(self, path, texts):
+        if len(texts) == 0:
+            return
+        if path not in self.files:
+            self.files[path] = open(path, "a" if path in self.done else "w")
+        self.files[path].write("".join(texts))
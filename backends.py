@@ -0,0 +1,860 @@
+""" Execution backends for the run loop in cmdline.run_GPU.
+
+    A backend knows how to move a grid (and its adjacency grid) to wherever
+    the computation happens, how to evolve it by one generation there, and how
+    to bring it back to the host. The same loop can then run on the GPU
+    (through numbapro), on every core of a CPU with numba, or with plain
+    NumPy when neither is installed. Other engines (such as the sparse
+    matrix-vector one in spmv.py) plug into the same loop. """
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from gameoflife import cuda, evolve2D_kernel, evolve2DCSR_kernel, \
+    evolve2DMetrics_kernel, evolve2DCSRMetrics_kernel, clear2D_kernel
+from csrgraph import CSRGraph
+import spmv
+import ensemble
+from bitboard import BitGrid, gridTopology
+from hashlife import Hashlife
+from incremental import ActiveGrid, ReverseAdjacency, stepActive
+from partitioned import PartitionedEngine, SharedGrid
+from outofcore import TiledEvolver, tempGrid
+from tiled import TemporalBlocker
+from adaptive import AdaptiveAdjacency, AdaptiveGrid, goSparse, stepSparse
+from cycles import gridHash
+
+try:
+    from numba import config, njit, prange, set_num_threads
+except ImportError:
+    # older numba (or none at all); the multithreaded numba kernel needs
+    # parallel=True support, so fall back to the NumPy backend
+    njit = None
+
+
+def evolve2D_numpy(grid, adjGrid, newGrid, start=0, stop=None,
+                   metrics=False):
+    """ Like evolve2D, but vectorized with NumPy over the rows
+        start:stop of the grid. Assumes grid and adjGrid are configured.
+        Every real cell of those rows of newGrid is written, so it need not
+        be zeroed. If metrics,
+        returns (live, matches, total) for those rows, as evolve2DMetrics
+        does. """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    if stop is None:
+        stop = rows
+    adj = adjGrid[start:stop]
+    # placeholder values of dim look up the dead row/column, i.e. a 0
+    numAlive = grid[adj[..., 0], adj[..., 1]].sum(axis=-1, dtype=np.int32)
+    alive = grid[start:stop, 0:cols] == 1
+    newGrid[start:stop, 0:cols] = (numAlive == 3) | ((numAlive == 2) & alive)
+    if metrics:
+        adjOfLive = adj[alive]
+        numAdj = np.count_nonzero((adjOfLive[..., 0] < rows) &
+                                  (adjOfLive[..., 1] < cols))
+        return (int(np.count_nonzero(alive)), int(numAlive[alive].sum()),
+                int(numAdj))
+
+def evolve2DCSR_numpy(grid, graph, newGrid, start=0, stop=None,
+                      metrics=False):
+    """ Like evolve2D_numpy, but for a CSRGraph. """
+    cols = grid.shape[1] - 1
+    if stop is None:
+        stop = grid.shape[0] - 1
+    live = grid[0:-1, 0:cols].ravel()
+    bounds = graph.indptr[start*cols:stop*cols+1]
+    lo, hi = bounds[0], bounds[-1]
+    # running total of live neighbors, so each cell's count is a difference
+    running = np.zeros(hi - lo + 1, dtype=np.int32)
+    np.cumsum(live[graph.indices[lo:hi]], dtype=np.int32, out=running[1:])
+    numAlive = np.diff(running[bounds - lo]).reshape(stop - start, cols)
+    alive = grid[start:stop, 0:cols] == 1
+    newGrid[start:stop, 0:cols] = (numAlive == 3) | ((numAlive == 2) & alive)
+    if metrics:
+        degrees = np.diff(bounds).reshape(stop - start, cols)
+        return (int(np.count_nonzero(alive)), int(numAlive[alive].sum()),
+                int(degrees[alive].sum()))
+
+
+def evolve2D_parallel(grid, adjGrid, newGrid):
+    """ Like evolve2D, but the rows are split across every CPU core with
+        numba's prange. The GIL is released while this runs. """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    maxLen = adjGrid.shape[2]
+    for i in prange(rows):
+        for j in range(cols):
+            numAlive = 0
+            for k in range(maxLen):
+                numAlive += grid[adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+
+def evolve2DCSR_parallel(grid, indptr, indices, newGrid):
+    """ Like evolve2D_parallel, but for a CSRGraph. """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    for i in prange(rows):
+        for j in range(cols):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+
+def evolve2DMetrics_parallel(grid, adjGrid, newGrid):
+    """ Like evolve2D_parallel, but also returns (live, matches, total), as
+        evolve2DMetrics does. """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    maxLen = adjGrid.shape[2]
+    live = 0
+    matches = 0
+    total = 0
+    for i in prange(rows):
+        for j in range(cols):
+            numAlive = 0
+            numAdj = 0
+            for k in range(maxLen):
+                numAlive += grid[adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+                if adjGrid[i,j,k,0] < rows and adjGrid[i,j,k,1] < cols:
+                    numAdj += 1
+            if grid[i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += numAdj
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    return live, matches, total
+
+def evolve2DCSRMetrics_parallel(grid, indptr, indices, newGrid):
+    """ Like evolve2DCSR_parallel, but also returns (live, matches, total). """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    live = 0
+    matches = 0
+    total = 0
+    for i in prange(rows):
+        for j in range(cols):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+            if grid[i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += indptr[v+1] - indptr[v]
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    return live, matches, total
+
+if njit is not None:
+    evolve2D_parallel = njit(parallel=True, nogil=True,
+                             cache=True)(evolve2D_parallel)
+    evolve2DCSR_parallel = njit(parallel=True, nogil=True,
+                                cache=True)(evolve2DCSR_parallel)
+    evolve2DMetrics_parallel = njit(parallel=True, nogil=True,
+                                    cache=True)(evolve2DMetrics_parallel)
+    evolve2DCSRMetrics_parallel = njit(parallel=True, nogil=True, cache=True)(
+        evolve2DCSRMetrics_parallel)
+
+
+class GridBuffers:
+    """ The two device grids a run loop evolves back and forth between
+        (ping-pong buffering), so a long run allocates two grids rather than
+        one every generation. Each is allocated by the backend the first
+        time it is needed, and cleared in place (see Backend.clearGrid)
+        when it is reused. The grid a run starts from is never written,
+        since it may be the caller's. """
+    def __init__(self, backend):
+        self.backend = backend
+        self.buffers = []
+
+    def next(self, d_grid):
+        """ Returns a grid to evolve d_grid into: whichever buffer d_grid is
+            not. """
+        for d_buffer in self.buffers:
+            if d_buffer is not d_grid:
+                self.backend.clearGrid(d_buffer)
+                return d_buffer
+        d_buffer = self.backend.newGrid(d_grid)
+        self.buffers.append(d_buffer)
+        return d_buffer
+
+
+class Backend:
+    """ Base class for execution backends.
+
+        Arrays returned by toDevice and loadAdjGrid are "device" arrays: they
+        should only be passed back into the same backend. Every backend
+        accepts both padded adjacency grids and CSRGraphs. The default
+        implementations are for backends that work on host NumPy arrays. """
+    name = None
+
+    @classmethod
+    def isAvailable(cls):
+        """ Returns whether this backend can run on the current machine. """
+        return True
+
+    def toDevice(self, grid):
+        """ Moves a grid to the device, returning the device array. """
+        return grid
+
+    def loadAdjGrid(self, adjGrid):
+        """ Moves an adjacency grid to the device. """
+        return adjGrid
+
+    def toHost(self, d_grid):
+        """ Returns the grid on the host as a NumPy array. """
+        return d_grid
+
+    def newGrid(self, d_grid):
+        """ Returns a zeroed device grid with the same shape as d_grid. """
+        return np.zeros_like(d_grid)
+
+    def clearGrid(self, d_grid):
+        """ Readies a device grid from an earlier generation to be evolved
+            into again, in place: zeroes it, by default. Backends whose
+            evolve writes every real cell (and never the dead last row and
+            column) have nothing to do. """
+        d_grid[...] = 0
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        """ Evolves d_grid by one generation, writing into d_newGrid. """
+        raise NotImplementedError
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        """ Like evolve, but also returns (live, matches, total) for d_grid,
+            gathered in the same pass (see simulate.evolve2DMetrics). """
+        raise NotImplementedError
+
+    def stateHash(self, d_grid):
+        """ Returns a hash of the state of d_grid, for cycle detection (see
+            cycles.py). By default the grid is copied to the host. """
+        return gridHash(self.toHost(d_grid))
+
+    def advance(self, d_grid, d_adjGrid, steps, buffers=None):
+        """ Evolves d_grid by steps generations, returning the new device
+            grid, which is one of the GridBuffers buffers (new ones, if not
+            given). Backends that can skip ahead override this. """
+        if buffers is None:
+            buffers = GridBuffers(self)
+        for _ in range(steps):
+            d_newGrid = buffers.next(d_grid)
+            self.evolve(d_grid, d_adjGrid, d_newGrid)
+            d_grid = d_newGrid
+        return d_grid
+
+    # Ensembles (see ensemble.py). By default an ensemble is a list of
+    # device grids, evolved one after another; backends that can evolve a
+    # whole (n, rows + 1, cols + 1) stack at once override these.
+
+    def toDeviceEnsemble(self, grids):
+        """ Moves a stack of grids to the device. """
+        return [self.toDevice(grid) for grid in grids]
+
+    def toHostEnsemble(self, d_grids):
+        """ Returns the ensemble on the host as a stacked NumPy array. """
+        return np.stack([self.toHost(d_grid) for d_grid in d_grids])
+
+    def evolveEnsembleMetrics(self, d_grids, d_adjGrid):
+        """ Evolves every grid of the ensemble by one generation. Returns the
+            new ensemble, and an (n, 3) array of (live, matches, total) for
+            every grid of d_grids. """
+        d_newGrids = [self.newGrid(d_grid) for d_grid in d_grids]
+        counts = [self.evolveMetrics(d_grid, d_adjGrid, d_newGrid)
+                  for d_grid, d_newGrid in zip(d_grids, d_newGrids)]
+        return d_newGrids, np.array(counts, dtype=np.int64)
+
+    def advanceEnsemble(self, d_grids, d_adjGrid, steps):
+        """ Evolves every grid of the ensemble by steps generations,
+            returning the new ensemble. """
+        return [self.advance(d_grid, d_adjGrid, steps) for d_grid in d_grids]
+
+
+class StackedEnsemble:
+    """ Mixin for backends that evolve a whole ensemble as one stacked
+        array, with evolveEnsemble(d_grids, d_adjGrid, d_newGrids, metrics). """
+
+    def evolveEnsembleMetrics(self, d_grids, d_adjGrid):
+        d_newGrids = self.newGrid(d_grids)
+        counts = self.evolveEnsemble(d_grids, d_adjGrid, d_newGrids, True)
+        return d_newGrids, counts
+
+    def advanceEnsemble(self, d_grids, d_adjGrid, steps):
+        buffers = GridBuffers(self)
+        for _ in range(steps):
+            d_newGrids = buffers.next(d_grids)
+            self.evolveEnsemble(d_grids, d_adjGrid, d_newGrids)
+            d_grids = d_newGrids
+        return d_grids
+
+
+class NumpyBackend(StackedEnsemble, Backend):
+    """ Vectorized NumPy evolve. The grid is split into row bands which
+        are evolved on a pool of threads (NumPy releases the GIL while
+        gathering and summing), so all cores are used by default. """
+    name = "numpy"
+
+    def __init__(self, threads=None):
+        self.threads = threads or os.cpu_count() or 1
+        self.pool = None
+        if self.threads > 1:
+            self.pool = ThreadPoolExecutor(self.threads)
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid, metrics=False):
+        rows = d_grid.shape[0] - 1
+        if isinstance(d_adjGrid, CSRGraph):
+            func = evolve2DCSR_numpy
+        else:
+            func = evolve2D_numpy
+        if self.pool is None or rows < 2 * self.threads:
+            return func(d_grid, d_adjGrid, d_newGrid, 0, rows, metrics)
+        bounds = np.linspace(0, rows, self.threads + 1).astype(int)
+        futures = [self.pool.submit(func, d_grid, d_adjGrid, d_newGrid,
+                                    bounds[i], bounds[i+1], metrics)
+                   for i in range(self.threads)]
+        results = [future.result() for future in futures]
+        if metrics:
+            return tuple(int(sum(counts)) for counts in zip(*results))
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        return self.evolve(d_grid, d_adjGrid, d_newGrid, True)
+
+    def clearGrid(self, d_grid):
+        # every real cell is written by evolve
+        pass
+
+    def toDeviceEnsemble(self, grids):
+        return grids
+
+    def toHostEnsemble(self, d_grids):
+        return d_grids
+
+    def evolveEnsemble(self, d_grids, d_adjGrid, d_newGrids, metrics=False):
+        n = d_grids.shape[0]
+        if self.pool is None or n < 2:
+            return ensemble.evolveEnsemble_numpy(d_grids, d_adjGrid,
+                                                 d_newGrids, metrics)
+        # one slice of replicas per thread
+        bounds = np.linspace(0, n, min(self.threads, n) + 1).astype(int)
+        futures = [self.pool.submit(ensemble.evolveEnsemble_numpy,
+                                    d_grids[lo:hi], d_adjGrid,
+                                    d_newGrids[lo:hi], metrics)
+                   for lo, hi in zip(bounds[0:-1], bounds[1:])]
+        results = [future.result() for future in futures]
+        if metrics:
+            return np.concatenate(results)
+
+
+class NumbaBackend(StackedEnsemble, Backend):
+    """ Multithreaded CPU evolve, compiled with numba (prange over rows). """
+    name = "cpu"
+
+    def __init__(self, threads=None):
+        if threads is not None:
+            # numba can't use more threads than it started with (one per
+            # core, by default)
+            set_num_threads(max(1, min(threads, config.NUMBA_NUM_THREADS)))
+
+    @classmethod
+    def isAvailable(cls):
+        return njit is not None
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        if isinstance(d_adjGrid, CSRGraph):
+            evolve2DCSR_parallel(d_grid, d_adjGrid.indptr, d_adjGrid.indices,
+                                 d_newGrid)
+        else:
+            evolve2D_parallel(d_grid, d_adjGrid, d_newGrid)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        if isinstance(d_adjGrid, CSRGraph):
+            counts = evolve2DCSRMetrics_parallel(d_grid, d_adjGrid.indptr,
+                                                 d_adjGrid.indices, d_newGrid)
+        else:
+            counts = evolve2DMetrics_parallel(d_grid, d_adjGrid, d_newGrid)
+        return tuple(int(count) for count in counts)
+
+    def toDeviceEnsemble(self, grids):
+        return grids
+
+    def toHostEnsemble(self, d_grids):
+        return d_grids
+
+    def evolveEnsemble(self, d_grids, d_adjGrid, d_newGrids, metrics=False):
+        # per-row counts, so that no two threads add to the same total
+        rowCounts = np.zeros((d_grids.shape[0], d_grids.shape[1] - 1, 3),
+                             dtype=np.int64)
+        if isinstance(d_adjGrid, CSRGraph):
+            ensemble.evolveEnsembleCSR_parallel(
+                d_grids, d_adjGrid.indptr, d_adjGrid.indices, d_newGrids,
+                rowCounts, metrics)
+        else:
+            ensemble.evolveEnsemble_parallel(d_grids, d_adjGrid, d_newGrids,
+                                             rowCounts, metrics)
+        if metrics:
+            return rowCounts.sum(axis=1)
+
+
+class CudaBackend(StackedEnsemble, Backend):
+    """ Runs evolve2D_kernel on the GPU through numbapro. """
+    name = "gpu"
+    blockDim = (32,16)
+    gridDim = (32,8)
+
+    def __init__(self, threads=None):
+        pass
+
+    @classmethod
+    def isAvailable(cls):
+        if cuda is None:
+            return False
+        try:
+            return cuda.is_available()
+        except Exception:
+            return False
+
+    def toDevice(self, grid):
+        return cuda.to_device(grid)
+
+    def loadAdjGrid(self, adjGrid):
+        if isinstance(adjGrid, CSRGraph):
+            return CSRGraph(adjGrid.dim, cuda.to_device(adjGrid.indptr),
+                            cuda.to_device(adjGrid.indices))
+        return cuda.to_device(adjGrid)
+
+    def toHost(self, d_grid):
+        return d_grid.copy_to_host()
+
+    def newGrid(self, d_grid):
+        return cuda.to_device(np.zeros(d_grid.shape, dtype=d_grid.dtype))
+
+    def clearGrid(self, d_grid):
+        # on the device, rather than copying zeros from the host
+        grids = [d_grid] if len(d_grid.shape) == 2 else \
+            [d_grid[r] for r in range(d_grid.shape[0])]
+        for grid in grids:
+            clear2D_kernel[self.gridDim, self.blockDim](grid)
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        if isinstance(d_adjGrid, CSRGraph):
+            evolve2DCSR_kernel[self.gridDim, self.blockDim](
+                d_grid, d_adjGrid.indptr, d_adjGrid.indices, d_newGrid)
+        else:
+            evolve2D_kernel[self.gridDim, self.blockDim](d_grid, d_adjGrid,
+                                                         d_newGrid)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        d_metrics = cuda.to_device(np.zeros(3, dtype=np.int64))
+        if isinstance(d_adjGrid, CSRGraph):
+            evolve2DCSRMetrics_kernel[self.gridDim, self.blockDim](
+                d_grid, d_adjGrid.indptr, d_adjGrid.indices, d_newGrid,
+                d_metrics)
+        else:
+            evolve2DMetrics_kernel[self.gridDim, self.blockDim](
+                d_grid, d_adjGrid, d_newGrid, d_metrics)
+        return tuple(int(count) for count in d_metrics.copy_to_host())
+
+    def toDeviceEnsemble(self, grids):
+        return cuda.to_device(grids)
+
+    def toHostEnsemble(self, d_grids):
+        return d_grids.copy_to_host()
+
+    def evolveEnsemble(self, d_grids, d_adjGrid, d_newGrids, metrics=False):
+        d_counts = cuda.to_device(np.zeros((d_grids.shape[0], 3),
+                                           dtype=np.int64))
+        if isinstance(d_adjGrid, CSRGraph):
+            ensemble.evolveEnsembleCSR_kernel[self.gridDim, self.blockDim](
+                d_grids, d_adjGrid.indptr, d_adjGrid.indices, d_newGrids,
+                d_counts, metrics)
+        else:
+            ensemble.evolveEnsemble_kernel[self.gridDim, self.blockDim](
+                d_grids, d_adjGrid, d_newGrids, d_counts, metrics)
+        if metrics:
+            return d_counts.copy_to_host()
+
+
+class SpMVBackend(StackedEnsemble, Backend):
+    """ One sparse matrix-vector product per generation (see spmv.py). The
+        adjacency matrix is built when the adjacency grid is loaded. """
+    name = "spmv"
+
+    def __init__(self, threads=None):
+        pass
+
+    @classmethod
+    def isAvailable(cls):
+        return spmv.scipy is not None
+
+    def loadAdjGrid(self, adjGrid):
+        matrix = spmv.adjacencyMatrix(adjGrid)
+        # the degrees are only needed for metrics, but are cheap to keep
+        degrees = np.asarray(matrix.sum(axis=1)).ravel()
+        return matrix, degrees
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        spmv.evolveSpMV(d_grid, d_adjGrid[0], d_newGrid)
+
+    def clearGrid(self, d_grid):
+        # every real cell is written by evolveSpMV
+        pass
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        matrix, degrees = d_adjGrid
+        return spmv.evolveSpMVMetrics(d_grid, matrix, degrees, d_newGrid)
+
+    def toDeviceEnsemble(self, grids):
+        return grids
+
+    def toHostEnsemble(self, d_grids):
+        return d_grids
+
+    def evolveEnsemble(self, d_grids, d_adjGrid, d_newGrids, metrics=False):
+        matrix, degrees = d_adjGrid
+        return spmv.evolveSpMVEnsemble(d_grids, matrix, degrees, d_newGrids,
+                                       metrics)
+
+
+class BitboardBackend(Backend):
+    """ Evolves a bit-packed BitGrid (see bitboard.py). Only works when the
+        adjacency grid is an unmodified 2D torus or standard grid. """
+    name = "bitboard"
+
+    def __init__(self, threads=None):
+        pass
+
+    def toDevice(self, grid):
+        return BitGrid.fromGrid(grid)
+
+    def loadAdjGrid(self, adjGrid):
+        topology = gridTopology(adjGrid)
+        if topology is None:
+            raise ValueError("The bitboard backend only works on unmodified "
+                             "2D torus or standard grids.")
+        # the "device" adjacency is just whether the edges wrap
+        return topology == "torus"
+
+    def toHost(self, d_grid):
+        return d_grid.toGrid()
+
+    def stateHash(self, d_grid):
+        # the packed words are enough; no need to unpack
+        return gridHash(d_grid.words)
+
+    def newGrid(self, d_grid):
+        return d_grid.zerosLike()
+
+    def clearGrid(self, d_grid):
+        # evolve overwrites every word
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_grid.evolve(d_adjGrid, d_newGrid)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        # popcounts of the packed planes; no unpacking needed
+        matches, total = d_grid.clusterCounts(d_adjGrid)
+        d_grid.evolve(d_adjGrid, d_newGrid)
+        return d_grid.countLiveCells(), matches, total
+
+
+class IncrementalBackend(Backend):
+    """ Activity-tracked evolve (see incremental.py): only the cells next to
+        last generation's changes are recomputed. evolve copies d_grid into
+        d_newGrid before stepping it, but when d_newGrid is the grid d_grid
+        was evolved from (as with GridBuffers), only the cells that changed
+        are copied; advance steps one copy in place. Either way, each
+        generation costs time proportional to the number of changes. Works
+        for any topology. """
+    name = "incremental"
+
+    def __init__(self, threads=None):
+        pass
+
+    def toDevice(self, grid):
+        return ActiveGrid.fromGrid(grid)
+
+    def loadAdjGrid(self, adjGrid):
+        return ReverseAdjacency(adjGrid)
+
+    def toHost(self, d_grid):
+        return d_grid.toGrid()
+
+    def stateHash(self, d_grid):
+        return gridHash(d_grid.live)
+
+    def newGrid(self, d_grid):
+        # filled in by evolve
+        return ActiveGrid(d_grid.shape, None)
+
+    def clearGrid(self, d_grid):
+        # evolve assigns the whole state
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_grid.prepare(d_adjGrid)
+        d_newGrid.assign(d_grid)
+        stepActive(d_newGrid, d_adjGrid)
+        d_newGrid.evolvedFrom(d_grid)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        metrics = d_grid.metrics(d_adjGrid)
+        self.evolve(d_grid, d_adjGrid, d_newGrid)
+        return metrics
+
+    def advance(self, d_grid, d_adjGrid, steps, buffers=None):
+        if steps == 0:
+            return d_grid
+        state = d_grid.copy()
+        for _ in range(steps):
+            stepActive(state, d_adjGrid)
+        return state
+
+
+class HashlifeBackend(Backend):
+    """ Memoized quadtree evolution (see hashlife.py), which jumps ahead by
+        powers of 2 generations when run_GPU has nothing to show in between.
+        Only works when the adjacency grid is an unmodified 2D torus or
+        standard grid. The node store is kept between runs. """
+    name = "hashlife"
+
+    def __init__(self, threads=None):
+        self.hashlife = Hashlife()
+
+    def loadAdjGrid(self, adjGrid):
+        topology = gridTopology(adjGrid)
+        if topology is None:
+            raise ValueError("The hashlife backend only works on unmodified "
+                             "2D torus or standard grids.")
+        return topology == "torus"
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_newGrid[...] = self.hashlife.advance(d_grid, d_adjGrid, 1)
+
+    def clearGrid(self, d_grid):
+        # evolve overwrites the whole grid
+        pass
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        bitGrid = BitGrid.fromGrid(d_grid)
+        matches, total = bitGrid.clusterCounts(d_adjGrid)
+        self.evolve(d_grid, d_adjGrid, d_newGrid)
+        return bitGrid.countLiveCells(), matches, total
+
+    def advance(self, d_grid, d_adjGrid, steps, buffers=None):
+        return self.hashlife.advance(d_grid, d_adjGrid, steps)
+
+
+class PartitionedBackend(Backend):
+    """ Splits one simulation into bands of rows, each evolved by its own
+        process on grids in shared memory (see partitioned.py), so a single
+        huge grid uses every core. threads is the number of bands (by
+        default one per core). The bands are only planned again when the
+        adjacency grid changes. Works for any topology. """
+    name = "partitioned"
+
+    def __init__(self, threads=None):
+        self.engine = PartitionedEngine(threads or os.cpu_count() or 1)
+
+    def toDevice(self, grid):
+        return SharedGrid.fromGrid(grid)
+
+    def loadAdjGrid(self, adjGrid):
+        if isinstance(adjGrid, CSRGraph):
+            key = gridHash(adjGrid.indptr) + gridHash(adjGrid.indices)
+        else:
+            key = gridHash(adjGrid)
+        self.engine.load(adjGrid, key)
+        return self.engine
+
+    def toHost(self, d_grid):
+        return d_grid.toGrid()
+
+    def newGrid(self, d_grid):
+        return SharedGrid(d_grid.shape)
+
+    def clearGrid(self, d_grid):
+        # every band writes all of its real cells
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_adjGrid.run(d_grid, d_newGrid, None, 1)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        return d_adjGrid.run(d_grid, d_newGrid, None, 1, True)[1]
+
+    def advance(self, d_grid, d_adjGrid, steps, buffers=None):
+        # the workers run every generation in one go, between two grids
+        if steps == 0:
+            return d_grid
+        if buffers is None:
+            buffers = GridBuffers(self)
+        d_newGrid = buffers.next(d_grid)
+        d_spare = buffers.next(d_newGrid) if steps > 1 else None
+        return d_adjGrid.run(d_grid, d_newGrid, d_spare, steps)[0]
+
+
+class OutOfCoreBackend(Backend):
+    """ Tiled evolve for grids and adjacency bigger than memory (see
+        outofcore.py): grids are used where they are (in memory-mapped
+        files, typically) rather than copied, new grids are temporary
+        memory-mapped files next to them, and each generation streams
+        through the grid a tile of rows at a time. Padded adjacency grids
+        are converted to CSR in memory first. main.py builds its grids and
+        adjacency in memory, so there only the evolve loop changes; grids
+        bigger than memory come from outofcore.randomGrid and torusGraph. """
+    name = "outofcore"
+
+    def __init__(self, threads=None):
+        pass
+
+    def loadAdjGrid(self, adjGrid):
+        if not isinstance(adjGrid, CSRGraph):
+            adjGrid = CSRGraph.fromAdjGrid(adjGrid)
+        return TiledEvolver(adjGrid)
+
+    def newGrid(self, d_grid):
+        if isinstance(d_grid, np.memmap):
+            # on the same disk as the grid
+            return tempGrid(d_grid.shape,
+                            os.path.dirname(os.path.abspath(d_grid.filename)))
+        return np.zeros_like(d_grid)
+
+    def clearGrid(self, d_grid):
+        # every real cell is written by each tile
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_adjGrid.evolve(d_grid, d_newGrid)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        return d_adjGrid.evolve(d_grid, d_newGrid, True)
+
+
+class TiledBackend(Backend):
+    """ Temporal blocking (see tiled.py): the grid is advanced several
+        generations per pass over cache-sized tiles, with no adjacency grid
+        to stream. Only works when the adjacency grid is an unmodified 2D
+        torus or standard grid. """
+    name = "tiled"
+
+    def __init__(self, threads=None):
+        pass
+
+    def loadAdjGrid(self, adjGrid):
+        topology = gridTopology(adjGrid)
+        if topology is None:
+            raise ValueError("The tiled backend only works on unmodified 2D "
+                             "torus or standard grids.")
+        return TemporalBlocker(topology == "torus")
+
+    def clearGrid(self, d_grid):
+        # every real cell is written by each pass
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid):
+        d_adjGrid.advance(d_grid, d_newGrid, 1)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        metrics = d_adjGrid.metrics(d_grid)
+        d_adjGrid.advance(d_grid, d_newGrid, 1)
+        return metrics
+
+    def advance(self, d_grid, d_adjGrid, steps, buffers=None):
+        if buffers is None:
+            buffers = GridBuffers(self)
+        while steps > 0:
+            passSteps = min(steps, d_adjGrid.depth)
+            d_newGrid = buffers.next(d_grid)
+            d_adjGrid.advance(d_grid, d_newGrid, passSteps)
+            d_grid = d_newGrid
+            steps -= passSteps
+        return d_grid
+
+
+class AdaptiveBackend(Backend):
+    """ Switches every grid between the dense NumPy evolve and a sparse set
+        of live cells as its population falls and rises (see adaptive.py),
+        so mostly dead grids cost time proportional to their population.
+        Works for any 2D topology. """
+    name = "adaptive"
+
+    def __init__(self, threads=None):
+        self.dense = NumpyBackend(threads)
+
+    def toDevice(self, grid):
+        return AdaptiveGrid(grid.shape, dense=grid)
+
+    def loadAdjGrid(self, adjGrid):
+        return AdaptiveAdjacency(adjGrid)
+
+    def toHost(self, d_grid):
+        return d_grid.toGrid()
+
+    def stateHash(self, d_grid):
+        # the same for either representation
+        return gridHash(d_grid.liveCells().astype(np.int64))
+
+    def newGrid(self, d_grid):
+        # allocated by evolve, in whichever representation it picks
+        return AdaptiveGrid(d_grid.shape)
+
+    def clearGrid(self, d_grid):
+        # evolve writes every real cell, or the whole set of live cells
+        pass
+
+    def evolve(self, d_grid, d_adjGrid, d_newGrid, metrics=False):
+        sparse = goSparse(d_grid)
+        if d_grid.sparse or sparse:
+            result = stepSparse(d_grid.liveCells(), d_adjGrid.reverse,
+                                metrics)
+            live, counts = result if metrics else (result, None)
+            d_newGrid.setLive(live, sparse)
+            return counts
+        return self.dense.evolve(d_grid.dense, d_adjGrid.adjGrid,
+                                 d_newGrid.denseBuffer(), metrics)
+
+    def evolveMetrics(self, d_grid, d_adjGrid, d_newGrid):
+        return self.evolve(d_grid, d_adjGrid, d_newGrid, True)
+
+
+# all backends, in order of preference when auto-detecting (NumPy is always
+# available, so backends after it are only used when asked for by name)
+BACKENDS = [CudaBackend, NumbaBackend, NumpyBackend, SpMVBackend,
+            BitboardBackend, HashlifeBackend, IncrementalBackend,
+            PartitionedBackend, OutOfCoreBackend, TiledBackend,
+            AdaptiveBackend]
+
+# backends that have already been created, keyed by (name, threads)
+_instances = {}
+
+def backendNames():
+    """ Returns the names that can be passed to getBackend. """
+    return ["auto"] + [backend.name for backend in BACKENDS]
+
+def getBackend(backend="auto", threads=None):
+    """ Returns a backend instance.
+
+        backend may be a Backend instance (returned unchanged), the name of
+        a backend, or "auto" to pick the first backend that is available on
+        this machine. threads limits the number of CPU threads used; by
+        default every core is used. """
+    if isinstance(backend, Backend):
+        return backend
+    if backend is None or backend == "auto":
+        cls = next(cls for cls in BACKENDS if cls.isAvailable())
+    else:
+        matches = [cls for cls in BACKENDS if cls.name == backend]
+        if len(matches) == 0:
+            raise ValueError("Unknown backend: " + str(backend))
+        cls = matches[0]
+        if not cls.isAvailable():
+            raise ValueError("Backend " + backend + " is not available on "
+                             "this machine.")
+    key = (cls.name, threads)
+    if key not in _instances:
+        _instances[key] = cls(threads)
+    return _instances[key]
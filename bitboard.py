@@ -0,0 +1,194 @@
+""" Bit-packed grids for plain torus and standard (bounded) 2D topologies.
+
+    A BitGrid stores 64 cells per uint64 word, one row of words per grid row;
+    bit b of word w in a row is the cell in column 64*w + b. Bits past the
+    last column are always 0. A generation is computed with bitwise
+    operations on whole words: the 8 neighbor planes are shifted copies of
+    the grid, and are summed with a tree of full adders (SWAR). """
+import numpy as np
+from gameoflife import bulkAdjGrid, torusAdjFunc, stdAdjFunc
+from csrgraph import CSRGraph, rememberTopology
+
+ONE = np.uint64(1)
+TOP = np.uint64(63)
+
+# number of set bits in every byte
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def fullAdd(a, b, c):
+    """ Adds three bit planes, returning the (sum, carry) planes. """
+    ab = a ^ b
+    return ab ^ c, (a & b) | (ab & c)
+
+def halfAdd(a, b):
+    """ Adds two bit planes, returning the (sum, carry) planes. """
+    return a ^ b, a & b
+
+def popcount(words):
+    """ Returns the total number of set bits in an array of words. """
+    return int(POPCOUNT8[np.ascontiguousarray(words).view(np.uint8)].sum(
+        dtype=np.int64))
+
+
+class BitGrid:
+    """ A 2D grid of cells packed 64 to a uint64 word (see the module
+        docstring). cols is the number of real columns. """
+    def __init__(self, words, cols):
+        self.words = words
+        self.cols = cols
+        # valid bits of the last word in each row
+        self.lastMask = ~np.uint64(0)
+        if cols % 64 != 0:
+            self.lastMask = (ONE << np.uint64(cols % 64)) - ONE
+
+    @classmethod
+    def fromGrid(cls, grid):
+        """ Packs an int8 grid (with its dead last row and column). """
+        rows = grid.shape[0] - 1
+        cols = grid.shape[1] - 1
+        numWords = (cols + 63) // 64
+        bits = np.zeros((rows, numWords * 64), dtype=np.uint8)
+        bits[:, 0:cols] = grid[0:rows, 0:cols] == 1
+        packed = np.packbits(bits, axis=1, bitorder="little")
+        words = packed.view("<u8").astype(np.uint64)
+        return cls(words.reshape(rows, numWords), cols)
+
+    def toGrid(self):
+        """ Unpacks into an int8 grid, with the dead last row and column. """
+        rows = self.words.shape[0]
+        grid = np.zeros((rows + 1, self.cols + 1), dtype=np.int8)
+        packed = self.words.astype("<u8").view(np.uint8)
+        bits = np.unpackbits(packed, axis=1, bitorder="little")
+        grid[0:rows, 0:self.cols] = bits[:, 0:self.cols]
+        return grid
+
+    def zerosLike(self):
+        return BitGrid(np.zeros_like(self.words), self.cols)
+
+    def shiftWest(self, words, torus):
+        """ Returns the plane whose cell (i, j) is words' cell (i, j-1), i.e.
+            every cell's western neighbor. """
+        shifted = words << ONE
+        shifted[:, 1:] |= words[:, 0:-1] >> TOP
+        if torus:
+            last = np.uint64((self.cols - 1) % 64)
+            shifted[:, 0] |= (words[:, -1] >> last) & ONE
+        shifted[:, -1] &= self.lastMask
+        return shifted
+
+    def shiftEast(self, words, torus):
+        """ Returns the plane of every cell's eastern neighbor. """
+        shifted = words >> ONE
+        shifted[:, 0:-1] |= words[:, 1:] << TOP
+        if torus:
+            last = np.uint64((self.cols - 1) % 64)
+            shifted[:, -1] |= (words[:, 0] & ONE) << last
+        return shifted
+
+    @staticmethod
+    def shiftNorth(words, torus):
+        """ Returns the plane of every cell's northern neighbor (row i-1). """
+        if torus:
+            return np.roll(words, 1, axis=0)
+        shifted = np.zeros_like(words)
+        shifted[1:] = words[0:-1]
+        return shifted
+
+    @staticmethod
+    def shiftSouth(words, torus):
+        """ Returns the plane of every cell's southern neighbor (row i+1). """
+        if torus:
+            return np.roll(words, -1, axis=0)
+        shifted = np.zeros_like(words)
+        shifted[0:-1] = words[1:]
+        return shifted
+
+    def neighborPlanes(self, words, torus):
+        """ Returns the 8 planes of every cell's neighbors. """
+        west = self.shiftWest(words, torus)
+        east = self.shiftEast(words, torus)
+        planes = [west, east]
+        for row in (west, words, east):
+            planes.append(self.shiftNorth(row, torus))
+            planes.append(self.shiftSouth(row, torus))
+        return planes
+
+    def evolve(self, torus, out=None):
+        """ Returns the next generation (written into the BitGrid out, if
+            given). torus selects wrapping edges; otherwise cells outside the
+            grid are dead, as with stdAdjFunc. """
+        n = self.neighborPlanes(self.words, torus)
+        # count the 8 neighbors: ones, twos and fours bits of the count
+        s0, c0 = fullAdd(n[0], n[1], n[2])
+        s1, c1 = fullAdd(n[3], n[4], n[5])
+        s2, c2 = halfAdd(n[6], n[7])
+        ones, c3 = fullAdd(s0, s1, s2)
+        t0, c4 = fullAdd(c0, c1, c2)
+        twos, c5 = halfAdd(t0, c3)
+        # 4 or more neighbors
+        many = c4 | c5
+        # 3 neighbors, or 2 neighbors and alive
+        newWords = twos & ~many & (ones | self.words)
+        if out is None:
+            return BitGrid(newWords, self.cols)
+        out.words[...] = newWords
+        return out
+
+    def countLiveCells(self):
+        """ Returns the number of live cells. """
+        return popcount(self.words)
+
+    def cluster(self, torus):
+        """ Like gridtools.cluster: the probability that a neighbor of a
+            live cell is live. """
+        if self.countLiveCells() == 0:
+            return 0
+        matches, total = self.clusterCounts(torus)
+        return matches/total
+
+    def clusterCounts(self, torus):
+        """ Like gridtools.clusterCounts: returns the number of live
+            neighbors of live cells, and the number of all their neighbors. """
+        ones = np.zeros_like(self.words)
+        ones[...] = ~np.uint64(0)
+        ones[:, -1] = self.lastMask
+        matches = 0
+        total = 0
+        for plane, inGrid in zip(self.neighborPlanes(self.words, torus),
+                                 self.neighborPlanes(ones, torus)):
+            matches += popcount(self.words & plane)
+            total += popcount(self.words & inGrid)
+        return matches, total
+
+
+def gridTopology(adjGrid):
+    """ Returns "torus" or "std" if adjGrid (a padded adjacency grid or a
+        CSRGraph) is an unmodified 2D torus or standard grid, and None
+        otherwise. The answer is remembered for the adjacency grid's arrays,
+        as run_GPU asks again for every run on the same one; rewire.py
+        forgets it when it rewires a padded grid in place (see
+        csrgraph.forgetTopology). """
+    if isinstance(adjGrid, CSRGraph):
+        dim = adjGrid.dim
+    else:
+        dim = np.array(adjGrid.shape[0:-2])
+    if len(dim) != 2:
+        return None
+    return rememberTopology(adjGrid,
+                            lambda adjGrid: classifyTopology(adjGrid, dim))
+
+def classifyTopology(adjGrid, dim):
+    """ gridTopology for a 2D adjacency grid of dimension dim, by comparing
+        it with the torus and standard grids built from scratch. """
+    for name, adjFunc in (("torus", torusAdjFunc), ("std", stdAdjFunc)):
+        expected = bulkAdjGrid(adjFunc, dim, 1)
+        if isinstance(adjGrid, CSRGraph):
+            expected = CSRGraph.fromAdjGrid(expected)
+            if (np.array_equal(expected.indptr, adjGrid.indptr) and
+                    np.array_equal(expected.indices, adjGrid.indices)):
+                return name
+        elif (np.array_equal(adjGrid[:, :, 0:8], expected) and
+                (adjGrid[:, :, 8:] == dim).all()):
+            return name
+    return None
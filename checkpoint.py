@@ -0,0 +1,105 @@
+""" Checkpoints, so an interrupted sweep of main.py can be resumed.
+
+    A checkpoint is a pickled dict holding everything needed to carry on:
+    the arguments of the run, how far the sweep got (the swc and simulation
+    it is on, and the results of the simulations of that swc so far), the
+    rewired adjacency grid, the grid of a simulation that was in flight and
+    the generation it had reached, and the state of both random number
+    generators. It is written atomically (to a temporary file that then
+    replaces the old checkpoint), after the outputs written so far have
+    been flushed, so the result files never run ahead of or behind it.
+
+    A long simulation is run in chunks of generations (see runChunked), so
+    it can be checkpointed part of the way through. """
+import os
+import pickle
+import random
+import numpy as np
+from timeit import default_timer as timer
+from cmdline import run_GPU
+
+# name of the checkpoint file, in the output folder of a run
+FILENAME = "checkpoint.pkl"
+
+# generations run between chances to checkpoint a simulation in flight
+CHUNK = 1000
+
+
+def saveCheckpoint(path, state):
+    """ Writes the dict state, with the state of the random number
+        generators, to path, replacing any checkpoint that is there. """
+    state = dict(state, npRandom=np.random.get_state(),
+                 pyRandom=random.getstate())
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def loadCheckpoint(path):
+    """ Returns the dict saved by saveCheckpoint. """
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def restoreRandom(state):
+    """ Puts the random number generators back in the state they were in
+        when state was saved. """
+    np.random.set_state(state["npRandom"])
+    random.setstate(state["pyRandom"])
+
+
+class Checkpointer:
+    """ Saves checkpoints to path at most every interval seconds (never, if
+        interval is 0). sync is called first, to flush the outputs. """
+    def __init__(self, path, interval, sync=None):
+        self.path = path
+        self.interval = interval
+        self.sync = sync
+        self.last = timer()
+
+    def due(self):
+        return self.interval > 0 and timer() - self.last >= self.interval
+
+    def save(self, makeState):
+        """ Saves the checkpoint returned by makeState(), which is called
+            after the outputs are flushed. """
+        if self.sync is not None:
+            self.sync()
+        saveCheckpoint(self.path, makeState())
+        self.last = timer()
+
+    def maybeSave(self, makeState):
+        """ Saves a checkpoint, as save does, if one is due. """
+        if self.due():
+            self.save(makeState)
+
+    def finish(self):
+        """ Removes the checkpoint, once the run is complete. """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def runChunked(grid, adjGrid, steps, backend, metricsInd=-1, metrics=None,
+               step=0, onChunk=None, chunk=CHUNK):
+    """ Runs grid from generation step to generation steps, as run_GPU does
+        with nothing shown, but in chunks of about chunk generations.
+        Between chunks, onChunk(step, grid) is called, so the caller can
+        save a checkpoint; a resumed run passes the grid and step it got.
+        Every metricsInd steps, (step, live, matches, total) is appended to
+        metrics, at the same steps as in a single run. Returns the final
+        grid. """
+    if metricsInd != -1:
+        # chunks start on sampled steps, so the samples line up
+        chunk = -(-chunk // metricsInd) * metricsInd
+    while step < steps:
+        length = min(chunk, steps - step)
+        chunkMetrics = []
+        grid = run_GPU(grid, adjGrid, length, 0, 0, -1, -1, backend,
+                       metricsInd, chunkMetrics)
+        for sample in chunkMetrics:
+            metrics.append((step + sample[0],) + tuple(sample[1:]))
+        step += length
+        if onChunk is not None and step < steps:
+            onChunk(step, grid)
+    return grid
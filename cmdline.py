@@ -1,52 +1,122 @@
 import os
 import sys
 import numpy as np
-from gameoflife import evolve2D, evolve2D_kernel
+from gameoflife import evolve2D
+from backends import GridBuffers, getBackend
+from cycles import CycleDetector, advanceUntilCycle, gridHash
 from time import sleep
-from numba import *
-from numbapro import cuda
 
-def run_GPU(grid, adjGrid, steps, delay, initDelay, printInd, indSteps):
+def run_GPU(grid, adjGrid, steps, delay, initDelay, printInd, indSteps,
+            backend="auto", metricsInd=-1, metrics=None, cycleWindow=0,
+            cycleInfo=None):
     """ Runs the Command-Line interface for a specified number of steps,
         or forever if the number of steps is specified to be -1.
         Note that here, grid and adjGrid must be explicitly specified as
         opposed to passed in as a Game, to enable everything to be run on the
-        GPU. Returns the final grid state. """
+        GPU. backend is a Backend or a backend name (see backends.py); by
+        default the GPU is used if there is one, and every CPU core
+        otherwise. Every metricsInd steps, (step, live, matches, total) for
+        the grid at that step is appended to the list metrics; these come out
+        of the evolve pass itself (see gridtools.clusterFromMetrics). If
+        cycleWindow is positive and nothing is shown along the way, the run
+        stops as soon as it cycles with a period of at most cycleWindow
+        steps, and the final state is worked out from the cycle; the
+        transient and period are then stored in the dict cycleInfo (see
+        cycles.py). Returns the final grid state. """
     step = 0
     dim = grid.shape
-    # move arrays to GPU
-    d_grid = cuda.to_device(grid)
-    d_adjGrid = cuda.to_device(adjGrid)
-    blockDim = (32,16)
-    gridDim = (32,8)
+    backend = getBackend(backend)
+    # move arrays to the device
+    d_grid = backend.toDevice(grid)
+    d_adjGrid = backend.loadAdjGrid(adjGrid)
+    # every generation is evolved into one of two device grids, allocated
+    # once; the grid only comes back to the host when it is shown or done
+    buffers = GridBuffers(backend)
+    if steps != -1 and printInd == -1 and indSteps == -1 and delay == 0 and \
+            initDelay == 0:
+        if cycleWindow > 0:
+            d_grid = advanceUntilCycle(backend, d_grid, d_adjGrid, steps,
+                                       cycleWindow, metricsInd, metrics,
+                                       cycleInfo, buffers)
+            return backend.toHost(d_grid)
+        # nothing to show along the way; some backends can skip ahead
+        while step < steps:
+            if metricsInd == -1:
+                skip = steps - step
+            else:
+                d_newGrid = buffers.next(d_grid)
+                metrics.append((step,) + backend.evolveMetrics(
+                    d_grid, d_adjGrid, d_newGrid))
+                d_grid = d_newGrid
+                step += 1
+                skip = min(metricsInd - 1, steps - step)
+            d_grid = backend.advance(d_grid, d_adjGrid, skip, buffers)
+            step += skip
+        return backend.toHost(d_grid)
     while step < steps or steps == -1:
         # print grid
         if printInd is not -1 and step % printInd is 0:
             # in order to print grid, first need memory back in CPU
-            d_grid.to_host()
+            grid = backend.toHost(d_grid)
             printGrid(grid, step, dim)
         # print index
         if indSteps is not -1 and step % indSteps is 0:
             print("Step = " + str(step))
-        newGrid = np.zeros_like(grid)
-        d_newGrid = cuda.to_device(newGrid)
-        evolve2D_kernel[gridDim, blockDim](d_grid, d_adjGrid, d_newGrid)
+        d_newGrid = buffers.next(d_grid)
+        if metricsInd != -1 and step % metricsInd == 0:
+            metrics.append((step,) + backend.evolveMetrics(d_grid, d_adjGrid,
+                                                           d_newGrid))
+        else:
+            backend.evolve(d_grid, d_adjGrid, d_newGrid)
         d_grid = d_newGrid
-        grid = newGrid
         sleep(delay)
         if step == 0:
             # allow initial position to be more easily visible
             sleep(initDelay)
         step += 1
-    d_grid.to_host()
-    return grid
+    return backend.toHost(d_grid)
+
+def run_ensemble(grids, adjGrid, steps, backend="auto", metricsInd=-1,
+                 metrics=None):
+    """ Runs a stack of independent grids (see ensemble.py) together through
+        the same adjacency grid for a specified number of steps. Nothing is
+        shown along the way. Every metricsInd steps, (step, counts) is
+        appended to the list metrics, where counts is an array of (live,
+        matches, total) for every grid. Returns the final stack of grids. """
+    step = 0
+    backend = getBackend(backend)
+    d_grids = backend.toDeviceEnsemble(grids)
+    d_adjGrid = backend.loadAdjGrid(adjGrid)
+    while step < steps:
+        if metricsInd == -1:
+            skip = steps - step
+        else:
+            d_grids, counts = backend.evolveEnsembleMetrics(d_grids, d_adjGrid)
+            metrics.append((step, counts))
+            step += 1
+            skip = min(metricsInd - 1, steps - step)
+        d_grids = backend.advanceEnsemble(d_grids, d_adjGrid, skip)
+        step += skip
+    return backend.toHostEnsemble(d_grids)
 
-    
-def run(game, steps, delay, initDelay, printInd, indSteps):
+
+def run(game, steps, delay, initDelay, printInd, indSteps, cycleWindow=0):
     """ Runs the Command-Line interface for a specified number of steps,
-        or forever if the number of steps is specified to be -1."""
+        or forever if the number of steps is specified to be -1.
+        If cycleWindow is positive, stops once the grid cycles with a period
+        of at most cycleWindow steps, after stepping to the state it would
+        have at the end of the run, and returns (transient, period). """
     step = 0
+    detector = CycleDetector(cycleWindow)
     while step < steps or steps == -1:
+        if cycleWindow > 0:
+            earlier = detector.check(step, gridHash(game.grid))
+            if earlier is not None:
+                period = step - earlier
+                if steps != -1:
+                    for _ in range((steps - step) % period):
+                        game.evolve2D_self()
+                return earlier, period
         # print grid
         if printInd is not -1 and step % printInd is 0:
             printGrid(game.grid, step, game.dim)
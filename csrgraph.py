@@ -0,0 +1,257 @@
+""" Compressed sparse row (CSR) adjacency, as an alternative to the padded
+    adjacency grid built by initAdjGrid.
+
+    Cells are numbered by their flat (row-major) index in the real grid, i.e.
+    not counting the dead last row and column. The neighbors of cell v are
+    indices[indptr[v]:indptr[v+1]], so memory scales with the number of edges
+    and there are no placeholder slots to skip. """
+import weakref
+import numpy as np
+
+# topologies remembered by rememberTopology, as (weak references to the
+# arrays of an adjacency grid, topology), most recently used last
+MAX_TOPOLOGIES = 16
+_topologies = []
+
+
+class CSRGraph:
+    """ Adjacency of a grid with dimension dim, in CSR form.
+
+        indptr has one more entry than there are cells (int64 offsets into
+        indices); indices holds the flat index of every neighbor, as int32
+        unless there are too many cells for it (see indexDtype). Every edge
+        of an undirected graph is stored once in each direction. """
+    def __init__(self, dim, indptr, indices):
+        self.dim = np.array(dim)
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def fromAdjGrid(cls, adjGrid):
+        """ Converts a padded adjacency grid (see initAdjGrid) to CSR, dropping
+            the placeholder slots. Neighbors keep their slot order. """
+        ldim = len(adjGrid.shape) - 2
+        dim = np.array(adjGrid.shape[0:ldim])
+        numVertices = int(np.prod(dim))
+        flat = adjGrid.reshape(numVertices, adjGrid.shape[ldim], ldim)
+        valid = (flat != dim).any(axis=-1)
+        coords = flat[valid]
+        indices = np.ravel_multi_index(tuple(coords.T), tuple(dim))
+        indptr = np.zeros(numVertices + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=indptr[1:])
+        return cls(dim, indptr, indices.astype(indexDtype(numVertices)))
+
+    @classmethod
+    def fromEdges(cls, dim, src, dst):
+        """ Builds a graph from directed edges src[i] -> dst[i] (flat indices).
+            Edges from the same cell keep their relative order. """
+        graph = cls(dim, None, None)
+        graph.setEdges(src, dst)
+        return graph
+
+    @property
+    def numVertices(self):
+        return len(self.indptr) - 1
+
+    @property
+    def numEdges(self):
+        """ Number of directed edges, i.e. twice the number of undirected
+            edges. """
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def degrees(self):
+        """ Returns the number of neighbors of every cell, in flat order. """
+        return np.diff(self.indptr)
+
+    def neighbors(self, v):
+        """ Returns the flat indices of the neighbors of cell v. """
+        return self.indices[self.indptr[v]:self.indptr[v+1]]
+
+    def edges(self):
+        """ Returns every directed edge as two arrays (src, dst). """
+        src = np.repeat(np.arange(self.numVertices,
+                                  dtype=indexDtype(self.numVertices)),
+                        self.degrees())
+        return src, self.indices
+
+    def setEdges(self, src, dst):
+        """ Replaces every edge with the directed edges src[i] -> dst[i]. """
+        numVertices = int(np.prod(self.dim))
+        order = stableArgsort(np.asarray(src))
+        self.indices = np.asarray(dst)[order].astype(indexDtype(numVertices))
+        self.indptr = np.zeros(numVertices + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=numVertices),
+                  out=self.indptr[1:])
+
+    def setUndirectedEdges(self, u, v):
+        """ Replaces every edge with the undirected edges u[i] <-> v[i]. """
+        self.setEdges(np.concatenate((u, v)), np.concatenate((v, u)))
+
+    def undirectedEdges(self):
+        """ Returns every undirected edge once, as (u, v) with u < v. """
+        src, dst = self.edges()
+        once = src < dst
+        return src[once], dst[once]
+
+    def toAdjGrid(self, numSlots=None):
+        """ Converts back to a padded adjacency grid with numSlots slots per
+            cell (by default, the largest degree). Unused slots hold dim. """
+        degrees = self.degrees()
+        if numSlots is None:
+            numSlots = int(degrees.max()) if len(degrees) > 0 else 0
+        if len(degrees) > 0 and degrees.max() > numSlots:
+            raise ValueError("A cell has " + str(degrees.max()) + " neighbors,"
+                             " but there are only " + str(numSlots) +
+                             " slots.")
+        ldim = len(self.dim)
+        adjGrid = np.empty((self.numVertices, numSlots, ldim), dtype=np.int32)
+        adjGrid[...] = self.dim
+        src, dst = self.edges()
+        slot = np.arange(len(dst)) - self.indptr[src]
+        adjGrid[src, slot] = np.array(np.unravel_index(dst, tuple(self.dim))).T
+        return adjGrid.reshape(tuple(self.dim) + (numSlots, ldim))
+
+    def copy(self):
+        return CSRGraph(self.dim, self.indptr.copy(), self.indices.copy())
+
+
+def indexDtype(numVertices):
+    """ Returns the dtype for flat indices of numVertices cells: int32, as
+        long as they fit (past 2^31 cells, int64). """
+    return np.int32 if numVertices < 2**31 else np.int64
+
+def adjacencyArrays(adjGrid):
+    """ Returns the arrays holding adjGrid (a padded adjacency grid or a
+        CSRGraph). """
+    if isinstance(adjGrid, CSRGraph):
+        return (adjGrid.indptr, adjGrid.indices)
+    return (adjGrid,)
+
+def rememberTopology(adjGrid, classify):
+    """ Returns the topology remembered for the very arrays of adjGrid, or
+        else classify(adjGrid), which is remembered for them. Nothing is
+        hashed, so adjGrid must be passed to forgetTopology if it is changed
+        in place. """
+    arrays = adjacencyArrays(adjGrid)
+    for i, (refs, topology) in enumerate(_topologies):
+        if len(refs) == len(arrays) and \
+           all(ref() is array for ref, array in zip(refs, arrays)):
+            _topologies.append(_topologies.pop(i))
+            return topology
+    topology = classify(adjGrid)
+    _topologies.append((tuple(weakref.ref(array) for array in arrays),
+                        topology))
+    if len(_topologies) > MAX_TOPOLOGIES:
+        _topologies.pop(0)
+    return topology
+
+def forgetTopology(adjGrid):
+    """ Forgets the topologies remembered for any array that shares memory
+        with adjGrid, which is about to be changed in place. """
+    arrays = adjacencyArrays(adjGrid)
+
+    def overlaps(refs):
+        return any(ref() is not None and np.may_share_memory(ref(), array)
+                   for ref in refs for array in arrays)
+    _topologies[:] = [(refs, topology) for refs, topology in _topologies
+                      if not overlaps(refs)]
+
+def randOtherVertex(numVertices, v):
+    """ Returns uniformly random vertices, with the i'th one never equal to
+        v[i]. """
+    other = np.random.randint(0, numVertices - 1, size=len(v))
+    other[other >= v] += 1
+    return other
+
+def edgeKeys(u, v, numVertices):
+    """ Returns a single integer for each undirected edge u[i] <-> v[i]. """
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    return np.minimum(u, v) * numVertices + np.maximum(u, v)
+
+def stableArgsort(values):
+    """ Like np.argsort(values, kind="stable") for non-negative integers,
+        but faster: each value is packed with its position into one int64
+        key, and the keys are sorted with NumPy's (vectorized) sort. """
+    n = len(values)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    bits = max(n - 1, 1).bit_length()
+    if int(values.max()).bit_length() + bits > 62:
+        return np.argsort(values, kind="stable")
+    keys = (values.astype(np.int64) << bits) | np.arange(n, dtype=np.int64)
+    keys.sort()
+    return keys & ((1 << bits) - 1)
+
+def inSortedSet(keys, sortedKeys):
+    """ Returns whether each of keys is in the sorted array sortedKeys. """
+    if len(sortedKeys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(sortedKeys, keys)
+    return sortedKeys[np.minimum(pos, len(sortedKeys) - 1)] == keys
+
+def randNewEdges(hubs, numVertices, numNew, existing):
+    """ Draws numNew distinct random edges (u, v), each from a random hub to
+        any other vertex, none of which is in existing (the sorted edgeKeys
+        of the edges already in the graph). Duplicates are redrawn in bulk
+        until none are left. """
+    numHubs = len(hubs)
+    newU = np.empty(numNew, dtype=np.int64)
+    newV = np.empty(numNew, dtype=np.int64)
+    # edges that still need to be (re)sampled
+    todo = np.arange(numNew)
+    while len(todo) > 0:
+        newU[todo] = hubs[np.random.randint(0, numHubs, size=len(todo))]
+        newV[todo] = randOtherVertex(numVertices, newU[todo])
+        keys = edgeKeys(newU, newV, numVertices)
+        # an edge must be new, and added only once (looking the keys up in
+        # sorted order is much faster)
+        order = np.argsort(keys)
+        sortedKeys = keys[order]
+        bad = np.empty(numNew, dtype=bool)
+        bad[order] = inSortedSet(sortedKeys, existing)
+        bad[order[1:][sortedKeys[1:] == sortedKeys[0:-1]]] = True
+        todo = np.nonzero(bad)[0]
+    return newU, newV
+
+def smallWorldIfyCSR(graph, jumpProb):
+    """ Like smallWorldIfy, for a CSRGraph: every undirected edge is rewired,
+        with probability jumpProb, to a random vertex (keeping one end). """
+    u, v = graph.undirectedEdges()
+    v = v.copy()
+    rewire = np.random.random(len(u)) < jumpProb
+    v[rewire] = randOtherVertex(graph.numVertices, u[rewire])
+    graph.setUndirectedEdges(u, v)
+
+def smallWorldIfyHeterogeneousCSR(graph, jumpProb, heterogeneity=0,
+                                  replace=True, hubs=None):
+    """ Like smallWorldIfyHeterogeneous, for a CSRGraph. Each undirected edge
+        is chosen with probability jumpProb; for each one, a new edge between
+        a random hub and a random vertex is added (resampling edges that
+        already exist), and if replace, the chosen edge is removed. hubs are
+        flat indices; by default a random (1 - heterogeneity) fraction of
+        the vertices. """
+    numVertices = graph.numVertices
+    u, v = graph.undirectedEdges()
+    chosen = np.random.random(len(u)) < jumpProb
+    if hubs is None:
+        numHubs = int((1 - heterogeneity) * numVertices)
+        hubs = np.random.choice(numVertices, numHubs, replace=False)
+
+    existing = np.sort(edgeKeys(u, v, numVertices))
+    numNew = int(chosen.sum())
+    if numNew == 0:
+        # leave the edge order alone, so the graph is still recognized as
+        # a plain grid (see bitboard.gridTopology)
+        return
+    newU, newV = randNewEdges(hubs, numVertices, numNew, existing)
+
+    if replace:
+        u = u[~chosen]
+        v = v[~chosen]
+    graph.setUndirectedEdges(np.concatenate((u, newU)),
+                             np.concatenate((v, newV)))
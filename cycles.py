@@ -0,0 +1,99 @@
+""" Cycle detection: most random grids settle into still lifes and short
+    period oscillators long before the end of a run.
+
+    The hash of every state is remembered for a rolling window of
+    generations. When a state comes back, the run is periodic from then on,
+    so the state (and the live cells and cluster) at any later step can be
+    found within one more period, instead of by running to the end. """
+import hashlib
+import numpy as np
+from collections import deque
+
+
+def gridHash(grid):
+    """ Returns a 128-bit hash of the cells of a grid (any array). """
+    data = np.ascontiguousarray(grid)
+    return hashlib.blake2b(data.view(np.uint8), digest_size=16).digest()
+
+
+class CycleDetector:
+    """ Remembers the hashes of the last window states it was shown, so
+        cycles with a period of up to window generations are found. """
+    def __init__(self, window):
+        self.window = window
+        self.seen = {}
+        self.order = deque()
+
+    def check(self, step, key):
+        """ Records key, the hash of the state at step. Returns the step at
+            which the same state was seen before, or None. """
+        earlier = self.seen.get(key)
+        if earlier is not None:
+            return earlier
+        self.seen[key] = step
+        self.order.append(key)
+        if len(self.order) > self.window:
+            del self.seen[self.order.popleft()]
+        return None
+
+
+def advanceUntilCycle(backend, d_grid, d_adjGrid, steps, window, metricsInd=-1,
+                      metrics=None, cycleInfo=None, buffers=None):
+    """ Evolves d_grid by steps generations on a backend (see backends.py),
+        as run_GPU does, but stops as soon as a state repeats within window
+        generations, and works out the final state (and the remaining
+        metrics, every metricsInd steps) from one period of the cycle. If a
+        cycle is found, its transient (the first step of the cycle) and
+        period are stored in the dict cycleInfo. Generations are evolved
+        into the backends.GridBuffers buffers, if given (or else into new
+        grids). Returns the final device grid. """
+    detector = CycleDetector(window)
+    step = 0
+    while step < steps:
+        earlier = detector.check(step, backend.stateHash(d_grid))
+        if earlier is not None:
+            period = step - earlier
+            if cycleInfo is not None:
+                cycleInfo["transient"] = earlier
+                cycleInfo["period"] = period
+            return finishCycle(backend, d_grid, d_adjGrid, step, steps, period,
+                               metricsInd, metrics)
+        if buffers is None:
+            d_newGrid = backend.newGrid(d_grid)
+        else:
+            d_newGrid = buffers.next(d_grid)
+        if metricsInd != -1 and step % metricsInd == 0:
+            metrics.append((step,) + backend.evolveMetrics(d_grid, d_adjGrid,
+                                                           d_newGrid))
+        else:
+            backend.evolve(d_grid, d_adjGrid, d_newGrid)
+        d_grid = d_newGrid
+        step += 1
+    return d_grid
+
+def finishCycle(backend, d_grid, d_adjGrid, step, steps, period, metricsInd,
+                metrics):
+    """ d_grid is the state at step, which repeats every period steps.
+        Returns the state at steps, appending the metrics of the sampled
+        steps in between. """
+    target = (steps - step) % period
+    # only the states up to the final one are needed without metrics
+    length = period if metricsInd != -1 else target
+    cycle = []
+    final = d_grid
+    for offset in range(length):
+        if offset == target:
+            final = d_grid
+        d_newGrid = backend.newGrid(d_grid)
+        if metricsInd != -1:
+            cycle.append(backend.evolveMetrics(d_grid, d_adjGrid, d_newGrid))
+        else:
+            backend.evolve(d_grid, d_adjGrid, d_newGrid)
+        d_grid = d_newGrid
+    if target == length:
+        final = d_grid
+    if metricsInd != -1:
+        first = -(-step // metricsInd) * metricsInd
+        for sample in range(first, steps, metricsInd):
+            metrics.append((sample,) + cycle[(sample - step) % period])
+    return final
@@ -0,0 +1,194 @@
+""" Ensembles: many independent grids evolved together through one shared
+    adjacency grid.
+
+    An ensemble is a stack of grids of shape (n, rows + 1, cols + 1), each with
+    its dead last row and column. Evolving the whole stack at once means the
+    adjacency is read (and sent to the device) once for every replica, and
+    small grids still give the hardware enough work. The kernels here are
+    used by the backends (see Backend.advanceEnsemble). """
+import numpy as np
+from gameoflife import cuda, genRandGrid
+from csrgraph import CSRGraph
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+def genRandGrids(dim, n, prob=0.5):
+    """ Generates a stack of n random grids with a given cell density. """
+    return np.stack([genRandGrid(dim, prob) for _ in range(n)])
+
+
+def evolveEnsemble_numpy(grids, adjGrid, newGrids, metrics=False):
+    """ Evolves every grid in the stack grids by one generation into the
+        zeroed stack newGrids. The neighbor indices are worked out once and
+        shared by all replicas. If metrics, returns an (n, 3) array of
+        (live, matches, total) for every grid (see evolve2DMetrics). """
+    n = grids.shape[0]
+    rows = grids.shape[1] - 1
+    cols = grids.shape[2] - 1
+    counts = np.zeros((n, 3), dtype=np.int64)
+    if isinstance(adjGrid, CSRGraph):
+        src, dst = adjGrid.edges()
+        numAdj = adjGrid.degrees().reshape(rows, cols)
+    else:
+        # flat index of every neighbor, in a grid with its dead zone
+        flat = adjGrid[..., 0] * (cols + 1) + adjGrid[..., 1]
+        numAdj = ((adjGrid[..., 0] < rows) & (adjGrid[..., 1] < cols)).sum(
+            axis=-1)
+    for r in range(n):
+        grid = grids[r]
+        alive = grid[0:rows, 0:cols] == 1
+        if isinstance(adjGrid, CSRGraph):
+            live = grid[0:rows, 0:cols].ravel()
+            numAlive = np.bincount(src, weights=live[dst],
+                                   minlength=rows * cols)
+            numAlive = numAlive.astype(np.int32).reshape(rows, cols)
+        else:
+            numAlive = grid.ravel()[flat].sum(axis=-1, dtype=np.int32)
+        newGrids[r, 0:rows, 0:cols] = (numAlive == 3) | ((numAlive == 2) & alive)
+        if metrics:
+            counts[r] = (np.count_nonzero(alive), numAlive[alive].sum(),
+                         numAdj[alive].sum())
+    if metrics:
+        return counts
+
+
+def evolveEnsemble_parallel(grids, adjGrid, newGrids, rowCounts, metrics):
+    """ evolveEnsemble_numpy for a padded adjacency grid, compiled with
+        numba; every (replica, row) pair is a unit of parallel work. If
+        metrics, the (live, matches, total) of every row of every replica are
+        written to rowCounts, of shape (n, rows, 3). """
+    n = grids.shape[0]
+    rows = grids.shape[1] - 1
+    cols = grids.shape[2] - 1
+    maxLen = adjGrid.shape[2]
+    for ri in prange(n * rows):
+        r = ri // rows
+        i = ri % rows
+        live = 0
+        matches = 0
+        total = 0
+        for j in range(cols):
+            numAlive = 0
+            numAdj = 0
+            for k in range(maxLen):
+                numAlive += grids[r, adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+                if metrics and adjGrid[i,j,k,0] < rows and adjGrid[i,j,k,1] < cols:
+                    numAdj += 1
+            if grids[r,i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += numAdj
+            if numAlive == 3 or (numAlive == 2 and grids[r,i,j] == 1):
+                newGrids[r,i,j] = 1
+        if metrics:
+            rowCounts[r,i,0] = live
+            rowCounts[r,i,1] = matches
+            rowCounts[r,i,2] = total
+
+def evolveEnsembleCSR_parallel(grids, indptr, indices, newGrids, rowCounts,
+                               metrics):
+    """ evolveEnsemble_parallel for a CSRGraph. """
+    n = grids.shape[0]
+    rows = grids.shape[1] - 1
+    cols = grids.shape[2] - 1
+    for ri in prange(n * rows):
+        r = ri // rows
+        i = ri % rows
+        live = 0
+        matches = 0
+        total = 0
+        for j in range(cols):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grids[r, indices[k] // cols, indices[k] % cols]
+            if grids[r,i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += indptr[v+1] - indptr[v]
+            if numAlive == 3 or (numAlive == 2 and grids[r,i,j] == 1):
+                newGrids[r,i,j] = 1
+        if metrics:
+            rowCounts[r,i,0] = live
+            rowCounts[r,i,1] = matches
+            rowCounts[r,i,2] = total
+
+if njit is not None:
+    evolveEnsemble_parallel = njit(parallel=True, nogil=True,
+                                   cache=True)(evolveEnsemble_parallel)
+    evolveEnsembleCSR_parallel = njit(parallel=True, nogil=True,
+                                      cache=True)(evolveEnsembleCSR_parallel)
+
+
+def evolveEnsemble_kernel(grids, adjGrid, newGrids, counts, metrics):
+    """ Like evolve2D_kernel, but every thread handles its cells in every
+        replica, so each adjacency slot is read from global memory once and
+        then served from cache. If metrics, (live, matches, total) of every
+        replica are added to counts, of shape (n, 3). """
+    n = grids.shape[0]
+    rows = grids.shape[1] - 1
+    cols = grids.shape[2] - 1
+    maxLen = adjGrid.shape[2]
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    for r in range(n):
+        live = 0
+        matches = 0
+        total = 0
+        for i in range(startX, rows, gridX):
+            for j in range(startY, cols, gridY):
+                numAlive = 0
+                numAdj = 0
+                for k in range(maxLen):
+                    numAlive += grids[r, adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+                    if adjGrid[i,j,k,0] < rows and adjGrid[i,j,k,1] < cols:
+                        numAdj += 1
+                if grids[r,i,j] == 1:
+                    live += 1
+                    matches += numAlive
+                    total += numAdj
+                if numAlive == 3 or (numAlive == 2 and grids[r,i,j] == 1):
+                    newGrids[r,i,j] = 1
+        if metrics:
+            cuda.atomic.add(counts, (r, 0), live)
+            cuda.atomic.add(counts, (r, 1), matches)
+            cuda.atomic.add(counts, (r, 2), total)
+
+def evolveEnsembleCSR_kernel(grids, indptr, indices, newGrids, counts,
+                             metrics):
+    """ evolveEnsemble_kernel for a CSRGraph. """
+    n = grids.shape[0]
+    rows = grids.shape[1] - 1
+    cols = grids.shape[2] - 1
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    for r in range(n):
+        live = 0
+        matches = 0
+        total = 0
+        for i in range(startX, rows, gridX):
+            for j in range(startY, cols, gridY):
+                v = i * cols + j
+                numAlive = 0
+                for k in range(indptr[v], indptr[v+1]):
+                    numAlive += grids[r, indices[k] // cols, indices[k] % cols]
+                if grids[r,i,j] == 1:
+                    live += 1
+                    matches += numAlive
+                    total += indptr[v+1] - indptr[v]
+                if numAlive == 3 or (numAlive == 2 and grids[r,i,j] == 1):
+                    newGrids[r,i,j] = 1
+        if metrics:
+            cuda.atomic.add(counts, (r, 0), live)
+            cuda.atomic.add(counts, (r, 1), matches)
+            cuda.atomic.add(counts, (r, 2), total)
+
+if cuda is not None:
+    evolveEnsemble_kernel = cuda.jit(evolveEnsemble_kernel)
+    evolveEnsembleCSR_kernel = cuda.jit(evolveEnsembleCSR_kernel)
@@ -1,58 +1,94 @@
 ﻿import numpy as np
 from gameoflife import addToTuple
-from numba import *
+from csrgraph import CSRGraph
+from bitboard import BitGrid, gridTopology
 
 def countLiveCells(grid):
     """ Returns the number of live cells in the grid.
         
-        If the cells have multiple lives, returns the total number of lives. """
-    count = 0
-    for val in np.nditer(grid):
-        count += val
-    return count
+        If the cells have multiple lives, returns the total number of lives.
+        grid may be a BitGrid. """
+    if isinstance(grid, BitGrid):
+        return grid.countLiveCells()
+    return int(grid.sum(dtype=np.int64))
 
-@autojit
 def cluster(grid, adjGrid):
     """ Returns the probability that neighbors of live cells are live
    
         This can be used as a measure of "randomness" of the grid -- i.e. if the
         grid is completely random, then this should roughly equal 1 - 2f + 2f^2,
-        where f is the fraction of live cells. """
+        where f is the fraction of live cells. adjGrid may be a CSRGraph, and
+        grid may be a BitGrid (if adjGrid is a plain torus or standard grid).
+        Works for grids of any dimension. """
     if countLiveCells(grid) == 0:
         return 0 # nothing is alive; cluster is 0
-    it = np.nditer(grid, flags=['multi_index'])
-    matches = 0 # number of neighbors of live cells that are live
-    total = 0 # total number of neighbors of live cells
-    while not it.finished:
-        flag = False
+    matches, total = clusterCounts(grid, adjGrid)
+    return matches/total
 
-        for i in range(len(it.multi_index)):
-            # do not record situations where we're in dead zone of grid
-            if it.multi_index[i] == grid.shape[i] - 1:
-                flag = True
+def clusterFromMetrics(live, matches, total):
+    """ Returns cluster, from the counts returned by the evolve*Metrics
+        functions (and clusterCounts). """
+    if live == 0:
+        return 0
+    return matches/total
 
-        if flag:
-            it.iternext()
-            continue
-        
-        for adj in adjGrid[it.multi_index]:
-            # do not record situations where adjacent cell is in dead zone
-            flag = False
+def clusterCounts(grid, adjGrid):
+    """ Returns (matches, total): the number of neighbors of live cells that
+        are live, and the total number of neighbors of live cells, not
+        counting neighbors in the dead zone. """
+    if isinstance(grid, BitGrid):
+        return grid.clusterCounts(gridTopology(adjGrid) == "torus")
+    if isinstance(adjGrid, CSRGraph):
+        return clusterCountsCSR(grid, adjGrid)
+    ldim = len(grid.shape)
+    # live cells, not counting the dead zone of the grid
+    real = tuple(slice(0, d - 1) for d in grid.shape)
+    liveLocs = np.nonzero(grid[real] == 1)
+    # coordinates of every neighbor of every live cell
+    adj = adjGrid[liveLocs]
+    # do not record neighbors in the dead zone (including placeholders)
+    valid = (adj != np.array(grid.shape) - 1).all(axis=-1)
+    adjLive = grid[tuple(adj[..., i] for i in range(ldim))] == 1
+    total = np.count_nonzero(valid) # total number of neighbors of live cells
+    # number of neighbors of live cells that are live
+    matches = np.count_nonzero(valid & adjLive)
+    return matches, total
+    
 
-            for i in range(len(it.multi_index)):
-                # do not record situations where we're in dead zone of grid
-                if adj[i] == grid.shape[i] - 1:
-                    flag = True
+def clusterCountsCSR(grid, graph):
+    """ clusterCounts for a CSRGraph. Every edge leaving a live cell is
+        counted; there are no placeholder edges into the dead zone to skip. """
+    real = tuple(slice(0, d) for d in graph.dim)
+    live = grid[real].ravel() == 1
+    liveCells = np.nonzero(live)[0]
+    degrees = graph.degrees()[liveCells]
+    total = int(degrees.sum())
+    # neighbors of the live cells, gathered row by row from the CSR arrays
+    starts = np.repeat(graph.indptr[liveCells] - np.cumsum(degrees) + degrees,
+                       degrees)
+    adj = graph.indices[starts + np.arange(total)]
+    matches = np.count_nonzero(live[adj])
+    return matches, total
 
-            if flag:
-                continue
+def vertexDegrees(adjGrid):
+    """ Returns the number of neighbors of every cell, in flat order, not
+        counting placeholder slots. adjGrid may be a CSRGraph. """
+    if isinstance(adjGrid, CSRGraph):
+        return adjGrid.degrees()
+    ldim = len(adjGrid.shape) - 2
+    dim = np.array(adjGrid.shape[0:ldim])
+    real = (adjGrid != dim).any(axis=-1)
+    return real.sum(axis=-1).ravel()
 
-            loc = tuple(adj)
-            # we only care about live cell matches
-            if grid[it.multi_index] == 1:
-                total += 1
-                if grid[loc] == 1:
-                    matches += 1
-        it.iternext()
-    return matches/total
-    
\ No newline at end of file
+def hubDegreeDistribution(adjGrid, hubs):
+    """ Returns (degrees, hubCounts, otherCounts): for every degree that
+        occurs, the number of hubs (flat indices, as from selectHubs) and of
+        other cells with that many neighbors. """
+    allDegrees = vertexDegrees(adjGrid)
+    isHub = np.zeros(len(allDegrees), dtype=np.bool_)
+    isHub[hubs] = True
+    hubCounts = np.bincount(allDegrees[isHub], minlength=allDegrees.max() + 1)
+    otherCounts = np.bincount(allDegrees[~isHub],
+                              minlength=allDegrees.max() + 1)
+    degrees = np.nonzero(hubCounts + otherCounts)[0]
+    return degrees, hubCounts[degrees], otherCounts[degrees]
@@ -0,0 +1,266 @@
+""" Hashlife: memoized quadtree evolution, for long runs on torus and
+    standard (bounded) grids.
+
+    The grid is stored as a quadtree whose nodes are interned, so identical
+    blocks anywhere in space (or time) are the same node, and the future of
+    every node is memoized. A node of size 2^k can then be advanced by up to
+    2^(k-2) generations at once. The interned node store is an LRU cache with
+    a bounded number of entries.
+
+    A torus is handled as the infinite periodic tiling of the grid. A bounded
+    grid is surrounded by a ring of "wall" cells, which never change and
+    count as dead, so nothing outside the ring ever comes alive. """
+import numpy as np
+from collections import OrderedDict
+
+DEAD = 0
+ALIVE = 1
+WALL = 2
+
+
+class Node:
+    """ A square block of 2^level cells, made of four blocks of half the size
+        (or of four cell values, for level 1). pop is the number of cells that
+        are not dead. results memoizes successor, by log2 of the number of
+        generations. """
+    __slots__ = ("nw", "ne", "sw", "se", "level", "pop", "results")
+
+    def __init__(self, nw, ne, sw, se, level, pop):
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.level = level
+        self.pop = pop
+        self.results = None
+
+
+def nextCell(cells, i, j):
+    """ Returns the next state of cells[i][j] (cells is a list of rows). """
+    if cells[i][j] == WALL:
+        return WALL
+    numAlive = 0
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if (di != 0 or dj != 0) and cells[i+di][j+dj] == ALIVE:
+                numAlive += 1
+    if numAlive == 3 or (numAlive == 2 and cells[i][j] == ALIVE):
+        return ALIVE
+    return DEAD
+
+def log2Floor(n):
+    return n.bit_length() - 1
+
+def isPowerOf2(n):
+    return n > 0 and n & (n - 1) == 0
+
+
+class Hashlife:
+    """ A store of interned nodes, with at most maxNodes entries (the least
+        recently used ones are evicted first). Evicting a node never makes a
+        result wrong; it can only cost a recomputation. """
+    def __init__(self, maxNodes=2**22):
+        self.maxNodes = maxNodes
+        self.nodes = OrderedDict()
+        self.empties = {0: DEAD}
+
+    def node(self, nw, ne, sw, se):
+        """ Returns the interned node with these four quadrants. """
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+            return node
+        if isinstance(nw, Node):
+            node = Node(nw, ne, sw, se, nw.level + 1,
+                        nw.pop + ne.pop + sw.pop + se.pop)
+        else:
+            node = Node(nw, ne, sw, se, 1, (nw != DEAD) + (ne != DEAD) +
+                        (sw != DEAD) + (se != DEAD))
+        self.nodes[key] = node
+        if len(self.nodes) > self.maxNodes:
+            self.nodes.popitem(last=False)
+        return node
+
+    def empty(self, level):
+        """ Returns the node of the given level with every cell dead. """
+        if level not in self.empties:
+            e = self.empty(level - 1)
+            self.empties[level] = self.node(e, e, e, e)
+        return self.empties[level]
+
+    def centre(self, node):
+        """ Returns the central block of node, of half its size. """
+        return self.node(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def recentre(self, node):
+        """ Returns a node of twice the size, with node in its centre. """
+        e = self.empty(node.level - 1)
+        return self.node(self.node(e, e, e, node.nw), self.node(e, e, node.ne, e),
+                         self.node(e, node.sw, e, e), self.node(node.se, e, e, e))
+
+    def baseSuccessor(self, node):
+        """ successor for a level 2 (4x4) node: its centre after 1 step. """
+        cells = [[node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+                 [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+                 [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+                 [node.sw.sw, node.sw.se, node.se.sw, node.se.se]]
+        return self.node(nextCell(cells, 1, 1), nextCell(cells, 1, 2),
+                         nextCell(cells, 2, 1), nextCell(cells, 2, 2))
+
+    def successor(self, node, j):
+        """ Returns the centre of node (half its size) after 2^j generations.
+            Requires j <= node.level - 2. """
+        if node.pop == 0:
+            return self.empty(node.level - 1)
+        if node.results is None:
+            node.results = {}
+        elif j in node.results:
+            return node.results[j]
+        if node.level == 2:
+            result = self.baseSuccessor(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            # the 9 overlapping blocks of half the size
+            blocks = [[nw, self.node(nw.ne, ne.nw, nw.se, ne.sw), ne],
+                      [self.node(nw.sw, nw.se, sw.nw, sw.ne), self.centre(node),
+                       self.node(ne.sw, ne.se, se.nw, se.ne)],
+                      [sw, self.node(sw.ne, se.nw, sw.se, se.sw), se]]
+            if j == node.level - 2:
+                # full speed: both halves advance 2^(j-1) generations
+                c = [[self.successor(b, j - 1) for b in row] for row in blocks]
+                j2 = j - 1
+            else:
+                # only the second half advances (2^j generations)
+                c = [[self.centre(b) for b in row] for row in blocks]
+                j2 = j
+            result = self.node(
+                self.successor(self.node(c[0][0], c[0][1], c[1][0], c[1][1]), j2),
+                self.successor(self.node(c[0][1], c[0][2], c[1][1], c[1][2]), j2),
+                self.successor(self.node(c[1][0], c[1][1], c[2][0], c[2][1]), j2),
+                self.successor(self.node(c[1][1], c[1][2], c[2][1], c[2][2]), j2))
+        node.results[j] = result
+        return result
+
+    def fromArray(self, arr):
+        """ Returns the node for a square array of cell values, whose size is a
+            power of 2 (at least 2). Identical blocks are only interned once. """
+        codes = ((arr[0::2, 0::2].astype(np.int64) * 3 + arr[0::2, 1::2]) * 3 +
+                 arr[1::2, 0::2]) * 3 + arr[1::2, 1::2]
+        uniq, inverse = np.unique(codes, return_inverse=True)
+        nodes = [self.node(int(c) // 27, int(c) // 9 % 3, int(c) // 3 % 3,
+                           int(c) % 3) for c in uniq]
+        ids = inverse.reshape(codes.shape)
+        while ids.shape[0] > 1:
+            keys = np.stack((ids[0::2, 0::2], ids[0::2, 1::2], ids[1::2, 0::2],
+                             ids[1::2, 1::2]), axis=-1)
+            uniq, inverse = np.unique(keys.reshape(-1, 4), axis=0,
+                                      return_inverse=True)
+            nodes = [self.node(nodes[a], nodes[b], nodes[c], nodes[d])
+                     for a, b, c, d in uniq]
+            ids = inverse.reshape(keys.shape[0:2])
+        return nodes[ids[0, 0]]
+
+    def toArray(self, node):
+        """ Returns the cell values of a node as an int8 array. """
+        ids = np.zeros((1, 1), dtype=np.int64)
+        nodes = [node]
+        while True:
+            level = nodes[0].level
+            index = {}
+            children = []
+            table = np.empty((len(nodes), 4), dtype=np.int64)
+            for i, n in enumerate(nodes):
+                for k, child in enumerate((n.nw, n.ne, n.sw, n.se)):
+                    if level == 1:
+                        table[i, k] = child
+                    else:
+                        if child not in index:
+                            index[child] = len(children)
+                            children.append(child)
+                        table[i, k] = index[child]
+            quads = table[ids]
+            size = 2 * ids.shape[0]
+            new = np.empty((size, size), dtype=np.int64)
+            new[0::2, 0::2] = quads[..., 0]
+            new[0::2, 1::2] = quads[..., 1]
+            new[1::2, 0::2] = quads[..., 2]
+            new[1::2, 1::2] = quads[..., 3]
+            if level == 1:
+                return new.astype(np.int8)
+            ids = new
+            nodes = children
+
+    def advance(self, grid, torus, steps):
+        """ Returns grid (with its dead last row and column) after steps
+            generations, on a torus or, if not torus, a standard grid. """
+        rows = grid.shape[0] - 1
+        cols = grid.shape[1] - 1
+        cells = grid[0:rows, 0:cols]
+        if torus and isPowerOf2(rows) and isPowerOf2(cols):
+            cells = self.advancePeriodic(cells, steps)
+        elif torus:
+            cells = self.advanceTorus(cells, steps)
+        else:
+            cells = self.advanceBounded(cells, steps)
+        newGrid = np.zeros_like(grid)
+        newGrid[0:rows, 0:cols] = cells
+        return newGrid
+
+    def advancePeriodic(self, cells, steps):
+        """ advance for a torus whose sides are powers of 2. Everything stays
+            in the node store between jumps. """
+        rows, cols = cells.shape
+        size = max(rows, cols, 2)
+        # a square block of the tiling; its period divides its size
+        period = self.fromArray(np.tile(cells, (size // rows, size // cols)))
+        while steps > 0:
+            root = self.node(period, period, period, period)
+            j = min(log2Floor(steps), root.level - 2)
+            result = self.successor(root, j)
+            # result is the block shifted by half its size, in both directions
+            period = self.node(result.se, result.sw, result.ne, result.nw)
+            steps -= 2 ** j
+        return self.toArray(period)[0:rows, 0:cols]
+
+    def advanceTorus(self, cells, steps):
+        """ advance for any other torus: the tiling is rebuilt for every
+            jump, but the nodes are still shared through the store. """
+        rows, cols = cells.shape
+        size = 4
+        while size < 2 * max(rows, cols):
+            size *= 2
+        shift = size // 4
+        while steps > 0:
+            tiles = np.tile(cells, (-(-size // rows), -(-size // cols)))
+            root = self.fromArray(tiles[0:size, 0:size])
+            j = min(log2Floor(steps), root.level - 2)
+            result = self.toArray(self.successor(root, j))
+            # result starts at cell (shift, shift) of the tiling
+            cells = np.roll(result[0:rows, 0:cols],
+                            (shift % rows, shift % cols), axis=(0, 1))
+            steps -= 2 ** j
+        return cells
+
+    def advanceBounded(self, cells, steps):
+        """ advance for a standard grid, walled in. """
+        rows, cols = cells.shape
+        if steps == 0:
+            return cells
+        size = 4
+        while size < 2 * (max(rows, cols) + 2):
+            size *= 2
+        start = size // 4
+        universe = np.zeros((size, size), dtype=np.int8)
+        universe[start:start+rows+2, start:start+cols+2] = WALL
+        universe[start+1:start+rows+1, start+1:start+cols+1] = cells
+        root = self.fromArray(universe)
+        while True:
+            j = min(log2Floor(steps), root.level - 2)
+            # the walled grid is at the corner of the result
+            result = self.successor(root, j)
+            steps -= 2 ** j
+            if steps == 0:
+                break
+            root = self.recentre(result)
+        return self.toArray(result)[1:rows+1, 1:cols+1]
@@ -0,0 +1,153 @@
+""" Activity-tracked incremental evolve.
+
+    After the early transient, only a few cells change every generation, yet
+    a full evolve still visits every cell and every adjacency slot. Here the
+    number of live neighbors of every cell is kept up to date instead: when
+    a cell changes, only the cells that have it as a neighbor (found through
+    the reverse adjacency, so rewired small-world edges are handled) get
+    their counts adjusted. The only cells that can change next generation
+    are the ones that changed and those whose counts did, so only they are
+    recomputed, and a step costs time proportional to the activity rather
+    than to the size of the grid. Works for any topology, in any
+    dimension. """
+import weakref
+import numpy as np
+from csrgraph import CSRGraph
+
+
+class ReverseAdjacency:
+    """ The adjacency of a grid in both directions, as CSRGraphs: forward
+        holds the neighbors of every cell, and reverse the cells that have
+        it as a neighbor. """
+    def __init__(self, adjGrid):
+        if not isinstance(adjGrid, CSRGraph):
+            adjGrid = CSRGraph.fromAdjGrid(adjGrid)
+        self.forward = adjGrid
+        src, dst = adjGrid.edges()
+        self.reverse = CSRGraph.fromEdges(adjGrid.dim, dst, src)
+        self.degrees = adjGrid.degrees()
+
+    @property
+    def numVertices(self):
+        return self.forward.numVertices
+
+
+class ActiveGrid:
+    """ The state of a grid for the incremental evolve: the flat live cells
+        of the real grid, the number of live neighbors of every cell, and
+        the (sorted) cells that may change next generation. The counts are
+        None until the adjacency is first known (see prepare).
+
+        version changes whenever the state does, and parent is (a weak
+        reference to the grid this one was evolved from, its version at the
+        time), so that assign can tell when it only needs to copy the cells
+        that changed. """
+    def __init__(self, shape, live, counts=None, active=None):
+        self.shape = shape
+        self.live = live
+        self.counts = counts
+        self.active = active
+        self.version = 0
+        self.parent = None
+
+    @classmethod
+    def fromGrid(cls, grid):
+        """ Takes the real cells of an int8 grid (with its dead last row and
+            column, or hyperplane in higher dimensions). """
+        real = tuple(slice(0, d - 1) for d in grid.shape)
+        return cls(grid.shape, grid[real].ravel().astype(np.int8))
+
+    def toGrid(self):
+        grid = np.zeros(self.shape, dtype=np.int8)
+        real = tuple(slice(0, d - 1) for d in self.shape)
+        grid[real] = self.live.reshape(grid[real].shape)
+        return grid
+
+    def evolvedFrom(self, other):
+        """ Records that this grid was just evolved from the ActiveGrid
+            other, by one stepActive. """
+        self.parent = (weakref.ref(other), other.version)
+
+    def changed(self):
+        """ Bumps the version, after the state changed. """
+        self.version += 1
+        self.parent = None
+
+    def assign(self, other):
+        """ Makes this grid a copy of the ActiveGrid other. If other was
+            evolved from this grid, and neither changed since, the two only
+            differ in other's active cells, and only they are copied. """
+        parent = other.parent
+        if parent is not None and parent[0]() is self and \
+           parent[1] == self.version and self.counts is not None and \
+           other.active is not None:
+            active = other.active
+            self.live[active] = other.live[active]
+            self.counts[active] = other.counts[active]
+            self.active = active.copy()
+        else:
+            self.shape = other.shape
+            self.live = other.live.copy()
+            self.counts = None if other.counts is None else \
+                other.counts.copy()
+            self.active = None if other.active is None else \
+                other.active.copy()
+        self.changed()
+
+    def copy(self):
+        state = ActiveGrid(self.shape, None)
+        state.assign(self)
+        return state
+
+    def prepare(self, adj):
+        """ Counts the live neighbors of every cell from scratch, and marks
+            every cell as active. Only needed once per grid. """
+        if self.counts is not None:
+            return
+        src, dst = adj.forward.edges()
+        self.counts = np.bincount(src, weights=self.live[dst],
+                                  minlength=adj.numVertices).astype(np.int32)
+        self.active = np.arange(adj.numVertices, dtype=np.int64)
+
+    def metrics(self, adj):
+        """ Returns (live, matches, total), as evolve2DMetrics does. """
+        self.prepare(adj)
+        alive = self.live == 1
+        return (int(np.count_nonzero(alive)),
+                int(self.counts[alive].sum(dtype=np.int64)),
+                int(adj.degrees[alive].sum(dtype=np.int64)))
+
+
+def gatherRows(graph, vertices):
+    """ Returns the concatenated rows of a CSRGraph for the given vertices,
+        and the length of each row. """
+    lo = graph.indptr[vertices]
+    lengths = graph.indptr[vertices + 1] - lo
+    # position of every entry within the concatenation, shifted to its row
+    offsets = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+    return graph.indices[np.arange(int(lengths.sum())) + offsets], lengths
+
+def sortedUnique(values):
+    """ Returns the distinct values of an integer array, sorted. """
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    return values[np.concatenate(([True], values[1:] != values[0:-1]))]
+
+def stepActive(state, adj):
+    """ Evolves state by one generation in place, visiting only its active
+        cells. Returns the number of cells that changed. """
+    state.prepare(adj)
+    active = state.active
+    alive = state.live[active]
+    numAlive = state.counts[active]
+    new = (numAlive == 3) | ((numAlive == 2) & (alive == 1))
+    changed = active[new != (alive == 1)]
+    state.live[changed] ^= 1
+    # +1 for every cell that was born, -1 for every cell that died
+    delta = state.live[changed].astype(np.int32) * 2 - 1
+    affected, lengths = gatherRows(adj.reverse, changed)
+    np.add.at(state.counts, affected, np.repeat(delta, lengths))
+    state.active = sortedUnique(np.concatenate((changed, affected)))
+    state.changed()
+    return len(changed)
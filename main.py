@@ -1,7 +1,15 @@
 ﻿from gameoflife import *
 from cmdline import *
+from backends import backendNames, getBackend
 from gui import GUI
-from gridtools import cluster, countLiveCells
+from gridtools import cluster, clusterFromMetrics, countLiveCells, hubDegreeDistribution
+from ensemble import genRandGrids
+from sweep import adjCache, coupledGraph, rewiredGraph, runSweep, seedUnit
+from adjcache import graphKey
+from trajectory import TrajectoryWriter
+from asyncwriter import AsyncWriter
+from resultsdb import ResultsDB
+from checkpoint import FILENAME as CHECKPOINT, Checkpointer, loadCheckpoint, restoreRandom, runChunked
 from sys import stdout
 from copy import deepcopy
 from timeit import default_timer as timer
@@ -9,6 +17,7 @@ import numpy as np
 import argparse
 import datetime
 import os
+import random
 
 parser = argparse.ArgumentParser(description="Game of Life Analysis Frontend",
                                  epilog="")
@@ -67,120 +76,425 @@ parser.add_argument('-s', "--sample", help="When using output modes 3 or 4, how
 
 parser.add_argument('-of', "--outfile", help="Output file to store data in", default="D:/Dropbox/Documents/gameoflife_data/")
 
+parser.add_argument('-b', "--backend", help=("Where to run the simulations: gpu, cpu (numba, all cores), numpy, "
+                                            "spmv (sparse matrix-vector, for rewired graphs), bitboard, tiled or hashlife "
+                                            "(unmodified torus only; tiled advances cache-sized tiles several generations at a time; "
+                                            "hashlife suits long runs), incremental (recomputes only cells near "
+                                            "the last changes; suits long runs that settle down), partitioned (one "
+                                            "simulation split into bands of rows across --threads processes; "
+                                            "suits single huge grids), outofcore (evolves a tile of rows at a time; "
+                                            "only the evolve loop changes, as the grid and adjacency are still built "
+                                            "in memory here: use outofcore.py's randomGrid and torusGraph for grids "
+                                            "bigger than memory), adaptive (switches between numpy "
+                                            "and a sparse set of live cells as the population falls and rises; "
+                                            "suits long runs at low --frac), or auto to use the GPU if there is "
+                                            "one (and bitboard when swc is 0)"),
+                    choices=backendNames(), default="auto")
+
+parser.add_argument('-t', "--threads", help="Number of CPU threads to use (default: all cores)",
+                    type=int, default=None)
+
+parser.add_argument('-sp', "--sparse", help="Store the adjacency grid in CSR form (extraspace is ignored)",
+                    action='store_true', default=False)
+
+parser.add_argument('-en', "--ensemble", help="Run all niters simulations of each swc together, as one stacked array",
+                    action='store_true', default=False)
+
+parser.add_argument('-w', "--workers", help="Number of processes to run the (swc, sim) pairs of the sweep on",
+                    type=int, default=1)
+
+parser.add_argument('-cy', "--cycles", help=("Stop a simulation once it cycles with a period of at most this many steps, "
+                                             "and report the transient and period (output modes below 4; default: off)"),
+                    type=int, default=0)
+
+parser.add_argument('-rd', "--resultsdb", help=("SQLite database to record the run and its data1-3 results in, "
+                                                "instead of text files (see resultsdb.py)"),
+                    default=None)
+
+parser.add_argument('-sd', "--seed", help="Seed for the random number generators (default: random, and recorded)",
+                    type=int, default=None)
+
+parser.add_argument('-ck', "--checkpoint", help=("Seconds between checkpoints of the sweep, saved in its output folder "
+                                                 "(0 for none)"),
+                    type=float, default=600)
+
+parser.add_argument('-rs', "--resume", help=("Output folder of an interrupted sweep to resume from its checkpoint "
+                                             "(its other arguments are used, and these are ignored)"),
+                    default=None)
+
+parser.add_argument('-ac', "--adjcache", help=("Directory of a cache of adjacency grids, so runs with the same parameters "
+                                               "and seed reuse them (see adjcache.py; default: no cache)"),
+                    default=None)
+
+parser.add_argument('-acs', "--adjcachesize", help="Size budget of the adjacency cache, in MB",
+                    type=float, default=4096)
+
+parser.add_argument('-cp', "--coupled", help=("Build the graph of each swc by rewiring only the extra edges on top of the "
+                                              "graph of the swc before, with a fixed random threshold per edge (see "
+                                              "rewire.NestedRewiring), so neighboring swcs are correlated and the "
+                                              "rewiring costs as much as for the largest swc alone"),
+                    action="store_true", default=False)
+
 args = parser.parse_args()
 
-start = datetime.datetime.now()
-# all new datafiles will be stored in this folder
-folder = start.strftime("%m-%d-%Y_%H-%M-%S") + "/"
-# this folder is "guaranteed" to be unique, so no need to check if dir exists
-os.mkdir(args.outfile + folder)
-for i in range(1,args.output+1):
-    os.mkdir(args.outfile + folder + "/data" + str(i) + "/")
-# add extra parameters
-datestr = "frac=" + str(args.frac) + "_rows=" + str(args.rows) + "_cols=" + \
-    str(args.cols) + "_extraspace=" + str(args.extraspace) + "_niters=" + \
-    str(args.niters) + "_simlength=" + str(args.simlength) + "_replace=" + \
-    str(args.replace) + "_heterogeneity=" + str(args.heterogeneity)
-
-np.set_printoptions(threshold=np.inf)
-    
-if args.output >= 1:
-    # this file stores averages of final values across all simulations per swc
-    outfile_avg = open(args.outfile + folder + "data1/" + datestr + ".txt", "w")
-    # will be structured as a table with these 5 columns
-    outfile_avg.writelines("SWC  LiveCells Std Cluster Std\n")
+if args.ensemble and args.workers > 1:
+    parser.error("--ensemble runs all the simulations of an swc in one process, so it cannot be split "
+                 "across --workers")
+
+# the output folders are only made by the main process, not by the workers
+# of --workers (which import this module under another name)
+if __name__ == '__main__':
+    checkpoint = None
+    if args.resume is not None:
+        # carry on where the checkpoint left off, with the same arguments,
+        # in the same folder
+        checkpoint = loadCheckpoint(os.path.join(args.resume, CHECKPOINT))
+        args = checkpoint["args"]
+        start = checkpoint["start"]
+        folder = checkpoint["folder"]
+    else:
+        start = datetime.datetime.now()
+        # all new datafiles will be stored in this folder
+        folder = start.strftime("%m-%d-%Y_%H-%M-%S") + "/"
+        # this folder is "guaranteed" to be unique, so no need to check if dir exists
+        os.mkdir(args.outfile + folder)
+        # with a results database, only the data4 grids go in files
+        for i in range(1 if args.resultsdb is None else 4, args.output+1):
+            os.mkdir(args.outfile + folder + "/data" + str(i) + "/")
+    # add extra parameters
+    datestr = "frac=" + str(args.frac) + "_rows=" + str(args.rows) + "_cols=" + \
+        str(args.cols) + "_extraspace=" + str(args.extraspace) + "_niters=" + \
+        str(args.niters) + "_simlength=" + str(args.simlength) + "_replace=" + \
+        str(args.replace) + "_heterogeneity=" + str(args.heterogeneity)
+
+    np.set_printoptions(threshold=np.inf)
+
+    seed = args.seed
+    if checkpoint is not None:
+        seed = checkpoint["seed"]
+    elif seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+    np.random.seed(seed)
+    random.seed(seed)
+
+    results = None
+    if args.resultsdb is not None:
+        results = ResultsDB(args.resultsdb)
+    if results is not None and checkpoint is not None:
+        results.resumeRun(checkpoint["run"], round(checkpoint["swc"], 6), checkpoint["sim"])
+    elif results is not None:
+        results.startRun(started=start.isoformat(), frac=args.frac, rows=args.rows, cols=args.cols,
+                         extraspace=args.extraspace, niters=args.niters, simlength=args.simlength,
+                         sample=args.sample, replace=int(args.replace), heterogeneity=args.heterogeneity,
+                         backend=args.backend, seed=seed)
+
+    # every data1/data2/data3 file is written on a background thread, so the
+    # simulations do not wait on the output directory
+    writer = AsyncWriter()
+    if args.output >= 1 and results is None:
+        # this file stores averages of final values across all simulations per swc
+        outfile_avg = args.outfile + folder + "data1/" + datestr + ".txt"
+        if checkpoint is not None:
+            # drop the lines written after the checkpoint; they are written again
+            with open(outfile_avg, "r+") as f:
+                f.truncate(checkpoint["avgSize"])
+            writer.keepFile(outfile_avg)
+        else:
+            # will be structured as a table with these 5 columns
+            writer.write(outfile_avg, "SWC  LiveCells Std Cluster Std\n")
+
+def swcValues():
+    """ Returns every small world coefficient of the sweep, in order. """
+    swcs = []
+    swc = args.minswc
+    while swc <= args.maxswc + 0.0000000001:
+        swcs.append(swc)
+        swc += args.stepswc
+    return swcs
+
+def writeSteps(strswc, sim, metrics, cycle=None):
+    """ Writes the data3 file of one simulation (or its rows of the results
+        database), from a list of (step, live, matches, total), headed by its
+        (transient, period) if cycles are detected. """
+    if results is not None:
+        results.addSteps(float(strswc), sim, [(step, live, clusterFromMetrics(live, matches, total))
+                                              for step, live, matches, total in metrics])
+        return
+    outfile_steps = args.outfile + folder + "data3/" + "swc=" + strswc + "_sim=" + str(sim) + datestr + ".txt"
+    lines = []
+    if cycle is not None:
+        lines.append("# Transient: " + str(cycle[0]) + "  Period: " + str(cycle[1]) + "\n")
+    lines.append("Step  LiveCells Cluster\n")
+    for step, live, matches, total in metrics:
+        lines.append(str(step) + "    " + str(live) + "    " + str(clusterFromMetrics(live, matches, total)) + "\n")
+    writer.write(outfile_steps, "".join(lines))
+    writer.closeFile(outfile_steps)
+
+def trajectoryPath(strswc, sim):
+    """ Returns the data4 file of one simulation, which holds its sampled
+        grids (see trajectory.py). """
+    return args.outfile + folder + "data4/" + "swc=" + strswc + "_sim=" + str(sim) + datestr + ".traj"
+
+def runEnsemble(adjGrid, dim, strswc, simBackend, start):
+    """ Runs all niters simulations for one swc as a single ensemble (see
+        ensemble.py), writing the same data3/data4 files as the
+        one-at-a-time loop in main. Returns the final live cells and cluster
+        of every simulation. """
+    grids = genRandGrids(dim, args.niters, prob=args.frac)
+    steps = args.simlength
+    metrics = []
+    if args.output < 3:
+        grids = run_ensemble(grids, adjGrid, steps, simBackend)
+    elif args.output == 3:
+        grids = run_ensemble(grids, adjGrid, (steps//args.sample + 1) * args.sample, simBackend, args.sample,
+                             metrics)
+    else:
+        writers = [TrajectoryWriter(trajectoryPath(strswc, sim), grids.shape[1:]) for sim in range(args.niters)]
+        for step in range(steps//args.sample + 1):
+            if args.debug:
+                print("Step = " + str(step) + " Time elapsed: " + str(timer() - start))
+            chunk = []
+            grids = run_ensemble(grids, adjGrid, args.sample, simBackend, args.sample, chunk)
+            metrics.append((step * args.sample, chunk[0][1]))
+            for sim in range(args.niters):
+                writers[sim].append(step * args.sample, grids[sim])
+        for trajectory in writers:
+            trajectory.close()
+    if args.output >= 3:
+        for sim in range(args.niters):
+            writeSteps(strswc, sim, [(step,) + tuple(counts[sim]) for step, counts in metrics])
+    if args.debug:
+        print("Ensemble finished. Time elapsed: " + str(timer() - start))
+    livecells = np.array([countLiveCells(grid) for grid in grids], dtype=float)
+    cl = np.array([cluster(grid, adjGrid) for grid in grids])
+    return livecells, cl
 
 def main():
     start = timer()
     dim = np.array([args.rows,args.cols])
     grid = genRandGrid(dim, prob=args.frac)
-    game = Game(grid, dim, torusAdjFunc, args.extraspace)
+    # the torus and its rewired versions may have been built by an earlier run
+    cache = adjCache(args)
+    torusAdjGrid = None
+    if cache is not None:
+        torusKey = graphKey(graph="torus", rows=args.rows, cols=args.cols, extraspace=args.extraspace,
+                            sparse=args.sparse)
+        torusAdjGrid = cache.load(torusKey)
+    game = Game(grid, dim, torusAdjFunc, args.extraspace, args.sparse, torusAdjGrid)
+    if cache is not None and torusAdjGrid is None:
+        cache.store(torusKey, game.adjGrid)
+    backend = getBackend(args.backend, args.threads)
     if args.debug:
-        print("Initialized game. Time elapsed: " + str(timer() - start))
+        print("Initialized game on backend " + backend.name + ". Time elapsed: " + str(timer() - start))
     # original torus adjacency grid, to be used as fresh template for
-    # smallworld
-    origAdjGrid = np.copy(game.adjGrid)
-    # amount of small-world-ification to do
-    swc = args.minswc
-    # "fudge factor" needed because decimals are weird
-    while swc <= args.maxswc + 0.0000000001:
-        # changing small-world-ification; need to re-do smallWorldIfy
-        game.adjGrid = np.copy(origAdjGrid)
+    # smallworld (rewiredGraph and coupledGraph work on copies, so it is
+    # never modified)
+    origAdjGrid = game.adjGrid
+    # the rewirings of a --coupled sweep, carried from one swc to the next
+    nested = None
+    # amounts of small-world-ification to do
+    swcs = swcValues()
+    firstSwc = 0
+    if checkpoint is not None:
+        firstSwc = checkpoint["swcIndex"]
+        restoreRandom(checkpoint)
+    sweep = None
+    if args.workers > 1:
+        # every (swc, sim) pair runs on a pool of processes; results come
+        # back in the same order as the loop below
+        sweep = runSweep(origAdjGrid, swcs, args, (args.outfile + folder, datestr), args.workers, seed, firstSwc)
+
+    def syncOutput():
+        writer.sync()
+        if results is not None:
+            results.flush()
+
+    checkpointer = Checkpointer(args.outfile + folder + CHECKPOINT, args.checkpoint, syncOutput)
+
+    def state(swcIndex, sim=0, livecells=None, cl=None, cycles=None, adjGrid=None, inFlight=None):
+        """ Returns a checkpoint for simulation sim of swcs[swcIndex] (see
+            checkpoint.py); inFlight is the grid, generation and metrics of
+            that simulation if it has started. """
+        return {"args": args, "start": start, "folder": folder, "seed": seed,
+                "run": None if results is None else results.run,
+                "avgSize": os.path.getsize(outfile_avg) if args.output >= 1 and results is None else 0,
+                "swcIndex": swcIndex, "swc": swcs[swcIndex] if swcIndex < len(swcs) else args.maxswc + 1,
+                "sim": sim, "livecells": livecells, "cl": cl, "cycles": cycles, "adjGrid": adjGrid,
+                "inFlight": inFlight}
+
+    for swcIndex in range(firstSwc, len(swcs)):
+        swc = swcs[swcIndex]
         strswc = str(round(swc, 6))
         if args.debug:
             print("SWC = " + strswc + ". Time elapsed: " + str(timer() - start))
-        smallWorldIfyHeterogeneous(game.adjGrid, swc, args.heterogeneity, args.replace)
-        if args.debug:
-            print(game.adjGrid)
-            print("Grid smallworldified. Time elapsed: " + str(timer() - start))
-        # these will be arrays of the values for every simulation
-        livecells = np.zeros(args.niters)
-        cl = np.zeros(args.niters)
-        # run the simulation on this many different, random grids
-        for sim in range(args.niters):
+        # a checkpoint part of the way through this swc has its adjacency grid
+        resumed = checkpoint is not None and checkpoint["swcIndex"] == swcIndex and checkpoint["adjGrid"] is not None
+        if resumed:
+            game.adjGrid = checkpoint["adjGrid"]
+        elif sweep is None and args.coupled:
+            # only the edges whose thresholds lie between the last swc and
+            # this one are rewired (a resumed sweep catches up from the torus)
+            game.adjGrid, nested = coupledGraph(origAdjGrid, swcs, swcIndex, args, seed, nested)
+            hubs, dropped = nested.hubs, nested.dropped
+        elif sweep is None:
+            # changing small-world-ification; need to re-do smallWorldIfy on a
+            # fresh copy (seeded from the seed and swc alone, see rewiredGraph)
+            game.adjGrid, hubs, dropped = rewiredGraph(origAdjGrid, swc, args, seed, cache)
+        if not resumed and sweep is None:
             if args.debug:
-                print("Sim = " + str(sim) + ". Time elapsed: " + str(timer() - start))
-            # make file to output live cell count and cluster every step
+                print(game.adjGrid)
+                if dropped is None:
+                    print("Rewired grid taken from the cache.")
+                else:
+                    print(str(dropped) + " new edges did not fit in the extra space.")
+                print("Number of hubs: " + str(len(hubs)))
+                print("Degree  Hubs  Others")
+                for degree, numHubs, numOthers in zip(*hubDegreeDistribution(game.adjGrid, hubs)):
+                    print(str(degree) + "    " + str(numHubs) + "    " + str(numOthers))
+                print("Grid smallworldified. Time elapsed: " + str(timer() - start))
+        # the unmodified torus is much faster to run bit-packed
+        simBackend = backend
+        if args.backend == "auto" and swc < 0.0000000001:
+            simBackend = getBackend("bitboard")
+        # (transient, period) of every simulation, or -1 if it did not cycle
+        cycles = np.full((args.niters, 2), -1, dtype=np.int64)
+        cycleWindow = args.cycles if args.output < 4 else 0
+        if sweep is not None:
+            livecells, cl, metrics, cycles = next(sweep)
             if args.output >= 3:
-                outfile_steps = open(args.outfile + folder + "data3/" + "swc=" + strswc +\
-                    "_sim=" + str(sim) + datestr + ".txt", "w")
-                outfile_steps.writelines("Step  LiveCells Cluster\n")
-            # reset grid to fresh state
-            game.grid = genRandGrid(dim, prob=args.frac)
-            grid = game.grid
-            if args.debug:
-                print("Grid reset. Time elapsed: " + str(timer() - start))
-            steps = args.simlength
-            if args.output < 3:
-                grid = run_GPU(game.grid, game.adjGrid, steps, args.delay, 0,
-                               args.visible, -1)
-            else:
-                for step in range(steps//args.sample + 1):
-                    if args.debug:
-                        print("Step = " + str(step) + " Time elapsed: " + str(timer() - start))
-                    # output data to file
-                    outfile_steps.writelines(str(step * args.sample) + "    " + str(countLiveCells(grid)) + "    " + str(cluster(grid, game.adjGrid)) + "\n")
-                    # step once
-                    grid = run_GPU(game.grid, game.adjGrid, args.sample, args.delay, 0, args.visible, -1)
-                    game.grid = grid
-                    # make file, and output grid to that file
-                    if args.output >= 4:
-                        outfile_grids = open(args.outfile + folder + "data4/" + "swc=" + strswc + "_sim=" + str(sim) + "_step=" + str(step * args.sample) + datestr + ".txt", "w")
-                        printGrid(grid, -1, grid.shape, outfile_grids)
-                        outfile_grids.close()
-
-                outfile_steps.close()
+                for sim in range(args.niters):
+                    writeSteps(strswc, sim, metrics[sim], cycles[sim] if cycleWindow > 0 else None)
+        elif args.ensemble:
+            seedUnit(seed, swcIndex, 0)
+            livecells, cl = runEnsemble(game.adjGrid, dim, strswc, simBackend, start)
+        else:
+            # these will be arrays of the values for every simulation
+            livecells = np.zeros(args.niters)
+            cl = np.zeros(args.niters)
+            firstSim = 0
+            inFlight = None
+            if resumed:
+                livecells, cl, cycles = checkpoint["livecells"], checkpoint["cl"], checkpoint["cycles"]
+                firstSim = checkpoint["sim"]
+                inFlight = checkpoint["inFlight"]
+            # run the simulation on this many different, random grids
+            for sim in range(firstSim, args.niters):
+                if args.debug:
+                    print("Sim = " + str(sim) + ". Time elapsed: " + str(timer() - start))
+                step = 0
+                metrics = []
+                if inFlight is not None:
+                    # pick the simulation up where the checkpoint left it
+                    game.grid, step, metrics = inFlight["grid"], inFlight["step"], inFlight["metrics"]
+                    inFlight = None
+                else:
+                    # reset grid to fresh state, seeded as the workers of
+                    # --workers do, so the results are the same with them
+                    seedUnit(seed, swcIndex, sim)
+                    game.grid = genRandGrid(dim, prob=args.frac)
+                grid = game.grid
+                if args.debug:
+                    print("Grid reset. Time elapsed: " + str(timer() - start))
+                steps = args.simlength
+                cycleInfo = {}
 
-            if args.debug:
-                print("Simulation finished. Time elapsed: " + str(timer() - start))
+                def saveInFlight(step, grid):
+                    checkpointer.maybeSave(lambda: state(swcIndex, sim, livecells, cl, cycles, game.adjGrid,
+                                                         {"grid": grid, "step": step, "metrics": list(metrics)}))
 
-            livecells[sim] = countLiveCells(grid)
-            cl[sim] = cluster(grid, game.adjGrid)
-            
-            if args.debug:
-                print("Finished computing live cells and clustering. Time elapsed: " + str(timer() - start))
+                # a simulation with nothing to show is run in chunks, so it
+                # can be checkpointed along the way (but cycle detection needs
+                # a single run)
+                chunked = cycleWindow == 0 and args.visible == -1 and args.delay == 0 and args.checkpoint > 0
+                if args.output < 3 and chunked:
+                    grid = runChunked(game.grid, game.adjGrid, steps, simBackend, step=step, onChunk=saveInFlight)
+                elif args.output < 3:
+                    grid = run_GPU(game.grid, game.adjGrid, steps, args.delay, 0,
+                                   args.visible, -1, simBackend, cycleWindow=cycleWindow, cycleInfo=cycleInfo)
+                elif args.output == 3 and chunked:
+                    grid = runChunked(game.grid, game.adjGrid, (steps//args.sample + 1) * args.sample, simBackend,
+                                      args.sample, metrics, step, saveInFlight)
+                elif args.output == 3:
+                    # live cells and cluster come out of the evolve pass every
+                    # sample steps, so the whole simulation is a single run
+                    grid = run_GPU(game.grid, game.adjGrid, (steps//args.sample + 1) * args.sample, args.delay, 0,
+                                   args.visible, -1, simBackend, args.sample, metrics, cycleWindow, cycleInfo)
+                cycles[sim] = cycleInfo.get("transient", -1), cycleInfo.get("period", -1)
+                if args.output == 3:
+                    writeSteps(strswc, sim, metrics, cycles[sim] if cycleWindow > 0 else None)
+                elif args.output >= 4:
+                    # every sampled grid goes into one binary file
+                    outfile_grids = TrajectoryWriter(trajectoryPath(strswc, sim), game.grid.shape)
+                    # live cell count and cluster every sampled step
+                    stepMetrics = []
+                    for step in range(steps//args.sample + 1):
+                        if args.debug:
+                            print("Step = " + str(step) + " Time elapsed: " + str(timer() - start))
+                        # step once, getting the values for the grid before the step
+                        metrics = []
+                        grid = run_GPU(game.grid, game.adjGrid, args.sample, args.delay, 0, args.visible, -1, simBackend,
+                                       args.sample, metrics)
+                        game.grid = grid
+                        stepMetrics.append((step * args.sample,) + tuple(metrics[0][1:]))
+                        # output grid to the trajectory file
+                        outfile_grids.append(step * args.sample, grid)
+
+                    outfile_grids.close()
+                    writeSteps(strswc, sim, stepMetrics)
+
+                if args.debug:
+                    if cycles[sim][1] != -1:
+                        print("Cycle of period " + str(cycles[sim][1]) + " from step " + str(cycles[sim][0]) + ".")
+                    print("Simulation finished. Time elapsed: " + str(timer() - start))
+
+                livecells[sim] = countLiveCells(grid)
+                cl[sim] = cluster(grid, game.adjGrid)
+
+                if args.debug:
+                    print("Finished computing live cells and clustering. Time elapsed: " + str(timer() - start))
+
+                if sim + 1 < args.niters:
+                    checkpointer.maybeSave(lambda: state(swcIndex, sim + 1, livecells, cl, cycles, game.adjGrid))
 
         avglc = round(np.mean(livecells), 3)
         avgcl = round(np.mean(cl), 6)
         stdlc = round(np.std(livecells), 3)
         stdcl = round(np.std(cl), 6)
-        if args.output >= 1:
-            outfile_avg.writelines(strswc + "    " + str(avglc) + "    " + str(stdlc) + "    " + str(avgcl) + "    " + str(stdcl) + "\n")
+        if args.output >= 1 and results is not None:
+            results.addSwc(float(strswc), avglc, stdlc, avgcl, stdcl)
+        elif args.output >= 1:
+            writer.write(outfile_avg, strswc + "    " + str(avglc) + "    " + str(stdlc) + "    " + str(avgcl) + "    " + str(stdcl) + "\n")
 
         # make and output file of range of different final values in
         # simulations
-        if args.output >= 2:
-            outfile_final = open(args.outfile + folder + "data2/" + "swc=" + strswc + datestr + ".txt", "w")
-            outfile_final.writelines("Run  LiveCells  Cluster\n")
+        if args.output >= 2 and results is not None:
+            results.addSims(float(strswc), livecells, cl, cycles if cycleWindow > 0 else None)
+        elif args.output >= 2:
+            outfile_final = args.outfile + folder + "data2/" + "swc=" + strswc + datestr + ".txt"
+            if cycleWindow > 0:
+                lines = ["Run  LiveCells  Cluster  Transient  Period\n"]
+            else:
+                lines = ["Run  LiveCells  Cluster\n"]
             for i in range(len(livecells)):
-                outfile_final.writelines(str(i) + "    " + str(livecells[i]) + "    " + str(round(cl[i], 6)) + "\n")
-            outfile_final.close()
-        swc += args.stepswc
+                line = str(i) + "    " + str(livecells[i]) + "    " + str(round(cl[i], 6))
+                if cycleWindow > 0:
+                    line += "    " + str(cycles[i][0]) + "    " + str(cycles[i][1])
+                lines.append(line + "\n")
+            writer.write(outfile_final, "".join(lines))
+            writer.closeFile(outfile_final)
+        checkpointer.maybeSave(lambda: state(swcIndex + 1))
 
         if args.debug:
-            print("Finished outputting everything to files. Time elapsed: " + str(timer() - start))
+            print("Finished queueing everything for output. Time elapsed: " + str(timer() - start))
 
-    outfile_avg.close()
+    writer.close()
+    if results is not None:
+        results.close()
+    # the sweep is complete; nothing to resume
+    checkpointer.finish()
+    if writer.stalls > 0:
+        print("Output could not keep up: the simulations waited on it " + str(writer.stalls) + " times, for " +
+              str(round(writer.stallTime, 3)) + " seconds in all.")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,207 @@
+""" Out-of-core simulations, for grids and adjacency too big for memory.
+
+    Grids are kept in .npy files opened with np.memmap (see createGrid and
+    openGrid), and the adjacency as a CSRGraph whose indptr and indices are
+    memory-mapped .npy files in a directory (dim.npy, indptr.npy and
+    indices.npy, the same layout as an adjcache.AdjCache entry). A torus is
+    built straight to disk a tile at a time (see torusGraph); any other
+    CSRGraph can be written with saveGraph and opened with openGraph. A
+    65536x65536 torus then takes a 4 GiB grid file and about 275 GB of
+    adjacency, instead of a padded adjacency grid of more than a terabyte
+    in memory.
+
+    TiledEvolver evolves such a grid a tile of rows at a time, in order.
+    For each tile it reads the tile's neighbor lists, the grid rows of the
+    tile and its halo (the rows just above and below, wrapping around), and
+    the cells of far-away rewired neighbors, on a background thread while
+    the tile before is computed, so the disk and the CPU are busy at the
+    same time. Only a tile's worth of data is ever in memory. """
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from csrgraph import CSRGraph, indexDtype
+from gameoflife import dirsFromNums
+
+# memory a tile may take while it is evolved (its neighbor lists and the
+# temporary arrays built from them)
+TILE_BYTES = 64 * 2**20
+# bytes of temporaries per neighbor of a tile
+BYTES_PER_NEIGHBOR = 32
+
+
+def createGrid(path, dim):
+    """ Creates a zeroed int8 grid for dimension dim (with its dead last row
+        and column) in the .npy file path, and returns it memory-mapped. """
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.int8,
+                                     shape=tuple(int(d) + 1 for d in dim))
+
+def openGrid(path, mode="r+"):
+    """ Opens the grid in the .npy file path, memory-mapped. """
+    return np.load(path, mmap_mode=mode)
+
+def tempGrid(shape, directory=None):
+    """ Returns a zeroed, memory-mapped int8 grid of the given shape in a
+        temporary file in directory (by default the system's). The file is
+        removed right away; its space is freed once the grid is. """
+    fd, path = tempfile.mkstemp(suffix=".grid", dir=directory)
+    os.close(fd)
+    grid = np.memmap(path, dtype=np.int8, mode="w+", shape=tuple(shape))
+    try:
+        os.unlink(path)
+    except OSError:
+        # the file cannot be removed while mapped on some systems
+        pass
+    return grid
+
+def rowTiles(rows, tileRows):
+    """ Returns (lo, hi) for every tile of tileRows rows, in order. """
+    return [(lo, min(lo + tileRows, rows)) for lo in range(0, rows, tileRows)]
+
+def randomGrid(path, dim, prob=0.5, tileRows=1024):
+    """ Like genRandGrid, but writes the grid to the .npy file path a tile of
+        rows at a time. Returns it memory-mapped. """
+    grid = createGrid(path, dim)
+    for lo, hi in rowTiles(int(dim[0]), tileRows):
+        grid[lo:hi, 0:int(dim[1])] = np.random.random((hi - lo, int(dim[1]))) \
+            < prob
+    grid.flush()
+    return grid
+
+
+def saveGraph(graph, directory):
+    """ Writes a CSRGraph to directory (see the module docstring). """
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "dim.npy"), np.asarray(graph.dim))
+    np.save(os.path.join(directory, "indptr.npy"), graph.indptr)
+    np.save(os.path.join(directory, "indices.npy"), graph.indices)
+
+def openGraph(directory, mode="r"):
+    """ Opens the CSRGraph in directory, with its arrays memory-mapped. """
+    return CSRGraph(np.load(os.path.join(directory, "dim.npy")),
+                    np.load(os.path.join(directory, "indptr.npy"),
+                            mmap_mode=mode),
+                    np.load(os.path.join(directory, "indices.npy"),
+                            mmap_mode=mode))
+
+def torusGraph(directory, dim, tileRows=1024):
+    """ Builds the CSRGraph of a 2D torus of dimension dim in directory, a
+        tile of rows at a time, and returns it memory-mapped. It is the same
+        graph as CSRGraph.fromAdjGrid(initAdjGrid(torusAdjFunc, dim, 1)),
+        but never has more than a tile in memory. """
+    rows, cols = int(dim[0]), int(dim[1])
+    dirs = dirsFromNums(2)
+    degree = len(dirs)
+    numVertices = rows * cols
+    dtype = indexDtype(numVertices)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "dim.npy"), np.array([rows, cols]))
+    indptr = np.lib.format.open_memmap(os.path.join(directory, "indptr.npy"),
+                                       mode="w+", dtype=np.int64,
+                                       shape=(numVertices + 1,))
+    indices = np.lib.format.open_memmap(
+        os.path.join(directory, "indices.npy"), mode="w+", dtype=dtype,
+        shape=(numVertices * degree,))
+    colIndex = np.arange(cols, dtype=np.int64)
+    for lo, hi in rowTiles(rows, tileRows):
+        rowIndex = np.arange(lo, hi, dtype=np.int64)
+        indptr[lo*cols:hi*cols] = np.arange(lo*cols, hi*cols,
+                                            dtype=np.int64) * degree
+        neighborRows = (rowIndex[:, None, None] + dirs[:, 0]) % rows
+        neighborCols = (colIndex[None, :, None] + dirs[:, 1]) % cols
+        indices[lo*cols*degree:hi*cols*degree] = \
+            (neighborRows * cols + neighborCols).ravel()
+    indptr[numVertices] = numVertices * degree
+    indptr.flush()
+    indices.flush()
+    return openGraph(directory)
+
+
+class TiledEvolver:
+    """ Evolves grids (memory-mapped or not) through a CSRGraph (whose
+        arrays may be memory-mapped) a tile of rows at a time, as described
+        in the module docstring. By default, tiles hold about TILE_BYTES of
+        neighbor lists; if prefetch, the next tile is read on a background
+        thread while the last one is computed. """
+    def __init__(self, graph, tileRows=None, prefetch=True):
+        self.graph = graph
+        self.rows, self.cols = int(graph.dim[0]), int(graph.dim[1])
+        if tileRows is None:
+            degree = max(graph.numEdges / max(graph.numVertices, 1), 1)
+            tileRows = int(TILE_BYTES / (BYTES_PER_NEIGHBOR * degree *
+                                         max(self.cols, 1)))
+        self.tiles = rowTiles(self.rows, max(tileRows, 1))
+        self.pool = ThreadPoolExecutor(1) if prefetch else None
+
+    def load(self, grid, lo, hi):
+        """ Reads everything tile lo:hi of grid needs into memory. Returns
+            the tile's indptr (starting at 0), the states of all of its
+            cells' neighbors (in neighbor list order), and its own states. """
+        rows, cols = self.rows, self.cols
+        first, last = lo * cols, hi * cols
+        indptr = np.array(self.graph.indptr[first:last + 1], dtype=np.int64)
+        start = indptr[0]
+        indptr -= start
+        neighbors = np.array(self.graph.indices[start:start + indptr[-1]],
+                             dtype=np.int64)
+        # the tile and its halo rows (above and below, wrapping), which hold
+        # every neighbor of an unmodified torus
+        numWindow = min(hi - lo + 2, rows)
+        window = np.ascontiguousarray(
+            grid[(lo - 1 + np.arange(numWindow)) % rows, 0:cols])
+        # flat position in the window, which is in it if small enough
+        position = neighbors - (lo - 1) * cols
+        position %= rows * cols
+        inWindow = position < numWindow * cols
+        values = np.take(window.reshape(-1), np.where(inWindow, position, 0))
+        far = ~inWindow
+        if far.any():
+            # rewired edges to other tiles; read in file order, skipping
+            # the dead column
+            flat = neighbors[far]
+            flat += flat // cols
+            order = np.argsort(flat)
+            farValues = np.empty(len(flat), dtype=np.int8)
+            farValues[order] = grid.reshape(-1)[flat[order]]
+            values[far] = farValues
+        own = window[(np.arange(lo, hi) - lo + 1) % rows]
+        return indptr, values, own
+
+    def evolveTile(self, tile, newGrid, lo, hi, metrics):
+        """ Writes the next generation of a loaded tile into rows lo:hi of
+            newGrid; returns (live, matches, total) if metrics. """
+        indptr, values, own = tile
+        running = np.zeros(len(values) + 1, dtype=np.int32)
+        np.cumsum(values, dtype=np.int32, out=running[1:])
+        numAlive = (running[indptr[1:]] - running[indptr[0:-1]]).reshape(
+            own.shape)
+        alive = own == 1
+        newGrid[lo:hi, 0:self.cols] = (numAlive == 3) | \
+            ((numAlive == 2) & alive)
+        if metrics:
+            degrees = np.diff(indptr).reshape(own.shape)
+            return (int(np.count_nonzero(alive)), int(numAlive[alive].sum()),
+                    int(degrees[alive].sum()))
+
+    def evolve(self, grid, newGrid, metrics=False):
+        """ Writes the next generation of grid into newGrid (every real cell
+            is written). If metrics, returns (live, matches, total) for
+            grid, as evolve2DMetrics does. """
+        counts = [0, 0, 0]
+        pending = None
+        for i, (lo, hi) in enumerate(self.tiles):
+            if self.pool is None:
+                tile = self.load(grid, lo, hi)
+            else:
+                if pending is None:
+                    pending = self.pool.submit(self.load, grid, lo, hi)
+                tile = pending.result()
+                pending = None
+                if i + 1 < len(self.tiles):
+                    pending = self.pool.submit(self.load, grid,
+                                               *self.tiles[i + 1])
+            result = self.evolveTile(tile, newGrid, lo, hi, metrics)
+            if metrics:
+                counts = [a + b for a, b in zip(counts, result)]
+        if metrics:
+            return tuple(counts)
@@ -0,0 +1,297 @@
+""" Domain decomposition of a single simulation across processes.
+
+    The grid is split into bands of rows, one per worker process. Every
+    grid lives in multiprocessing shared memory (a SharedGrid), so each
+    worker reads and writes its own band in place. Before every generation,
+    a worker gathers the cells of other bands that its cells have as
+    neighbors into a private buffer: the halo rows above and below its band
+    (the torus edges) and the far ends of rewired small-world edges that
+    cross into another band. Which cells these are is worked out once per
+    adjacency grid (see bandPlan), so a generation is a gather, a sum over
+    the band's neighbor lists (renumbered to point into the band and its
+    gathered cells, so they stay in cache), and a barrier. A whole run of
+    generations is a single command to the workers.
+
+    When there is only one band, or processes cannot be started (as in the
+    daemonic workers of a --workers sweep), the bands are run one after
+    another in the calling process. """
+import atexit
+import multiprocessing
+import traceback
+import numpy as np
+from multiprocessing.shared_memory import SharedMemory
+from csrgraph import CSRGraph
+from incremental import sortedUnique
+
+# shared grids a worker keeps attached (the two a run evolves between, and
+# a few more)
+MAX_ATTACHED = 8
+
+
+class SharedGrid:
+    """ An int8 grid (with its dead last row and column) in a block of
+        shared memory, which the workers attach to by name. The block is
+        freed once the SharedGrid is garbage collected. """
+    def __init__(self, shape):
+        self.shape = tuple(int(d) for d in shape)
+        self.shm = SharedMemory(create=True,
+                                size=max(int(np.prod(self.shape)), 1))
+        self.name = self.shm.name
+        self.array = np.ndarray(self.shape, np.int8, buffer=self.shm.buf)
+        self.array[...] = 0
+
+    @classmethod
+    def fromGrid(cls, grid):
+        shared = cls(grid.shape)
+        shared.array[...] = grid
+        return shared
+
+    def toGrid(self):
+        return self.array.copy()
+
+    def __del__(self):
+        shm = getattr(self, "shm", None)
+        if shm is not None:
+            self.array = None
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                shm.close()
+            except BufferError:
+                # a view of the grid is still around; the block goes when
+                # the process exits
+                pass
+
+
+def bandBounds(rows, numBands):
+    """ Returns the numBands + 1 row boundaries of the bands. """
+    return np.linspace(0, rows, numBands + 1).astype(int)
+
+def bandPlan(graph, lo, hi):
+    """ Works out how to evolve rows lo:hi of a grid with adjacency graph (a
+        CSRGraph) as one band. Returns (lo, hi, indptr, indices, gather):
+        the neighbors of the band's cells, numbered so that the band's own
+        cells come first (in flat order) and then the cells of other bands
+        they need; gather holds the flat indices of those other cells in the
+        padded grid (with its dead last column), in increasing order. """
+    cols = int(graph.dim[1])
+    first, last = lo * cols, hi * cols
+    start, stop = graph.indptr[first], graph.indptr[last]
+    indptr = graph.indptr[first:last + 1] - start
+    neighbors = np.asarray(graph.indices[start:stop], dtype=np.int64)
+    remote = (neighbors < first) | (neighbors >= last)
+    # the halo rows and the far ends of rewired edges
+    outside = sortedUnique(neighbors[remote])
+    indices = neighbors - first
+    indices[remote] = (last - first) + np.searchsorted(outside,
+                                                       neighbors[remote])
+    gather = (outside // cols) * (cols + 1) + outside % cols
+    return lo, hi, indptr, indices.astype(np.int32), gather
+
+
+class Band:
+    """ Evolves one band of rows, as laid out by bandPlan, with buffers
+        allocated once. """
+    def __init__(self, plan):
+        self.lo, self.hi, self.indptr, self.indices, self.gather = plan
+        self.numLocal = len(self.indptr) - 1
+        self.values = np.zeros(self.numLocal + len(self.gather), dtype=np.int8)
+        self.taken = np.empty(len(self.indices), dtype=np.int8)
+        self.running = np.zeros(len(self.indices) + 1, dtype=np.int32)
+        self.degrees = np.diff(self.indptr)
+
+    def evolve(self, grid, newGrid, metrics=False):
+        """ Writes the next generation of the band of grid into newGrid
+            (every real cell of the band is written). If metrics, returns
+            (live, matches, total) for the band of grid. """
+        cols = grid.shape[1] - 1
+        band = grid[self.lo:self.hi, 0:cols]
+        self.values[0:self.numLocal] = band.ravel()
+        # halo exchange: read the cells of other bands straight out of the
+        # shared grid
+        np.take(grid.ravel(), self.gather, out=self.values[self.numLocal:])
+        np.take(self.values, self.indices, out=self.taken)
+        np.cumsum(self.taken, dtype=np.int32, out=self.running[1:])
+        numAlive = (self.running[self.indptr[1:]] -
+                    self.running[self.indptr[0:-1]]).reshape(band.shape)
+        alive = band == 1
+        newGrid[self.lo:self.hi, 0:cols] = (numAlive == 3) | \
+            ((numAlive == 2) & alive)
+        if metrics:
+            return (int(np.count_nonzero(alive)), int(numAlive[alive].sum()),
+                    int(self.degrees[alive.ravel()].sum()))
+
+    def run(self, grids, steps, metrics, barrier=None):
+        """ Evolves the band from grids[0] for steps generations, writing
+            generation i into grids[1] if i is odd and grids[2] otherwise
+            (so the final generation is in grids[1] or grids[2]). barrier is
+            waited on between generations, so no band reads a grid another
+            band is still writing. Returns the metrics of the first
+            generation if metrics. """
+        counts = None
+        src = grids[0]
+        for step in range(steps):
+            dst = grids[1] if step % 2 == 0 else grids[2]
+            result = self.evolve(src, dst, metrics and step == 0)
+            if step == 0:
+                counts = result
+            if barrier is not None and step < steps - 1:
+                barrier.wait()
+            src = dst
+        return counts
+
+
+def workerLoop(connection, barrier):
+    """ A worker process: runs commands from connection until it is told to
+        stop. ("plan", plan) sets its band; ("run", names, steps, metrics)
+        runs it (see Band.run) on the shared grids with those names, and
+        replies with the metrics, or ("error", text) if it failed. """
+    band = None
+    attached = {}
+    while True:
+        command = connection.recv()
+        if command[0] == "stop":
+            break
+        try:
+            if command[0] == "plan":
+                band = Band(command[1])
+                connection.send(None)
+                continue
+            _, names, steps, metrics, shape = command
+            grids = []
+            for name in names:
+                if name is None:
+                    grids.append(None)
+                    continue
+                if name not in attached:
+                    # let go of the least recently used grids that are not
+                    # part of this run
+                    unused = [key for key in attached if key not in names]
+                    for oldName in unused[0:len(attached) + 1 - MAX_ATTACHED]:
+                        attached.pop(oldName)[0].close()
+                    shm = SharedMemory(name=name)
+                    attached[name] = (shm, np.ndarray(shape, np.int8,
+                                                      buffer=shm.buf))
+                # most recently used last
+                attached[name] = attached.pop(name)
+                grids.append(attached[name][1])
+            connection.send(band.run(grids, steps, metrics, barrier))
+        except Exception:
+            # let the other bands out of the barrier
+            barrier.abort()
+            connection.send(("error", traceback.format_exc()))
+    grids = None
+    for name in list(attached):
+        attached.pop(name)[0].close()
+
+
+class PartitionedEngine:
+    """ Runs one simulation in numBands bands of rows, each on its own
+        worker process (see the module docstring). """
+    def __init__(self, numBands):
+        self.numBands = max(int(numBands), 1)
+        self.processes = []
+        self.connections = []
+        self.bands = None
+        self.plans = None
+        self.adjKey = None
+        self.barrier = None
+
+    def start(self):
+        """ Starts the worker processes, unless they run in this process. """
+        if self.numBands == 1 or multiprocessing.current_process().daemon:
+            return
+        # fresh processes rather than forks: a fork taken while other
+        # threads (numba's, or the NumPy backend's pool) hold locks can hang
+        context = multiprocessing.get_context("spawn")
+        self.barrier = context.Barrier(self.numBands)
+        for _ in range(self.numBands):
+            parent, child = context.Pipe()
+            process = context.Process(target=workerLoop,
+                                      args=(child, self.barrier), daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.connections.append(parent)
+        atexit.register(self.stop)
+
+    def stop(self):
+        for connection in self.connections:
+            try:
+                connection.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.connections = []
+
+    def load(self, adjGrid, key):
+        """ Splits adjGrid (padded or CSRGraph) into bands, unless the one
+            loaded last had the same key. """
+        if key == self.adjKey:
+            return
+        graph = adjGrid if isinstance(adjGrid, CSRGraph) else \
+            CSRGraph.fromAdjGrid(adjGrid)
+        rows = int(graph.dim[0])
+        bounds = bandBounds(rows, min(self.numBands, rows))
+        self.plans = [bandPlan(graph, bounds[i], bounds[i+1])
+                      for i in range(len(bounds) - 1)]
+        if len(self.processes) == 0 and len(self.connections) == 0:
+            self.start()
+        if len(self.processes) > 0:
+            # bands with no rows still wait on the barrier
+            empty = (rows, rows, np.zeros(1, dtype=np.int64),
+                     np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64))
+            plans = self.plans + [empty] * (self.numBands - len(self.plans))
+            for connection, plan in zip(self.connections, plans):
+                connection.send(("plan", plan))
+            for connection in self.connections:
+                connection.recv()
+        else:
+            self.bands = [Band(plan) for plan in self.plans]
+        self.adjKey = key
+
+    def run(self, grid, newGrid, spare, steps, metrics=False):
+        """ Evolves the SharedGrid grid by steps generations, into newGrid
+            and spare in turn (see Band.run). Returns the SharedGrid holding
+            the final generation, and the (live, matches, total) of grid if
+            metrics. """
+        final = newGrid if steps % 2 == 1 else spare
+        if steps == 0:
+            return grid, None
+        if len(self.processes) == 0:
+            arrays = [grid.array, newGrid.array,
+                      None if spare is None else spare.array]
+            # without a barrier, every band must finish a generation before
+            # the next one starts
+            counts = []
+            for step in range(steps):
+                src = arrays[0] if step == 0 else \
+                    (arrays[1] if step % 2 == 1 else arrays[2])
+                dst = arrays[1] if step % 2 == 0 else arrays[2]
+                for band in self.bands:
+                    result = band.evolve(src, dst, metrics and step == 0)
+                    if result is not None:
+                        counts.append(result)
+            return final, self.sumCounts(counts) if metrics else None
+        names = [grid.name, newGrid.name, None if spare is None else spare.name]
+        for connection in self.connections:
+            connection.send(("run", names, steps, metrics, grid.shape))
+        replies = [connection.recv() for connection in self.connections]
+        errors = [reply[1] for reply in replies
+                  if isinstance(reply, tuple) and len(reply) == 2 and
+                  reply[0] == "error"]
+        if errors:
+            self.barrier.reset()
+            raise RuntimeError("A partition failed:\n" + errors[0])
+        if metrics:
+            return final, self.sumCounts([reply for reply in replies
+                                          if reply is not None])
+        return final, None
+
+    @staticmethod
+    def sumCounts(counts):
+        return tuple(int(sum(count)) for count in zip(*counts)) \
+            if counts else (0, 0, 0)
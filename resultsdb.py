@@ -0,0 +1,188 @@
+""" SQLite results database for sweeps.
+
+    Instead of a folder of text files whose names encode the parameters,
+    every run of main.py can be recorded in one database file, with a table
+    for each level of output:
+
+        runs    one row per run: its parameters, seed and start time
+        swcs    output 1: the averages over the simulations of each swc
+        sims    output 2: the final live cells and cluster of every
+                simulation (and its transient and period, with --cycles)
+        steps   output 3: the live cells and cluster of every sampled step
+
+    Rows are buffered and appended in batches, in one transaction each.
+    Many runs can share a database, so sweeps can be compared with a single
+    query (see ResultsDB.query and ResultsDB.swcSummary). """
+import sqlite3
+
+# parameters of a run, as (column, SQL type)
+RUN_COLUMNS = [("started", "TEXT"), ("frac", "REAL"), ("rows", "INTEGER"),
+               ("cols", "INTEGER"), ("extraspace", "INTEGER"),
+               ("niters", "INTEGER"), ("simlength", "INTEGER"),
+               ("sample", "INTEGER"), ("replace", "INTEGER"),
+               ("heterogeneity", "REAL"), ("backend", "TEXT"),
+               ("seed", "INTEGER")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, """ + ", ".join(
+        name + " " + kind for name, kind in RUN_COLUMNS) + """);
+CREATE TABLE IF NOT EXISTS swcs (
+    run INTEGER, swc REAL, live REAL, liveStd REAL, cluster REAL,
+    clusterStd REAL);
+CREATE TABLE IF NOT EXISTS sims (
+    run INTEGER, swc REAL, sim INTEGER, live REAL, cluster REAL,
+    transient INTEGER, period INTEGER);
+CREATE TABLE IF NOT EXISTS steps (
+    run INTEGER, swc REAL, sim INTEGER, step INTEGER, live INTEGER,
+    cluster REAL);
+CREATE INDEX IF NOT EXISTS swcsIndex ON swcs (run, swc);
+CREATE INDEX IF NOT EXISTS simsIndex ON sims (run, swc, sim);
+CREATE INDEX IF NOT EXISTS stepsIndex ON steps (run, swc, sim, step);
+"""
+
+# columns of each table after run, in insertion order
+TABLES = {"swcs": ["swc", "live", "liveStd", "cluster", "clusterStd"],
+          "sims": ["swc", "sim", "live", "cluster", "transient", "period"],
+          "steps": ["swc", "sim", "step", "live", "cluster"]}
+
+
+class ResultsDB:
+    """ A results database at path (created if needed). Rows added with
+        addSwc, addSims and addSteps belong to the run started by startRun,
+        and are written once batchSize of them are waiting, or on flush and
+        close. """
+    def __init__(self, path, batchSize=10000):
+        self.connection = sqlite3.connect(path)
+        # readers (such as an analysis in another process) do not block
+        # the appends of a running sweep
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.batchSize = batchSize
+        self.pending = {table: [] for table in TABLES}
+        self.numPending = 0
+        self.run = None
+
+    def startRun(self, **params):
+        """ Records a new run with the given parameters (see RUN_COLUMNS),
+            which the rows added from now on belong to. Returns its id. """
+        self.flush()
+        unknown = set(params) - set(name for name, _ in RUN_COLUMNS)
+        if unknown:
+            raise ValueError("Unknown run parameters: " +
+                             ", ".join(sorted(unknown)))
+        names = list(params)
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (" + ", ".join(names) + ") VALUES (" +
+                ", ".join("?" * len(names)) + ")",
+                [params[name] for name in names])
+        self.run = cursor.lastrowid
+        return self.run
+
+    def resumeRun(self, run, swc, sim=0):
+        """ Makes the rows added from now on belong to the existing run with
+            id run, which is resumed (from a checkpoint) at simulation sim of
+            swc. Rows for that simulation and after, added before the run
+            stopped, are removed, as they will be added again. """
+        self.flush()
+        self.run = run
+        # swcs come in increasing order; allow for rounding
+        lo = swc - 0.0000000001
+        hi = swc + 0.0000000001
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM swcs WHERE run = ? AND swc >= ?", (run, lo))
+            self.connection.execute(
+                "DELETE FROM sims WHERE run = ? AND swc >= ?", (run, lo))
+            self.connection.execute(
+                "DELETE FROM steps WHERE run = ? AND (swc > ? OR "
+                "(swc >= ? AND sim >= ?))", (run, hi, lo, sim))
+
+    def add(self, table, rows):
+        """ Buffers rows (tuples of the columns in TABLES[table]) for the
+            current run. """
+        if self.run is None:
+            raise ValueError("No run has been started.")
+        self.pending[table].extend((self.run,) + tuple(row) for row in rows)
+        self.numPending += len(rows)
+        if self.numPending >= self.batchSize:
+            self.flush()
+
+    def addSwc(self, swc, live, liveStd, cluster, clusterStd):
+        """ Adds the averages over the simulations of one swc. """
+        self.add("swcs", [(swc, live, liveStd, cluster, clusterStd)])
+
+    def addSims(self, swc, livecells, cl, cycles=None):
+        """ Adds the final live cells and cluster of every simulation of one
+            swc, and their (transient, period) if cycles were detected. """
+        if cycles is None:
+            cycles = [(None, None)] * len(livecells)
+        self.add("sims", [(swc, sim, float(livecells[sim]), float(cl[sim]),
+                           _int(cycles[sim][0]), _int(cycles[sim][1]))
+                          for sim in range(len(livecells))])
+
+    def addSteps(self, swc, sim, steps):
+        """ Adds the (step, live, cluster) of every sampled step of one
+            simulation. """
+        self.add("steps", [(swc, sim, int(step), int(live), float(cl))
+                           for step, live, cl in steps])
+
+    def flush(self):
+        """ Writes every buffered row, in a single transaction. """
+        if self.numPending == 0:
+            return
+        with self.connection:
+            for table, rows in self.pending.items():
+                if len(rows) > 0:
+                    self.connection.executemany(
+                        "INSERT INTO " + table + " VALUES (" +
+                        ", ".join("?" * (len(TABLES[table]) + 1)) + ")",
+                        rows)
+                    self.pending[table] = []
+        self.numPending = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def query(self, sql, params=()):
+        """ Runs an SQL query on the database, returning every row. Buffered
+            rows are written first. """
+        self.flush()
+        return self.connection.execute(sql, params).fetchall()
+
+    def swcSummary(self, **params):
+        """ Returns (swc, number of simulations, mean live cells, std, mean
+            cluster, std) for every swc, over every simulation of every run
+            with the given parameters (e.g. rows=64, heterogeneity=0.5). """
+        names = set(name for name, _ in RUN_COLUMNS) | {"id"}
+        unknown = set(params) - names
+        if unknown:
+            raise ValueError("Unknown run parameters: " +
+                             ", ".join(sorted(unknown)))
+        where = " AND ".join("runs." + name + " = ?" for name in params)
+        rows = self.query(
+            "SELECT sims.swc, COUNT(*), AVG(sims.live), "
+            "AVG(sims.live * sims.live), AVG(sims.cluster), "
+            "AVG(sims.cluster * sims.cluster) "
+            "FROM sims JOIN runs ON sims.run = runs.id" +
+            (" WHERE " + where if where else "") +
+            " GROUP BY sims.swc ORDER BY sims.swc",
+            [params[name] for name in params])
+        # population standard deviations, as in data1
+        return [(swc, n, live, _std(live, live2), cl, _std(cl, cl2))
+                for swc, n, live, live2, cl, cl2 in rows]
+
+
+def _int(value):
+    return None if value is None or value < 0 else int(value)
+
+def _std(mean, meanSquare):
+    return max(meanSquare - mean * mean, 0.0) ** 0.5
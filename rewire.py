@@ -0,0 +1,317 @@
+""" Vectorized rewiring of padded adjacency grids, for smallWorldIfy and
+    smallWorldIfyHeterogeneous.
+
+    Instead of scanning the slots of a cell for a blank one (or for an edge
+    to remove) once per rewired edge, the grid is viewed as a table of slot
+    targets: the flat index of the neighbor in every slot, or numVertices
+    for a blank slot. All random decisions are drawn at once; the existing
+    edges are kept as a sorted set of edge keys, and every cell's free
+    slots are counted up front, so new edges are placed in a few array
+    operations. A new edge that does not fit (both of its cells need a
+    slot) is dropped, and the edge it was to replace is kept; the
+    number of dropped edges is returned rather than printed. """
+import numpy as np
+from csrgraph import CSRGraph, edgeKeys, randOtherVertex, randNewEdges, \
+    stableArgsort, forgetTopology, indexDtype
+
+
+def slotTargets(adjGrid):
+    """ Returns the flat index of the neighbor in every slot of adjGrid, as
+        an array of shape (numVertices, numSlots) (see indexDtype). Blank
+        slots hold numVertices. """
+    ldim = len(adjGrid.shape) - 2
+    dim = adjGrid.shape[0:ldim]
+    numVertices = int(np.prod(dim))
+    slots = adjGrid.reshape(numVertices, adjGrid.shape[ldim], ldim)
+    targets = slots[..., 0].astype(indexDtype(numVertices))
+    for i in range(1, ldim):
+        targets *= dim[i]
+        targets += slots[..., i]
+    # a blank slot holds dim in every coordinate; a real one never does
+    targets[slots[..., 0] == dim[0]] = numVertices
+    return targets
+
+def setSlots(adjGrid, targets, vertices, slots, values):
+    """ Writes the flat indices values into the given slots of both adjGrid
+        and its slot table targets (numVertices writes a blank slot). """
+    ldim = len(adjGrid.shape) - 2
+    dim = adjGrid.shape[0:ldim]
+    numVertices = targets.shape[0]
+    forgetTopology(adjGrid)
+    flat = adjGrid.reshape(numVertices, adjGrid.shape[ldim], ldim)
+    blank = values == numVertices
+    rest = np.array(values, dtype=np.int64)
+    for i in reversed(range(ldim)):
+        coord = rest % dim[i]
+        rest //= dim[i]
+        # numVertices (a blank slot) becomes dim in every coordinate
+        coord[blank] = dim[i]
+        flat[vertices, slots, i] = coord
+    targets[vertices, slots] = values
+
+def slotOf(targets, vertices, neighbors):
+    """ Returns the slot of vertices[i] that holds neighbors[i] (the first
+        one, if there are several). """
+    numVertices, numSlots = targets.shape
+    rows, slots = np.nonzero(targets < numVertices)
+    # slots in order of their (vertex, neighbor) key
+    keys = rows.astype(np.int64) * numVertices + targets[rows, slots]
+    order = stableArgsort(keys)
+    keys = keys[order]
+    queries = np.asarray(vertices, dtype=np.int64) * numVertices + neighbors
+    queryOrder = np.argsort(queries)
+    found = np.empty(len(queries), dtype=np.int64)
+    found[queryOrder] = np.searchsorted(keys, queries[queryOrder])
+    return slots[order[found]]
+
+def occurrence(vertices):
+    """ Returns, for every entry, how many earlier entries hold the same
+        vertex. """
+    order = stableArgsort(vertices)
+    sortedVertices = vertices[order]
+    # where each run of equal vertices starts, for every entry of the run
+    starts = np.flatnonzero(np.concatenate(
+        ([True], sortedVertices[1:] != sortedVertices[0:-1])))
+    first = np.repeat(starts, np.diff(np.append(starts, len(vertices))))
+    rank = np.empty(len(vertices), dtype=np.int64)
+    rank[order] = np.arange(len(vertices)) - first
+    return rank
+
+def blankSlots(targets, vertices):
+    """ Returns blank slots for a list of requests for one blank slot each:
+        the k'th request for a vertex gets its k'th blank slot. Every
+        request must fit. """
+    numVertices = targets.shape[0]
+    numBlank = (targets == numVertices).sum(axis=1)
+    # every blank slot, grouped by cell, and where each cell's group starts
+    _, blank = np.nonzero(targets == numVertices)
+    start = np.concatenate(([0], np.cumsum(numBlank)[0:-1]))
+    return blank[start[vertices] + occurrence(vertices)]
+
+def fitEdges(targets, ends, freed):
+    """ Returns which edges fit in the slot table. Edge i needs a blank slot
+        at ends[k][i] for every k, and frees a slot at freed[k][i] for every
+        k (if it is placed). Edges are kept in order until a cell runs out
+        of slots; an edge that is dropped frees nothing, so dropping repeats
+        until every remaining edge fits. """
+    numVertices = targets.shape[0]
+    numBlank = (targets == numVertices).sum(axis=1)
+    numEdges = len(ends[0])
+    fits = np.ones(numEdges, dtype=bool)
+    while True:
+        idx = np.nonzero(fits)[0]
+        numFree = numBlank.copy()
+        for f in freed:
+            numFree += np.bincount(f[idx], minlength=numVertices)
+        requests = np.concatenate([e[idx] for e in ends])
+        ok = occurrence(requests) < numFree[requests]
+        ok = ok.reshape(len(ends), len(idx)).all(axis=0)
+        if ok.all():
+            return fits
+        fits[idx[~ok]] = False
+
+
+def undirectedSlots(targets):
+    """ Returns every undirected edge of the slot table once, as the cell
+        and slot holding it at its lower-numbered end. """
+    numVertices = targets.shape[0]
+    vertex = np.arange(numVertices)[:, None]
+    vertices, slots = np.nonzero(targets > vertex)
+    # blank slots hold numVertices, which is larger than every vertex
+    real = targets[vertices, slots] < numVertices
+    return vertices[real], slots[real]
+
+def spliceEdges(graph, removeSrc, removeDst, addSrc, addDst):
+    """ Removes the directed edges removeSrc[i] -> removeDst[i] from a
+        CSRGraph in place (the k'th removal of an edge takes its k'th copy),
+        and adds addSrc[i] -> addDst[i] at the end of their cells' neighbor
+        lists. Only the neighbor lists of removeSrc are searched, and the
+        arrays are rebuilt with a copy each, with no sorting. """
+    numVertices = graph.numVertices
+    indptr, indices = graph.indptr, graph.indices
+    removeSrc = np.asarray(removeSrc, dtype=np.int64)
+    removeDst = np.asarray(removeDst, dtype=np.int64)
+    addSrc = np.asarray(addSrc, dtype=np.int64)
+    # every entry of the neighbor lists of removeSrc, and its removal
+    lo = indptr[removeSrc]
+    lengths = indptr[removeSrc + 1] - lo
+    owner = np.repeat(np.arange(len(removeSrc)), lengths)
+    position = np.arange(int(lengths.sum())) + \
+        np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+    hit = indices[position] == removeDst[owner]
+    position, owner = position[hit], owner[hit]
+    want = occurrence(removeSrc * numVertices + removeDst)
+    keep = np.ones(len(indices), dtype=bool)
+    keep[position[occurrence(owner) == want[owner]]] = False
+    removed = np.bincount(removeSrc, minlength=numVertices)
+    added = np.bincount(addSrc, minlength=numVertices)
+    keptIndptr = indptr - np.concatenate(([0], np.cumsum(removed)))
+    order = stableArgsort(addSrc)
+    graph.indices = np.insert(indices[keep], keptIndptr[addSrc[order] + 1],
+                              np.asarray(addDst)[order]).astype(indices.dtype)
+    graph.indptr = keptIndptr + np.concatenate(([0], np.cumsum(added)))
+
+def rewire(adjGrid, jumpProb):
+    """ Vectorized smallWorldIfy: every undirected edge u <-> v is rewired,
+        with probability jumpProb, to u <-> a random vertex w. The slot of v
+        at u is reused, the slot of u at v is freed, and the edge back from
+        w takes a blank slot of w. Returns the number of edges that were
+        left alone because w had no slot left. """
+    targets = slotTargets(adjGrid)
+    numVertices = targets.shape[0]
+    vertices, slots = undirectedSlots(targets)
+    chosen = np.random.random(len(vertices)) < jumpProb
+    u = vertices[chosen]
+    uSlots = slots[chosen]
+    v = targets[u, uSlots]
+    w = randOtherVertex(numVertices, u)
+    fits = fitEdges(targets, [w], [v])
+    u, uSlots, v, w = u[fits], uSlots[fits], v[fits], w[fits]
+    # remove v -> u, then add u -> w and w -> u
+    blank = np.full(len(u), numVertices, dtype=targets.dtype)
+    setSlots(adjGrid, targets, v, slotOf(targets, v, u), blank)
+    setSlots(adjGrid, targets, u, uSlots, w)
+    setSlots(adjGrid, targets, w, blankSlots(targets, w), u)
+    return int(len(fits) - fits.sum())
+
+def rewireHeterogeneous(adjGrid, jumpProb, heterogeneity=0, replace=True,
+                        hubs=None):
+    """ Vectorized smallWorldIfyHeterogeneous: every undirected edge is
+        chosen with probability jumpProb, and for each one a new edge from
+        a random hub (a (1 - heterogeneity) fraction of the cells) to a
+        random cell is added, redrawing edges that already exist. If
+        replace, each chosen edge is removed, freeing its slots for the new
+        edges. hubs may give the flat indices of the hubs instead. Returns
+        the number of new edges that were dropped for lack of a slot (the
+        edge they were to replace is then kept). """
+    targets = slotTargets(adjGrid)
+    numVertices = targets.shape[0]
+    vertices, slots = undirectedSlots(targets)
+    chosen = np.random.random(len(vertices)) < jumpProb
+    if hubs is None:
+        numHubs = int((1 - heterogeneity) * numVertices)
+        hubs = np.random.choice(numVertices, numHubs, replace=False)
+    numNew = int(chosen.sum())
+    if numNew == 0:
+        return 0
+    existing = np.sort(edgeKeys(vertices, targets[vertices, slots],
+                                numVertices))
+    newU, newV = randNewEdges(hubs, numVertices, numNew, existing)
+    u = vertices[chosen]
+    uSlots = slots[chosen]
+    v = targets[u, uSlots]
+    fits = fitEdges(targets, [newU, newV], [u, v] if replace else [])
+    if replace:
+        blank = np.full(int(fits.sum()), numVertices, dtype=targets.dtype)
+        setSlots(adjGrid, targets, v[fits], slotOf(targets, v[fits], u[fits]),
+                 blank)
+        setSlots(adjGrid, targets, u[fits], uSlots[fits], blank)
+    newU = newU[fits]
+    newV = newV[fits]
+    ends = np.concatenate((newU, newV))
+    setSlots(adjGrid, targets, ends, blankSlots(targets, ends),
+             np.concatenate((newV, newU)))
+    return int(numNew - fits.sum())
+
+
+class NestedRewiring:
+    """ Small-world-ifies an adjacency grid (padded or CSRGraph) for an
+        increasing sequence of swcs, up to maxSwc, as rewireHeterogeneous
+        does, but with the graphs nested: every undirected edge gets a fixed
+        random threshold, and every edge with a threshold below maxSwc a
+        fixed new edge (from a random hub to a random cell), up front. The
+        graph for swc has every edge whose threshold is below swc rewired.
+        Going from one swc to the next only applies the edges with
+        thresholds in between, so the rewiring for a whole sweep costs as
+        much as for its largest swc, and neighboring swcs share most of
+        their graph. """
+    def __init__(self, adjGrid, heterogeneity=0, replace=True, hubs=None,
+                 maxSwc=1):
+        self.adjGrid = adjGrid.copy()
+        self.replace = replace
+        self.maxSwc = maxSwc
+        self.swc = 0
+        self.dropped = 0
+        if isinstance(adjGrid, CSRGraph):
+            numVertices = adjGrid.numVertices
+            u, v = adjGrid.undirectedEdges()
+        else:
+            self.targets = slotTargets(self.adjGrid)
+            numVertices = self.targets.shape[0]
+            vertices, slots = undirectedSlots(self.targets)
+            u, v = vertices, self.targets[vertices, slots]
+        self.numVertices = numVertices
+        if hubs is None:
+            numHubs = int((1 - heterogeneity) * numVertices)
+            hubs = np.random.choice(numVertices, numHubs, replace=False)
+        self.hubs = hubs
+        thresholds = np.random.random(len(u))
+        # edges in the order they are rewired; only those up to maxSwc ever
+        # are
+        order = np.argsort(thresholds, kind="stable")
+        self.thresholds = thresholds[order]
+        numNeeded = int(np.searchsorted(self.thresholds, maxSwc))
+        self.u, self.v = u[order], v[order]
+        existing = np.sort(edgeKeys(u, v, numVertices))
+        # the new edges are distinct, and never in the original graph, so
+        # no edge is ever added twice
+        self.newU, self.newV = randNewEdges(hubs, numVertices, numNeeded,
+                                            existing)
+        # number of edges rewired so far, and whether each one fit
+        self.numDone = 0
+        self.fits = np.zeros(numNeeded, dtype=bool)
+
+    def advance(self, swc):
+        """ Rewires the grid for swc, which must not be below the last one.
+            Returns the grid, which is changed in place by later calls (so
+            it should be copied if it is to be kept or modified). """
+        if swc < self.swc:
+            raise ValueError("NestedRewiring can only go to larger swcs.")
+        if swc > self.maxSwc:
+            raise ValueError("NestedRewiring was set up for swcs of at most " +
+                             str(self.maxSwc) + ".")
+        self.swc = swc
+        numDone = int(np.searchsorted(self.thresholds, swc))
+        if numDone == self.numDone:
+            return self.adjGrid
+        batch = slice(self.numDone, numDone)
+        self.numDone = numDone
+        if isinstance(self.adjGrid, CSRGraph):
+            self.rewireCSR(batch)
+        else:
+            self.rewireBatch(batch)
+        return self.adjGrid
+
+    def rewireCSR(self, batch):
+        """ Rewires the edges of batch in the CSRGraph; every new edge
+            fits. """
+        self.fits[batch] = True
+        newU, newV = self.newU[batch], self.newV[batch]
+        if self.replace:
+            u, v = self.u[batch], self.v[batch]
+            removeSrc = np.concatenate((u, v))
+            removeDst = np.concatenate((v, u))
+        else:
+            removeSrc = removeDst = np.zeros(0, dtype=np.int64)
+        spliceEdges(self.adjGrid, removeSrc, removeDst,
+                    np.concatenate((newU, newV)), np.concatenate((newV, newU)))
+
+    def rewireBatch(self, batch):
+        """ Rewires the edges of batch in the padded adjacency grid. New
+            edges that do not fit are dropped (and the edges they were to
+            replace kept), as in rewireHeterogeneous. """
+        targets = self.targets
+        numVertices = targets.shape[0]
+        u, v = self.u[batch], self.v[batch]
+        newU, newV = self.newU[batch], self.newV[batch]
+        fits = fitEdges(targets, [newU, newV], [u, v] if self.replace else [])
+        self.fits[batch] = fits
+        self.dropped += int(len(fits) - fits.sum())
+        u, v, newU, newV = u[fits], v[fits], newU[fits], newV[fits]
+        if self.replace:
+            blank = np.full(len(u), numVertices, dtype=targets.dtype)
+            setSlots(self.adjGrid, targets, v, slotOf(targets, v, u), blank)
+            setSlots(self.adjGrid, targets, u, slotOf(targets, u, v), blank)
+        ends = np.concatenate((newU, newV))
+        setSlots(self.adjGrid, targets, ends, blankSlots(targets, ends),
+                 np.concatenate((newV, newU)))
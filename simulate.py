@@ -1,20 +1,43 @@
 ﻿from copy import deepcopy
 from math import floor
 import cmath
-from numbapro import cuda
-from numba import *
+try:
+    from numba import *
+    from numba import njit
+except ImportError:
+    # no numba; the loops below run as plain Python
+    def njit(func=None, **kwargs):
+        return func if func is not None else (lambda f: f)
+try:
+    from numbapro import cuda
+except ImportError:
+    # CPU-only machine; the CUDA kernels are unavailable (see backends.py)
+    cuda = None
 import numpy as np
 from timeit import default_timer as timer
 from random import randrange
+from csrgraph import CSRGraph, smallWorldIfyCSR, smallWorldIfyHeterogeneousCSR
+from rewire import rewire, rewireHeterogeneous
 
 """ Code for initializing fitness values for each location in grid."""
 def initFitnesses(dim, payoffMatrix, adjGrid, grid):
+    """ Returns the fitness (see computeFitness) of every location of a grid
+        with dimension dim, as an array of shape dim. """
+    fitnesses = np.zeros(tuple(dim))
+    for loc in np.ndindex(*tuple(dim)):
+        fitnesses[loc] = computeFitness(dim, payoffMatrix, adjGrid, grid, loc)
+    return fitnesses
 
 def computeFitness(dim, payoffMatrix, adjGrid, grid, loc):
-    """ Computes the fitness of the individual at location loc. """
+    """ Computes the fitness of the individual at location loc: the sum,
+        over its neighbors, of payoffMatrix[its state][neighbor's state]. """
     payoff = 0
     for adjLoc in adjGrid[loc]:
-        payoff += grid[adjLoc]
+        # placeholders (dim) are in the dead zone
+        if (np.asarray(adjLoc) >= dim).any():
+            continue
+        payoff += payoffMatrix[grid[loc]][grid[tuple(adjLoc)]]
+    return payoff
 
 """ Below are a variety of adjacency functions, which can be used
     to generate grids of various topologies for the Game of Life. """
@@ -29,11 +52,11 @@ def stdAdjFunc(coord, dim):
     if val >= 3 ** ldim - 1:
         return dim
     arr = dirFromNum(val, ldim)
-    adj = np.add(arr, coord)
+    adj = np.add(arr, pos)
 
-    for pos in adj:
+    for i in range(ldim):
         # position is not in grid; return "blank"
-        if pos < 0 or pos >= ldim:
+        if adj[i] < 0 or adj[i] >= dim[i]:
             return dim
 
     return adj
@@ -98,6 +121,12 @@ def dirFromNum(val, ldim):
         val = val // 3
     return arr  
   
+def dirsFromNums(ldim):
+    """ Returns every direction from dirFromNum, in order, as an array of
+        shape (3^ldim - 1, ldim). """
+    return np.array([dirFromNum(val, ldim) for val in range(3 ** ldim - 1)],
+                    dtype=np.int32).reshape(3 ** ldim - 1, ldim)
+
 
 """ Below are a variety of useful operations on the grid. """
 
@@ -111,8 +140,11 @@ def initAdjGrid(adjFunc, dim, extraSpace):
         Elements of the grid are arrays of coordinates (in array form) 
         of adjacent points, according to the adjacency function. The amount
         of extra connections that can be added is specified by the extraSpace
-        parameter. """
-    
+        parameter. Torus and standard grids are built in bulk (see
+        bulkAdjGrid); other adjacency functions are called once per slot. """
+    if adjFunc in bulkAdjFuncs:
+        return bulkAdjGrid(adjFunc, dim, extraSpace)
+
     ldim = len(dim)
     buffer = (3 ** ldim - 1) * extraSpace
     adjGrid = np.zeros(tuple(dim) + (buffer, ldim), dtype=np.int32)
@@ -124,189 +156,87 @@ def initAdjGrid(adjFunc, dim, extraSpace):
         it.iternext()
     return adjGrid
 
-@autojit
-def getHubs(numHubs, ldim, adjGridShape):
-    hubs = np.empty((len(numHubs), ldim))
-    
-    filled = 0
-    count = 0
-    allVertices = np.empty(adjGridShape[0:ldim])
-    it = np.nditer(allVertices, flags=['multi_index'])
-    while not it.finished:
-        if count in numHubs:
-            hubs[filled] = np.array(it.multi_index)
-            filled += 1
-        count += 1
-        it.iternext()
+def bulkAdjGrid(adjFunc, dim, extraSpace):
+    """ Like initAdjGrid, but builds the whole adjacency grid at once with
+        NumPy broadcasting over the directions from dirFromNum. Only works
+        for torusAdjFunc and stdAdjFunc; the result is identical to calling
+        them on every slot (including the dim placeholders). """
+    ldim = len(dim)
+    dim = np.array(dim)
+    maxIndex = 3 ** ldim - 1
+    dirs = dirsFromNums(ldim)
+    adjGrid = np.empty(tuple(dim) + (maxIndex * extraSpace, ldim),
+                       dtype=np.int32)
+    # extra space is blank
+    adjGrid[..., maxIndex:, :] = dim
+    # whether each (cell, direction) leaves the grid
+    outside = np.zeros(tuple(dim) + (maxIndex,), dtype=np.bool_)
+    for i in range(ldim):
+        # coordinate i of every cell, shaped to broadcast against the others
+        # and against the directions (last axis)
+        shape = [1] * ldim + [1]
+        shape[i] = dim[i]
+        coords = np.arange(dim[i], dtype=np.int32).reshape(shape)
+        adj = coords + dirs[:, i]
+        if adjFunc is torusAdjFunc:
+            adj %= dim[i]
+        else:
+            outside |= (adj < 0) | (adj >= dim[i])
+        adjGrid[..., 0:maxIndex, i] = adj
+    if adjFunc is stdAdjFunc:
+        adjGrid[..., 0:maxIndex, :][outside] = dim
+    return adjGrid
 
-    if filled != len(hubs):
+# adjacency functions that bulkAdjGrid can build
+bulkAdjFuncs = (torusAdjFunc, stdAdjFunc)
+
+def selectHubs(dim, heterogeneity=0):
+    """ Returns the flat indices (in increasing order) of a random
+        (1 - heterogeneity) fraction of the cells of a grid with dimension
+        dim, to be the hubs of smallWorldIfyHeterogeneous. """
+    numVertices = int(np.prod(dim))
+    numHubs = int((1 - heterogeneity) * numVertices)
+    return np.sort(np.random.choice(numVertices, numHubs, replace=False))
+
+def getHubs(numHubs, ldim, adjGridShape):
+    """ Returns the coordinates of the cells with flat indices numHubs (as
+        from selectHubs), as an int32 array of shape (len(numHubs), ldim),
+        in increasing flat order. """
+    flat = np.sort(np.asarray(numHubs, dtype=np.int64))
+    if (flat[1:] == flat[0:-1]).any():
         print("WARNING: Incorrect number of hubs.")
-    
-    return hubs
+    coords = np.unravel_index(flat, tuple(adjGridShape[0:ldim]))
+    return np.array(coords, dtype=np.int32).T.copy()
 
-@autojit
-def smallWorldIfyHeterogeneous(adjGrid, jumpProb, heterogeneity=0, replace=True):
+def smallWorldIfyHeterogeneous(adjGrid, jumpProb, heterogeneity=0, replace=True,
+                               hubs=None):
     """ Turns the adjacency grid into a small-world network.
         This works as follows: for each edge, we rewire it into
         a random edge (with the same starting vertex) with a given
         probability, if replace. Otherwise, we simply add extra edges.
         The SWN will have tunable heterogeneity. Unlike other method,
         new edges are COMPLETELY random - they do not have same starting vertex.
-        Assumes initial adjGrid is torus-like."""
-    # we need to iterate over this to keep tuples intact
-    ldim = len(adjGrid.shape) - 2
-    dim = adjGrid.shape[0:ldim]
-    iter_arr = np.empty(adjGrid.shape[0:ldim+1], dtype=np.int8)
-    dim = np.array(dim)
-    it = np.nditer(iter_arr, flags=['multi_index'])
-    maxIndex = 3 ** ldim - 1
-    
-    numVertices = np.prod(adjGrid.shape[0:ldim])
-    hubs = getHubs(np.random.choice(numVertices, (1 - heterogeneity) * numVertices, replace=False), ldim, adjGrid.shape)
-    
-    
-    print("Number of hubs: " + len(hubs))
-
-    while not it.finished:
-        # only consider left-facing edges (plus down) - that way we
-        # count each edge exactly once (the other edges will be counted
-        # when we iterate to the corresponding neighbor vertices).
-        if it.multi_index[ldim] >= maxIndex / 2:
-            it.iternext()
-            continue
-
-        # do not change this edge
-        if np.random.random() > jumpProb:
-            it.iternext()
-            continue
-
-        # the edge we are about to remove
-        loc = it.multi_index[0:ldim]
-        adjLoc = tuple(adjGrid[it.multi_index])
-
-        
-        # an edge already exists bewtween the two new locations (i.e. we need to resample)
-        edgeExists = True
-        # new, random locations for the new edge
-        while edgeExists:
-            # one of the locations must be a hub
-            newLocPos = randrange(0, len(hubs))
-            newLoc = tuple(hubs[newLocPos])
-            newAdjLoc = getRandLoc(dim, newLoc)
-            edgeExists = False
-            # check if an edge already exists between these two vertices
-            for i in range(len(adjGrid[newLoc])):
-                if (adjGrid[newLoc + (i,)] == newAdjLoc).all():
-                    edgeExists = True
-        
-        
-        
-        # add edge from newLoc to newAdjLoc
-        # to do this we replace first available blank space
-        added = False
-        for i in range(len(adjGrid[newLoc])):
-            if (adjGrid[newLoc + (i,)] == dim).all():
-                adjGrid[newLoc + (i,)] = np.array(newAdjLoc)
-                added = True
-                break
-        
-        # add reverse edge from newAdjLoc to newLoc
-        addedRev = False
-        for i in range(len(adjGrid[newAdjLoc])):
-            if (adjGrid[newAdjLoc + (i,)] == dim).all():
-                adjGrid[newAdjLoc + (i,)] = np.array(newLoc)
-                addedRev = True
-                break
-        
-        # we never added edge: print warning message and continue
-        # to next location
-        if not added:
-            print("WARNING: Failed to write edge from " + str(newLoc) + " to " +
-                  str(tuple(newAdjLoc)) + ". Try adding more extra space.")
-            it.iternext()
-            continue
-
-        if not addedRev:
-            print("WARNING: Failed to write edge from " + str(newAdjLoc) + " to " +
-                  str(tuple(newLoc)) + ". Try adding more extra space.")
-            it.iternext()
-            continue
-           
-        # remove original edges
-        if replace:
-            # delete original forwards edge from loc to adjLoc
-            adjGrid[it.multi_index] = dim
-
-            # remove backwards edge from adjLoc to loc
-            for i in range(len(adjGrid[adjLoc])):
-                if (adjGrid[adjLoc + (i,)] == np.array(loc)).all():
-                    adjGrid[adjLoc + (i,)] = dim
-                    break
-
-        it.iternext()
+        hubs are the flat indices of the hub cells; by default they are
+        drawn with selectHubs. adjGrid may be a CSRGraph. Returns the number
+        of new edges that were dropped because there was no extra space left
+        for them (see rewire.py); a CSRGraph never runs out."""
+    if isinstance(adjGrid, CSRGraph):
+        smallWorldIfyHeterogeneousCSR(adjGrid, jumpProb, heterogeneity, replace,
+                                      hubs)
+        return 0
+    return rewireHeterogeneous(adjGrid, jumpProb, heterogeneity, replace, hubs)
     
-@autojit
 def smallWorldIfy(adjGrid, jumpProb):
     """ Turns the adjacency grid into a small-world network.
         This works as follows: for each edge, we rewire it into
         a random edge (with the same starting vertex) with a given
-        probability. Assumes initial adjGrid is torus-like."""
-    # we need to iterate over this to keep tuples intact
-    ldim = len(adjGrid.shape) - 2
-    dim = adjGrid.shape[0:ldim]
-    iter_arr = np.empty(adjGrid.shape[0:ldim+1], dtype=np.int8)
-    dim = np.array(dim)
-    it = np.nditer(iter_arr, flags=['multi_index'])
-    maxIndex = 3 ** ldim - 1
-
-    while not it.finished:
-        # only consider left-facing edges (plus down) - that way we
-        # count each edge exactly once (the other edges will be counted
-        # when we iterate to the corresponding neighbor vertices).
-        if it.multi_index[ldim] >= maxIndex / 2:
-            it.iternext()
-            continue
-
-        # do not change this edge
-        if np.random.random() > jumpProb:
-            it.iternext()
-            continue
-
-        # the location in question, and the adjacent location
-        loc = it.multi_index[0:ldim]
-        adjLoc = tuple(adjGrid[it.multi_index])
-
-        # new, random location that the edge will connect to
-        newLoc = getRandLoc(dim, loc)
-        
-        # add backwards edge from newLoc to loc
-        # to do this we replace first available blank space
-        added = False
-        for i in range(len(adjGrid[newLoc])):
-            if (adjGrid[newLoc + (i,)] == dim).all():
-                adjGrid[newLoc + (i,)] = np.array(loc)
-                added = True
-                break
-        
-        # we never added edge: print warning message and continue
-        # to next location
-        if not added:
-            print("WARNING: Failed to write edge from " + str(loc) + " to " +
-                  str(tuple(newLoc)) + ". Try adding more extra space.")
-            it.iternext()
-            continue
-
-
-        # replace forwards edge with random edge (not to same vertex)
-        adjGrid[it.multi_index] = np.array(newLoc)
-
-        # remove backwards edge from adjLoc to loc
-        for i in range(len(adjGrid[adjLoc])):
-            if (adjGrid[adjLoc + (i,)] == np.array(loc)).all():
-                adjGrid[adjLoc + (i,)] = dim
-                break
-
-        it.iternext()
+        probability. adjGrid may be a CSRGraph. Returns the number of edges
+        left alone because there was no extra space to rewire them into
+        (see rewire.py)."""
+    if isinstance(adjGrid, CSRGraph):
+        smallWorldIfyCSR(adjGrid, jumpProb)
+        return 0
+    return rewire(adjGrid, jumpProb)
 
 
     
@@ -336,7 +266,7 @@ def genRandGrid(dim, prob=0.5):
     grid = np.random.random(tuple(dim))
     alive = grid < prob
     intGrid = np.zeros(tuple(dim + 1), dtype=np.int8) # make an integer grid
-    intGrid[alive] = 1
+    intGrid[tuple(slice(0, d) for d in dim)][alive] = 1
     return intGrid
 
 
@@ -382,11 +312,20 @@ def evolve(dim, grid, adjGrid):
         it.iternext()
     return newGrid
    
-@autojit
 def evolve2D(rows, cols, grid, adjGrid, newGrid):
     """ Like evolve, but only compatible with 2D arrays. Uses loops rather than
         iterators, so hopefully easier to parallelize. Assumes grid and adjGrid
-        are what they should be for dim = [rows, cols] (AND ARE CONFIGURED.)"""
+        are what they should be for dim = [rows, cols] (AND ARE CONFIGURED.)
+        adjGrid may also be a CSRGraph."""
+    if isinstance(adjGrid, CSRGraph):
+        evolve2D_csr(rows, cols, grid, adjGrid.indptr, adjGrid.indices,
+                     newGrid)
+    else:
+        evolve2D_dense(rows, cols, grid, adjGrid, newGrid)
+
+@njit
+def evolve2D_dense(rows, cols, grid, adjGrid, newGrid):
+    """ evolve2D for a padded adjacency grid. """
     maxLen = len(adjGrid[0,0])
     for i in range(rows):
         for j in range(cols):
@@ -397,8 +336,76 @@ def evolve2D(rows, cols, grid, adjGrid, newGrid):
             if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
                 newGrid[i,j] = 1
 
+@njit
+def evolve2D_csr(rows, cols, grid, indptr, indices, newGrid):
+    """ evolve2D for a CSRGraph, given as its indptr and indices arrays. """
+    for i in range(rows):
+        for j in range(cols):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+
+def evolve2DMetrics(rows, cols, grid, adjGrid, newGrid):
+    """ Like evolve2D, but also returns (live, matches, total) for grid, read
+        off the same pass over the neighbors: the number of live cells, and
+        the number of live neighbors and of all neighbors (outside the dead
+        zone) of live cells. See gridtools.cluster. """
+    if isinstance(adjGrid, CSRGraph):
+        return evolve2DMetrics_csr(rows, cols, grid, adjGrid.indptr,
+                                   adjGrid.indices, newGrid)
+    return evolve2DMetrics_dense(rows, cols, grid, adjGrid, newGrid)
+
+@njit
+def evolve2DMetrics_dense(rows, cols, grid, adjGrid, newGrid):
+    """ evolve2DMetrics for a padded adjacency grid. """
+    maxLen = len(adjGrid[0,0])
+    live = 0
+    matches = 0
+    total = 0
+    for i in range(rows):
+        for j in range(cols):
+            numAlive = 0
+            numAdj = 0
+            for k in range(maxLen):
+                numAlive += grid[adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+                # placeholders (dim) are in the dead zone
+                if adjGrid[i,j,k,0] < rows and adjGrid[i,j,k,1] < cols:
+                    numAdj += 1
+
+            if grid[i,j] == 1:
+                live += 1
+                matches += int(numAlive)
+                total += numAdj
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    return live, matches, total
+
+@njit
+def evolve2DMetrics_csr(rows, cols, grid, indptr, indices, newGrid):
+    """ evolve2DMetrics for a CSRGraph, given as its indptr and indices. """
+    live = 0
+    matches = 0
+    total = 0
+    for i in range(rows):
+        for j in range(cols):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+
+            if grid[i,j] == 1:
+                live += 1
+                matches += int(numAlive)
+                total += int(indptr[v+1] - indptr[v])
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    return live, matches, total
+
 
-@cuda.jit(argtypes=[uint8[:,:], uint32[:,:,:,:], uint8[:,:]])
 def evolve2D_kernel(grid, adjGrid, newGrid):
     """ Like evolve, but only compatible with 2D arrays. Uses loops rather than
         iterators, so hopefully easier to parallelize. Assumes grid and adjGrid
@@ -419,6 +426,105 @@ def evolve2D_kernel(grid, adjGrid, newGrid):
                 numAlive += grid[adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
             if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
                 newGrid[i,j] = 1
+
+def evolve2DCSR_kernel(grid, indptr, indices, newGrid):
+    """ Like evolve2D_kernel, but for a CSRGraph (given as its indptr and
+        indices arrays), so there are no placeholder slots to read. """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    for i in range(startX, rows, gridX):
+        for j in range(startY, cols, gridY):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+
+def evolve2DMetrics_kernel(grid, adjGrid, newGrid, metrics):
+    """ Like evolve2D_kernel, but also adds (live, matches, total) for grid
+        to metrics (see evolve2DMetrics). """
+    rows = grid.shape[0] - 1
+    maxLen = adjGrid.shape[2]
+    cols = grid.shape[1] - 1
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    live = 0
+    matches = 0
+    total = 0
+    for i in range(startX, rows, gridX):
+        for j in range(startY, cols, gridY):
+            numAlive = 0
+            numAdj = 0
+            for k in range(maxLen):
+                numAlive += grid[adjGrid[i,j,k,0], adjGrid[i,j,k,1]]
+                if adjGrid[i,j,k,0] < rows and adjGrid[i,j,k,1] < cols:
+                    numAdj += 1
+            if grid[i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += numAdj
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    # one atomic add per thread, rather than per cell
+    cuda.atomic.add(metrics, 0, live)
+    cuda.atomic.add(metrics, 1, matches)
+    cuda.atomic.add(metrics, 2, total)
+
+def evolve2DCSRMetrics_kernel(grid, indptr, indices, newGrid, metrics):
+    """ Like evolve2DCSR_kernel, but also adds (live, matches, total) for
+        grid to metrics (see evolve2DMetrics). """
+    rows = grid.shape[0] - 1
+    cols = grid.shape[1] - 1
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    live = 0
+    matches = 0
+    total = 0
+    for i in range(startX, rows, gridX):
+        for j in range(startY, cols, gridY):
+            v = i * cols + j
+            numAlive = 0
+            for k in range(indptr[v], indptr[v+1]):
+                numAlive += grid[indices[k] // cols, indices[k] % cols]
+            if grid[i,j] == 1:
+                live += 1
+                matches += numAlive
+                total += indptr[v+1] - indptr[v]
+            if numAlive == 3 or (numAlive == 2 and grid[i,j] == 1):
+                newGrid[i,j] = 1
+    cuda.atomic.add(metrics, 0, live)
+    cuda.atomic.add(metrics, 1, matches)
+    cuda.atomic.add(metrics, 2, total)
+
+def clear2D_kernel(grid):
+    """ Zeroes a 2D device grid in place, so it can be evolved into again
+        without copying zeros over from the host. """
+    startX, startY = cuda.grid(2)
+    gridX = cuda.gridDim.x * cuda.blockDim.x
+    gridY = cuda.gridDim.y * cuda.blockDim.y
+    for i in range(startX, grid.shape[0], gridX):
+        for j in range(startY, grid.shape[1], gridY):
+            grid[i,j] = 0
+
+if cuda is not None:
+    clear2D_kernel = cuda.jit(argtypes=[uint8[:,:]])(clear2D_kernel)
+    evolve2D_kernel = cuda.jit(argtypes=[uint8[:,:], uint32[:,:,:,:],
+                                         uint8[:,:]])(evolve2D_kernel)
+    evolve2DCSR_kernel = cuda.jit(argtypes=[uint8[:,:], int64[:], int32[:],
+                                            uint8[:,:]])(evolve2DCSR_kernel)
+    evolve2DMetrics_kernel = cuda.jit(argtypes=[uint8[:,:], uint32[:,:,:,:],
+                                                uint8[:,:], int64[:]])(
+        evolve2DMetrics_kernel)
+    evolve2DCSRMetrics_kernel = cuda.jit(argtypes=[uint8[:,:], int64[:],
+                                                   int32[:], uint8[:,:],
+                                                   int64[:]])(
+        evolve2DCSRMetrics_kernel)
     
 class Game:
     """ Initializes the game of life.
@@ -428,23 +534,40 @@ class Game:
         conditional statements). The specified dimension must be the dimension
         of the "real" grid, i.e. not including that last row and column.
         The adjacency function can be used to specify the geometry of the
-        grid. """
+        grid. If sparse, the adjacency is stored as a CSRGraph (which has no
+        need for extra space). """
     def __init__(self, grid=None, dim=np.array([10,10]),
-                 adjFunc=stdAdjFunc, extraSpace=1):
+                 adjFunc=stdAdjFunc, extraSpace=1, sparse=False, adjGrid=None):
         if grid is None:
             self.grid = genRandGrid(dim)
         else:
             self.grid = grid
         self.dim = dim
         start = timer()
-        self.adjGrid = initAdjGrid(adjFunc, self.dim, extraSpace)
+        if adjGrid is not None:
+            # already built (e.g. taken from adjcache.AdjCache)
+            self.adjGrid = adjGrid
+        elif sparse:
+            self.adjGrid = CSRGraph.fromAdjGrid(initAdjGrid(adjFunc, self.dim, 1))
+        else:
+            self.adjGrid = initAdjGrid(adjFunc, self.dim, extraSpace)
         dt = timer() - start
         print("Time to generate adjGrid: %f" % dt)
+        # the grid of the generation before last, evolved into again by
+        # evolve2D_self rather than allocating a new one every generation
+        self.spareGrid = None
 
     def evolve2D_self(self):
-        newGrid = np.zeros_like(self.grid)
+        """ Evolves the grid by one generation. The array the grid was in
+            is reused for the generation after, so copy it to keep it. """
+        newGrid = self.spareGrid
+        if newGrid is None or newGrid is self.grid or \
+                newGrid.shape != self.grid.shape:
+            newGrid = np.zeros_like(self.grid)
+        else:
+            newGrid[...] = 0
         evolve2D(self.dim[0], self.dim[1], self.grid, self.adjGrid, newGrid)
-        self.grid = newGrid
+        self.spareGrid, self.grid = self.grid, newGrid
     
     def smallWorldIfy(self, jumpFrac):
         """ Turns the adjacency grid into a small-world network.
@@ -0,0 +1,91 @@
+""" Sparse matrix-vector evolve.
+
+    The adjacency of a Game is turned into a sparse adjacency matrix A once;
+    every generation is then one product A @ grid (the number of live
+    neighbors of every cell) followed by the B3/S23 rule, applied to the whole
+    grid at once. Works for any topology, in any dimension, so it suits the
+    small-world networks from smallWorldIfyHeterogeneous. Needs scipy. """
+import numpy as np
+from gameoflife import Game, stdAdjFunc
+from csrgraph import CSRGraph
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+
+def adjacencyMatrix(adjGrid):
+    """ Returns the adjacency matrix of a padded adjacency grid or a
+        CSRGraph, as a scipy CSR matrix. Entry (v, w) is the number of edges
+        from cell v to cell w (flat indices of the real grid). """
+    if scipy is None:
+        raise ImportError("The SpMV engine needs scipy.")
+    if not isinstance(adjGrid, CSRGraph):
+        adjGrid = CSRGraph.fromAdjGrid(adjGrid)
+    numVertices = adjGrid.numVertices
+    data = np.ones(adjGrid.numEdges, dtype=np.int32)
+    return scipy.sparse.csr_matrix((data, adjGrid.indices, adjGrid.indptr),
+                                   shape=(numVertices, numVertices))
+
+def evolveSpMV(grid, matrix, newGrid):
+    """ Evolves grid by one generation into newGrid, using the adjacency
+        matrix from adjacencyMatrix. Works in any dimension. Every real cell
+        of newGrid is written, so it need not be zeroed. Returns the number
+        of live neighbors of every real cell. """
+    real = tuple(slice(0, d - 1) for d in grid.shape)
+    live = grid[real].ravel()
+    numAlive = (matrix @ live).reshape(newGrid[real].shape)
+    newGrid[real] = (numAlive == 3) | ((numAlive == 2) & (grid[real] == 1))
+    return numAlive
+
+def evolveSpMVMetrics(grid, matrix, degrees, newGrid):
+    """ Like evolveSpMV, but also returns (live, matches, total) for grid (see
+        simulate.evolve2DMetrics). degrees is the number of neighbors of every
+        cell, i.e. the row sums of matrix. """
+    numAlive = evolveSpMV(grid, matrix, newGrid).ravel()
+    real = tuple(slice(0, d - 1) for d in grid.shape)
+    isLive = grid[real].ravel() == 1
+    return (int(np.count_nonzero(isLive)), int(numAlive[isLive].sum()),
+            int(degrees[isLive].sum()))
+
+def evolveSpMVEnsemble(grids, matrix, degrees, newGrids, metrics=False):
+    """ Evolves a stack of grids (see ensemble.py) with a single sparse
+        matrix-matrix product, one column per replica. If metrics, returns an
+        (n, 3) array of (live, matches, total) for every grid. """
+    n = grids.shape[0]
+    real = (slice(None),) + tuple(slice(0, d - 1) for d in grids.shape[1:])
+    live = grids[real].reshape(n, -1)
+    numAlive = (matrix @ live.T).T
+    isLive = live == 1
+    newGrids[real] = ((numAlive == 3) | ((numAlive == 2) & isLive)).reshape(
+        newGrids[real].shape)
+    if metrics:
+        return np.stack((isLive.sum(axis=1), (numAlive * isLive).sum(axis=1),
+                         (degrees * isLive).sum(axis=1)),
+                        axis=1).astype(np.int64)
+
+
+class SpMVGame(Game):
+    """ A Game that evolves with evolveSpMV. The adjacency matrix is built
+        on the first step; call reload after changing adjGrid (for example
+        with smallWorldIfy). """
+    def __init__(self, grid=None, dim=np.array([10,10]),
+                 adjFunc=stdAdjFunc, extraSpace=1, sparse=False):
+        Game.__init__(self, grid, dim, adjFunc, extraSpace, sparse)
+        self.matrix = None
+
+    def reload(self):
+        """ Rebuilds the adjacency matrix from adjGrid. """
+        self.matrix = adjacencyMatrix(self.adjGrid)
+
+    def evolve2D_self(self):
+        if self.matrix is None:
+            self.reload()
+        # every real cell is written, so the spare grid need not be zeroed
+        newGrid = self.spareGrid
+        if newGrid is None or newGrid is self.grid or \
+                newGrid.shape != self.grid.shape:
+            newGrid = np.zeros_like(self.grid)
+        evolveSpMV(self.grid, self.matrix, newGrid)
+        self.spareGrid, self.grid = self.grid, newGrid
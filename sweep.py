@@ -0,0 +1,240 @@
+""" Parallel small world sweeps.
+
+    The (swc, sim) work units of a sweep in main.py are run on a pool of
+    worker processes. The unmodified adjacency grid is put in shared memory
+    once, and every worker attaches to it instead of receiving a pickled
+    copy. Each unit is seeded from the sweep's seed, its swc index and its
+    sim number (and each rewired graph from the seed and its swc, see
+    rewiredGraph, or from the seed alone with --coupled), so every
+    simulation of one swc runs on the same rewired graph and the results do
+    not depend on the number of workers. Results are handed back in sweep
+    order. """
+import random
+import numpy as np
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from gameoflife import genRandGrid, selectHubs, smallWorldIfyHeterogeneous
+from csrgraph import CSRGraph
+from rewire import NestedRewiring
+from backends import getBackend
+from cmdline import run_GPU
+from gridtools import cluster, countLiveCells
+from trajectory import TrajectoryWriter
+from adjcache import AdjCache, graphKey
+
+# state of a worker process, set up by initWorker
+_worker = {}
+
+
+def shareArray(arr):
+    """ Copies arr into a new block of shared memory. Returns the block (the
+        caller must close and unlink it) and a picklable description of the
+        array for attachArray. """
+    shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+def attachArray(desc):
+    """ Returns the shared memory block and the array described by desc (see
+        shareArray). The block is left to its creator to unlink. """
+    name, shape, dtype = desc
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+
+def shareAdjGrid(adjGrid):
+    """ Puts an adjacency grid (padded or CSRGraph) in shared memory. Returns
+        the shared memory blocks and a picklable description of the grid. """
+    if isinstance(adjGrid, CSRGraph):
+        shmIndptr, indptr = shareArray(adjGrid.indptr)
+        shmIndices, indices = shareArray(adjGrid.indices)
+        return [shmIndptr, shmIndices], ("csr", adjGrid.dim, indptr, indices)
+    shm, desc = shareArray(adjGrid)
+    return [shm], ("dense", desc)
+
+def attachAdjGrid(desc):
+    """ Returns the shared memory blocks and the (read-only) adjacency grid
+        described by desc (see shareAdjGrid). """
+    if desc[0] == "csr":
+        _, dim, indptrDesc, indicesDesc = desc
+        shmIndptr, indptr = attachArray(indptrDesc)
+        shmIndices, indices = attachArray(indicesDesc)
+        indptr.flags.writeable = False
+        indices.flags.writeable = False
+        return [shmIndptr, shmIndices], CSRGraph(dim, indptr, indices)
+    shm, adjGrid = attachArray(desc[1])
+    adjGrid.flags.writeable = False
+    return [shm], adjGrid
+
+def seedUnit(*key):
+    """ Seeds both np.random and random from the sweep seed and the indices
+        of a work unit. """
+    seed = int(np.random.SeedSequence(key).generate_state(1)[0])
+    np.random.seed(seed)
+    random.seed(seed)
+
+def swcKey(swc):
+    """ Returns swc as an integer, for seeds and cache keys. """
+    return int(round(swc * 10**6))
+
+def rewiredGraph(adjGrid, swc, args, seed, cache=None):
+    """ Returns a copy of the unmodified adjacency grid adjGrid
+        small-world-ified for swc, its hubs, and the number of new edges
+        that were dropped (None if it came from the AdjCache cache). The
+        random numbers are seeded from seed and swc alone, so the same
+        graph is built, or taken from the cache, wherever it is needed. """
+    seedUnit(seed, swcKey(swc))
+    hubs = selectHubs(np.array([args.rows, args.cols]), args.heterogeneity)
+    dropped = []
+
+    def build():
+        rewired = adjGrid.copy()
+        dropped.append(smallWorldIfyHeterogeneous(rewired, swc,
+                                                  args.heterogeneity,
+                                                  args.replace, hubs))
+        return rewired
+
+    if cache is None:
+        rewired = build()
+    else:
+        rewired = cache.get(graphKey(graph="smallworld", rows=args.rows,
+                                     cols=args.cols,
+                                     extraspace=args.extraspace,
+                                     sparse=args.sparse, swc=swcKey(swc),
+                                     heterogeneity=args.heterogeneity,
+                                     replace=args.replace, seed=seed),
+                            build)
+    return rewired, hubs, dropped[0] if dropped else None
+
+def coupledGraph(adjGrid, swcs, swcIndex, args, seed, nested=None):
+    """ Returns the graph for swcs[swcIndex] in a --coupled sweep of the
+        unmodified adjacency grid adjGrid, and the NestedRewiring it belongs
+        to, to be passed back in for the next swc. The graph is the
+        NestedRewiring's own grid, which later swcs change in place. A new
+        NestedRewiring, seeded from seed alone, is made if nested is None or
+        already past the swc, and every swc of the sweep up to this one is
+        applied in turn, so each swc gets the same graph however it is
+        reached (which new edges fit in a padded grid depends on the steps
+        taken). """
+    if nested is None or nested.swc > swcs[swcIndex]:
+        seedUnit(seed)
+        hubs = selectHubs(np.array([args.rows, args.cols]), args.heterogeneity)
+        nested = NestedRewiring(adjGrid, args.heterogeneity, args.replace,
+                                hubs, max(swcs))
+    for swc in swcs[0:swcIndex + 1]:
+        if swc >= nested.swc:
+            nested.advance(swc)
+    return nested.adjGrid, nested
+
+def adjCache(args):
+    """ Returns the adjacency cache of the --adjcache arguments, or None. """
+    if args.adjcache is None:
+        return None
+    return AdjCache(args.adjcache, args.adjcachesize * 2**20)
+
+
+def initWorker(adjDesc, args, paths, swcs):
+    """ Sets up a worker process: attaches to the shared adjacency grid. args
+        are the parsed arguments of main.py, paths is (outfile, datestr) for
+        the data4 files, and swcs are the swcs of the sweep. """
+    _worker["shm"], _worker["adjGrid"] = attachAdjGrid(adjDesc)
+    _worker["args"] = args
+    _worker["paths"] = paths
+    _worker["swcIndex"] = None
+    _worker["cache"] = adjCache(args)
+    _worker["nested"] = None
+    _worker["swcs"] = swcs
+
+def rewiredAdjGrid(swcIndex, swc, seed):
+    """ Returns the shared adjacency grid small-world-ified for swc. The
+        last one is kept, since consecutive units usually share it. """
+    if _worker["swcIndex"] != swcIndex and _worker["args"].coupled:
+        # a worker is handed units in sweep order, so it usually only has
+        # to apply the rewirings since its last swc
+        adjGrid, _worker["nested"] = coupledGraph(
+            _worker["adjGrid"], _worker["swcs"], swcIndex, _worker["args"],
+            seed, _worker["nested"])
+        _worker["swcIndex"] = swcIndex
+        _worker["rewired"] = adjGrid
+    elif _worker["swcIndex"] != swcIndex:
+        adjGrid, _, _ = rewiredGraph(_worker["adjGrid"], swc, _worker["args"],
+                                     seed, _worker["cache"])
+        _worker["swcIndex"] = swcIndex
+        _worker["rewired"] = adjGrid
+    return _worker["rewired"]
+
+def runUnit(unit):
+    """ Runs simulation sim of swc, as main.main does. Returns (swcIndex,
+        sim, live cells, cluster, metrics, cycle); metrics are the (step,
+        live, matches, total) of every sampled step when the output is 3 or
+        more, and cycle is the (transient, period) found with --cycles, or
+        (-1, -1). """
+    swcIndex, swc, strswc, sim, seed = unit
+    args = _worker["args"]
+    outfile, datestr = _worker["paths"]
+    adjGrid = rewiredAdjGrid(swcIndex, swc, seed)
+    backend = getBackend(args.backend, args.threads or 1)
+    # the unmodified torus is much faster to run bit-packed
+    if args.backend == "auto" and swc < 0.0000000001:
+        backend = getBackend("bitboard")
+    dim = np.array([args.rows, args.cols])
+    seedUnit(seed, swcIndex, sim)
+    grid = genRandGrid(dim, prob=args.frac)
+    steps = args.simlength
+    metrics = []
+    cycleWindow = args.cycles if args.output < 4 else 0
+    cycleInfo = {}
+    if args.output < 3:
+        grid = run_GPU(grid, adjGrid, steps, 0, 0, -1, -1, backend,
+                       cycleWindow=cycleWindow, cycleInfo=cycleInfo)
+    elif args.output == 3:
+        grid = run_GPU(grid, adjGrid, (steps//args.sample + 1) * args.sample,
+                       0, 0, -1, -1, backend, args.sample, metrics,
+                       cycleWindow, cycleInfo)
+    else:
+        outfile_grids = TrajectoryWriter(outfile + "data4/" + "swc=" + strswc +
+                                         "_sim=" + str(sim) + datestr +
+                                         ".traj", grid.shape)
+        for step in range(steps//args.sample + 1):
+            chunk = []
+            grid = run_GPU(grid, adjGrid, args.sample, 0, 0, -1, -1, backend,
+                           args.sample, chunk)
+            metrics.append((step * args.sample,) + chunk[0][1:])
+            outfile_grids.append(step * args.sample, grid)
+        outfile_grids.close()
+    cycle = (cycleInfo.get("transient", -1), cycleInfo.get("period", -1))
+    return (swcIndex, sim, countLiveCells(grid), cluster(grid, adjGrid),
+            metrics, cycle)
+
+
+def runSweep(adjGrid, swcs, args, paths, workers, seed=None, first=0):
+    """ Runs args.niters simulations for every swc in swcs[first:] on a pool
+        of workers processes, starting from the unmodified adjacency grid
+        adjGrid. seed (drawn by default) picks the random numbers of every
+        simulation, so a sweep resumed at first with the same seed carries
+        on as if it had not stopped. Yields (livecells, cl, metrics, cycles)
+        for each swc in order, as soon as all its simulations are done: the
+        live cells and cluster of every simulation, the list of metrics of
+        each, and an array of their (transient, period) (see runUnit). """
+    shms, adjDesc = shareAdjGrid(adjGrid)
+    if seed is None:
+        seed = np.random.randint(2**31)
+    units = [(swcIndex, swc, str(round(swc, 6)), sim, seed)
+             for swcIndex, swc in enumerate(swcs) if swcIndex >= first
+             for sim in range(args.niters)]
+    try:
+        with Pool(workers, initWorker, (adjDesc, args, paths, swcs)) as pool:
+            results = pool.imap(runUnit, units)
+            for _ in swcs[first:]:
+                livecells = np.zeros(args.niters)
+                cl = np.zeros(args.niters)
+                metrics = []
+                cycles = np.full((args.niters, 2), -1, dtype=np.int64)
+                for sim in range(args.niters):
+                    _, _, livecells[sim], cl[sim], simMetrics, cycles[sim] = \
+                        next(results)
+                    metrics.append(simMetrics)
+                yield livecells, cl, metrics, cycles
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
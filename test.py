@@ -9,4 +9,11 @@ for i in range(size * size):
     junk = torusAdjFunc(coord, np.array([512,512]))
 dt = timer() - start
 print("Time to run adjFunc 1000 times: %f" % dt)
-# torusAdjFunc: 10.59 seconds
\ No newline at end of file
+# torusAdjFunc: 10.59 seconds
+
+if __name__ == "__main__":
+    start = timer()
+    adjGrid = initAdjGrid(torusAdjFunc, np.array([4096,4096]), 1)
+    dt = timer() - start
+    print("Time to build 4096x4096 torus adjGrid: %f" % dt)
+    # initAdjGrid (bulk): 0.14 seconds
\ No newline at end of file
@@ -0,0 +1,73 @@
+""" Checks the adaptive backend against the reference evolve2D while it
+    switches between dense and sparse grids, and the sparse step on its
+    own. Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2D, evolve2DMetrics, genRandGrid, initAdjGrid, \
+    smallWorldIfyHeterogeneous, torusAdjFunc
+from adaptive import DENSE_ABOVE, SPARSE_BELOW, AdaptiveGrid, goSparse, \
+    stepSparse
+from incremental import ReverseAdjacency
+from backends import getBackend
+
+DIM = np.array([31, 37])
+
+
+def makeAdjGrid(rewired):
+    np.random.seed(26)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3 if rewired else 1)
+    if rewired:
+        smallWorldIfyHeterogeneous(adjGrid, 0.2, 0.5)
+    return adjGrid
+
+
+@pytest.mark.parametrize("rewired", [False, True])
+def test_stepSparse_matches_evolve2DMetrics(rewired):
+    adjGrid = makeAdjGrid(rewired)
+    adj = ReverseAdjacency(adjGrid)
+    grid = genRandGrid(DIM, 0.05)
+    newGrid = np.zeros_like(grid)
+    expected = evolve2DMetrics(DIM[0], DIM[1], grid, adjGrid, newGrid)
+    live, metrics = stepSparse(np.flatnonzero(grid[0:-1, 0:-1]), adj, True)
+    assert metrics == tuple(int(count) for count in expected)
+    assert np.array_equal(live, np.flatnonzero(newGrid[0:-1, 0:-1]))
+
+@pytest.mark.parametrize("rewired", [False, True])
+def test_switches_both_ways(rewired):
+    adjGrid = makeAdjGrid(rewired)
+    backend = getBackend("adaptive")
+    d_adjGrid = backend.loadAdjGrid(adjGrid)
+    # a soup dense enough to start dense, which thins out as it settles
+    grid = genRandGrid(DIM, 0.35)
+    d_grid = backend.toDevice(grid.copy())
+    kinds = []
+    for _ in range(150):
+        d_newGrid = backend.newGrid(d_grid)
+        backend.evolve(d_grid, d_adjGrid, d_newGrid)
+        newGrid = np.zeros_like(grid)
+        evolve2D(DIM[0], DIM[1], grid, adjGrid, newGrid)
+        assert np.array_equal(backend.toHost(d_newGrid), newGrid)
+        kinds.append(d_newGrid.sparse)
+        d_grid, grid = d_newGrid, newGrid
+    assert not kinds[0] and kinds[-1]
+    # a crowded sparse grid goes back to dense
+    grid = genRandGrid(DIM, 0.5)
+    d_grid = AdaptiveGrid(grid.shape, live=np.flatnonzero(grid[0:-1, 0:-1]))
+    d_newGrid = backend.newGrid(d_grid)
+    backend.evolve(d_grid, d_adjGrid, d_newGrid)
+    newGrid = np.zeros_like(grid)
+    evolve2D(DIM[0], DIM[1], grid, adjGrid, newGrid)
+    assert not d_newGrid.sparse
+    assert np.array_equal(backend.toHost(d_newGrid), newGrid)
+
+def test_thresholds():
+    shape = tuple(DIM + 1)
+    numCells = DIM[0] * DIM[1]
+    dense = AdaptiveGrid(shape, dense=np.zeros(shape, dtype=np.int8))
+    sparse = AdaptiveGrid(shape, live=np.arange(int(SPARSE_BELOW * numCells)
+                                                + 1))
+    assert goSparse(dense)
+    # between the thresholds, a grid stays as it is
+    assert goSparse(sparse)
+    sparse.live = np.arange(int(DENSE_ABOVE * numCells) + 1)
+    assert not goSparse(sparse)
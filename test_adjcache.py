@@ -0,0 +1,50 @@
+""" Checks that the adjacency cache returns what was stored, builds each
+    graph only once, and evicts the least recently used entries. Run with
+    pytest. """
+import os
+import numpy as np
+from gameoflife import initAdjGrid, torusAdjFunc
+from csrgraph import CSRGraph
+from adjcache import AdjCache, graphKey
+
+DIM = np.array([16, 20])
+
+
+def test_hit_after_miss(tmp_path):
+    cache = AdjCache(str(tmp_path), 2**30)
+    builds = []
+    def build():
+        builds.append(1)
+        return initAdjGrid(torusAdjFunc, DIM, 1)
+    key = graphKey(rows=16, cols=20, extraSpace=1)
+    assert key == graphKey(extraSpace=1, cols=20, rows=16)
+    assert key != graphKey(rows=16, cols=20, extraSpace=2)
+    first = cache.get(key, build)
+    second = cache.get(key, build)
+    assert len(builds) == 1
+    assert isinstance(second, np.memmap)
+    assert np.array_equal(first, second)
+
+def test_csr_round_trip(tmp_path):
+    cache = AdjCache(str(tmp_path), 2**30)
+    graph = CSRGraph.fromAdjGrid(initAdjGrid(torusAdjFunc, DIM, 1))
+    cache.store("graph", graph)
+    loaded = cache.load("graph")
+    assert np.array_equal(loaded.dim, graph.dim)
+    assert np.array_equal(loaded.indptr, graph.indptr)
+    assert np.array_equal(loaded.indices, graph.indices)
+    assert cache.load("missing") is None
+
+def test_evicts_least_recently_used(tmp_path):
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 1)
+    # room for two entries, not three
+    cache = AdjCache(str(tmp_path), 2 * adjGrid.nbytes + 1024)
+    cache.store("a", adjGrid)
+    cache.store("b", adjGrid)
+    os.utime(cache.path("a"), (1, 1))
+    os.utime(cache.path("b"), (2, 2))
+    # using "a" makes "b" the least recently used
+    cache.load("a")
+    cache.store("c", adjGrid)
+    assert sorted(key for _, _, key in cache.entries()) == ["a", "c"]
+    assert cache.load("b") is None
@@ -0,0 +1,29 @@
+""" Checks that the AsyncWriter writes everything queued, in order, and
+    reports errors from its thread. Run with pytest. """
+import pytest
+from asyncwriter import AsyncWriter
+
+
+def test_writes_in_order(tmp_path):
+    paths = [str(tmp_path / name) for name in ["a", "b", "c"]]
+    # a tiny queue and batches, so writes wait for room and are grouped
+    writer = AsyncWriter(maxRecords=4, batchSize=3)
+    for i in range(200):
+        writer.write(paths[i % 3], str(i) + "\n")
+    writer.closeFile(paths[0])
+    # a closed file is appended to, not truncated, if written again
+    writer.write(paths[0], "end\n")
+    writer.close()
+    for k, path in enumerate(paths):
+        with open(path) as f:
+            lines = f.read().split()
+        expected = [str(i) for i in range(k, 200, 3)]
+        assert lines == (expected + ["end"] if k == 0 else expected)
+
+def test_error_is_raised(tmp_path):
+    writer = AsyncWriter()
+    writer.write(str(tmp_path / "missing" / "file"), "text")
+    with pytest.raises(FileNotFoundError):
+        writer.close()
+    with pytest.raises(ValueError):
+        writer.write(str(tmp_path / "file"), "text")
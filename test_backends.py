@@ -0,0 +1,77 @@
+""" Checks every backend against the reference evolve2D and evolve2DMetrics,
+    on a plain torus and on a rewired one (padded and CSR). Run with
+    pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2D, evolve2DMetrics, genRandGrid, initAdjGrid, \
+    smallWorldIfyHeterogeneous, torusAdjFunc
+from csrgraph import CSRGraph
+from backends import BACKENDS, getBackend
+
+DIM = np.array([37, 53])
+STEPS = 12
+
+# backends that only take unmodified torus or standard grids
+PLAIN_ONLY = {"bitboard", "hashlife", "tiled"}
+
+NAMES = [cls.name for cls in BACKENDS if cls.isAvailable()]
+
+
+def makeAdjGrid(rewired, sparse):
+    np.random.seed(11)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 1 if not rewired else 3)
+    if rewired:
+        smallWorldIfyHeterogeneous(adjGrid, 0.1, 0.5)
+    return CSRGraph.fromAdjGrid(adjGrid) if sparse else adjGrid
+
+def reference(grid, adjGrid, steps):
+    """ Returns grid after steps generations of evolve2D, and the metrics
+        of every generation before the last. """
+    metrics = []
+    for _ in range(steps):
+        newGrid = np.zeros_like(grid)
+        metrics.append(tuple(int(count) for count in
+                             evolve2DMetrics(DIM[0], DIM[1], grid, adjGrid,
+                                             newGrid)))
+        grid = newGrid
+    return grid, metrics
+
+
+@pytest.mark.parametrize("name", NAMES)
+@pytest.mark.parametrize("rewired", [False, True])
+@pytest.mark.parametrize("sparse", [False, True])
+def test_backend_matches_evolve2D(name, rewired, sparse):
+    adjGrid = makeAdjGrid(rewired, sparse)
+    np.random.seed(5)
+    grid = genRandGrid(DIM, 0.4)
+    expected, expectedMetrics = reference(grid, adjGrid, STEPS)
+    backend = getBackend(name, 2)
+    if rewired and name in PLAIN_ONLY:
+        with pytest.raises(ValueError):
+            backend.loadAdjGrid(adjGrid)
+        return
+    d_adjGrid = backend.loadAdjGrid(adjGrid)
+
+    # one generation at a time, with metrics
+    d_grid = backend.toDevice(grid.copy())
+    metrics = []
+    for _ in range(STEPS):
+        d_newGrid = backend.newGrid(d_grid)
+        metrics.append(tuple(int(count) for count in
+                             backend.evolveMetrics(d_grid, d_adjGrid,
+                                                   d_newGrid)))
+        d_grid = d_newGrid
+    assert metrics == expectedMetrics
+    assert np.array_equal(backend.toHost(d_grid), expected)
+
+    # plain evolve
+    d_grid = backend.toDevice(grid.copy())
+    d_newGrid = backend.newGrid(d_grid)
+    backend.evolve(d_grid, d_adjGrid, d_newGrid)
+    first = np.zeros_like(grid)
+    evolve2D(DIM[0], DIM[1], grid, adjGrid, first)
+    assert np.array_equal(backend.toHost(d_newGrid), first)
+
+    # all at once
+    d_grid = backend.advance(backend.toDevice(grid.copy()), d_adjGrid, STEPS)
+    assert np.array_equal(backend.toHost(d_grid), expected)
@@ -0,0 +1,34 @@
+""" Checks that gridTopology tells plain grids from rewired ones, including
+    grids rewired in place after it was asked about them. Run with
+    pytest. """
+import numpy as np
+from gameoflife import initAdjGrid, smallWorldIfyHeterogeneous, \
+    torusAdjFunc, stdAdjFunc
+from csrgraph import CSRGraph, smallWorldIfyCSR
+from bitboard import gridTopology
+
+DIM = np.array([12, 17])
+
+
+def test_gridTopology_of_plain_grids():
+    assert gridTopology(initAdjGrid(torusAdjFunc, DIM, 2)) == "torus"
+    assert gridTopology(initAdjGrid(stdAdjFunc, DIM, 1)) == "std"
+    graph = CSRGraph.fromAdjGrid(initAdjGrid(torusAdjFunc, DIM, 1))
+    assert gridTopology(graph) == "torus"
+    assert gridTopology(initAdjGrid(torusAdjFunc, np.array([4, 5, 6]),
+                                    1)) is None
+
+def test_gridTopology_after_rewiring_in_place():
+    np.random.seed(3)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3)
+    copy = adjGrid.copy()
+    assert gridTopology(adjGrid) == "torus"
+    smallWorldIfyHeterogeneous(adjGrid, 0.2, 0.5)
+    assert gridTopology(adjGrid) is None
+    # a copy taken before rewiring is still a plain torus
+    assert gridTopology(copy) == "torus"
+
+    graph = CSRGraph.fromAdjGrid(copy)
+    assert gridTopology(graph) == "torus"
+    smallWorldIfyCSR(graph, 0.2)
+    assert gridTopology(graph) is None
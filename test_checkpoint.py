@@ -0,0 +1,67 @@
+""" Checks that a sweep of main.py that is interrupted and resumed from its
+    checkpoint writes the same output as one that runs straight through.
+    Run with pytest. """
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# a short sweep, with simulations long enough to be run in chunks (and
+# checkpointed part of the way through)
+ARGS = ["-r", "16", "-c", "16", "-n", "2", "-l", "2500", "-ms", "0",
+        "-xs", "0.2", "-ss", "0.1", "-sd", "7", "-o", "3", "-s", "100",
+        "-b", "numpy", "-v", "-1"]
+
+# runs main.py, stopping it (as if killed) right after its stopAfter'th
+# checkpoint
+RUNNER = """
+import runpy, sys
+import checkpoint
+stopAfter = int(sys.argv[1])
+save = checkpoint.Checkpointer.save
+def stoppingSave(self, makeState):
+    save(self, makeState)
+    self.saves = getattr(self, "saves", 0) + 1
+    if self.saves == stopAfter:
+        raise SystemExit(3)
+checkpoint.Checkpointer.save = stoppingSave
+sys.argv = ["main.py"] + sys.argv[2:]
+runpy.run_path("main.py", run_name="__main__")
+"""
+
+
+def runMain(args, stopAfter=0):
+    return subprocess.run([sys.executable, "-c", RUNNER, str(stopAfter)] +
+                          args, cwd=HERE, stdout=subprocess.DEVNULL).returncode
+
+def outputs(root):
+    """ Returns {path relative to the run's folder: contents} for the one run
+        folder in root. """
+    folder, = os.listdir(root)
+    files = {}
+    for dirpath, _, names in os.walk(os.path.join(root, folder)):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, os.path.join(root, folder))] = \
+                    f.read()
+    return files
+
+
+def test_resumed_sweep_matches_uninterrupted(tmp_path):
+    straight = str(tmp_path / "straight") + "/"
+    os.mkdir(straight)
+    assert runMain(ARGS + ["-ck", "0", "-of", straight]) == 0
+
+    interrupted = str(tmp_path / "interrupted") + "/"
+    os.mkdir(interrupted)
+    # checkpoint at every chance, and stop part of the way through the
+    # second simulation
+    assert runMain(ARGS + ["-ck", "0.000001", "-of", interrupted],
+                   stopAfter=5) == 3
+    folder, = os.listdir(interrupted)
+    assert os.path.exists(os.path.join(interrupted, folder, "checkpoint.pkl"))
+    assert runMain(["-rs", interrupted + folder + "/"]) == 0
+
+    assert outputs(interrupted) == outputs(straight)
@@ -0,0 +1,49 @@
+""" Checks that runs stopped at a cycle and extrapolated to the end give
+    the same final grid and metrics as running every step. Run with
+    pytest. """
+import numpy as np
+import pytest
+from gameoflife import genRandGrid, initAdjGrid, torusAdjFunc
+from cmdline import run_GPU
+from cycles import CycleDetector
+
+DIM = np.array([12, 12])
+
+
+def run(grid, adjGrid, steps, metricsInd, cycleWindow):
+    """ Returns the final grid, the metrics and the cycle info of a run. """
+    metrics = []
+    cycleInfo = {}
+    final = run_GPU(grid.copy(), adjGrid, steps, 0, 0, -1, -1, "numpy",
+                    metricsInd, metrics, cycleWindow, cycleInfo)
+    return final, metrics, cycleInfo
+
+
+@pytest.mark.parametrize("steps", [400, 401, 1000])
+@pytest.mark.parametrize("metricsInd", [-1, 1, 7])
+def test_extrapolation_matches_full_run(steps, metricsInd):
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 1)
+    np.random.seed(0)
+    grid = genRandGrid(DIM, 0.3)
+    expected, expectedMetrics, _ = run(grid, adjGrid, steps, metricsInd, 0)
+    final, metrics, cycleInfo = run(grid, adjGrid, steps, metricsInd, 64)
+    # the soup settles long before the end
+    assert cycleInfo["transient"] + cycleInfo["period"] < steps
+    assert np.array_equal(final, expected)
+    assert metrics == expectedMetrics
+
+def test_blinker_has_period_2():
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 1)
+    grid = np.zeros(tuple(DIM + 1), dtype=np.int8)
+    grid[5, 4:7] = 1
+    final, _, cycleInfo = run(grid, adjGrid, 11, -1, 8)
+    assert cycleInfo == {"transient": 0, "period": 2}
+    assert np.array_equal(final[4:7, 5], [1, 1, 1])
+
+def test_detector_forgets_old_states():
+    detector = CycleDetector(2)
+    for step, key in enumerate(["a", "b", "c"]):
+        assert detector.check(step, key) is None
+    # "a" is out of the window, "c" is not
+    assert detector.check(3, "a") is None
+    assert detector.check(4, "c") == 2
@@ -0,0 +1,59 @@
+""" Checks cluster and countLiveCells against a cell-by-cell count, on torus
+    and standard grids of several dimensions, rewired or not, padded and
+    CSR. Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import genRandGrid, initAdjGrid, smallWorldIfyHeterogeneous, \
+    stdAdjFunc, torusAdjFunc
+from csrgraph import CSRGraph
+from gridtools import cluster, countLiveCells
+
+
+def slowCluster(grid, adjGrid):
+    """ cluster, one cell and one neighbor at a time. """
+    matches = 0
+    total = 0
+    real = tuple(slice(0, d - 1) for d in grid.shape)
+    for loc in zip(*np.nonzero(grid[real] == 1)):
+        for adj in adjGrid[loc]:
+            # skip neighbors in the dead zone (placeholders included)
+            if (adj == np.array(grid.shape) - 1).any():
+                continue
+            total += 1
+            matches += grid[tuple(adj)] == 1
+    return matches / total
+
+
+@pytest.mark.parametrize("dim", [(40,), (17, 23), (5, 6, 7)])
+@pytest.mark.parametrize("adjFunc", [torusAdjFunc, stdAdjFunc])
+def test_cluster_matches_loop(dim, adjFunc):
+    dim = np.array(dim)
+    np.random.seed(2)
+    adjGrid = initAdjGrid(adjFunc, dim, 1)
+    grid = genRandGrid(dim, 0.3)
+    expected = slowCluster(grid, adjGrid)
+    assert cluster(grid, adjGrid) == pytest.approx(expected)
+    assert cluster(grid, CSRGraph.fromAdjGrid(adjGrid)) == \
+        pytest.approx(expected)
+
+def test_cluster_matches_loop_rewired():
+    dim = np.array([17, 23])
+    np.random.seed(6)
+    adjGrid = initAdjGrid(torusAdjFunc, dim, 3)
+    smallWorldIfyHeterogeneous(adjGrid, 0.2, 0.5)
+    grid = genRandGrid(dim, 0.3)
+    expected = slowCluster(grid, adjGrid)
+    assert cluster(grid, adjGrid) == pytest.approx(expected)
+    assert cluster(grid, CSRGraph.fromAdjGrid(adjGrid)) == \
+        pytest.approx(expected)
+
+def test_dead_grid():
+    dim = np.array([8, 9])
+    grid = np.zeros(tuple(dim + 1), dtype=np.int8)
+    assert countLiveCells(grid) == 0
+    assert cluster(grid, initAdjGrid(torusAdjFunc, dim, 1)) == 0
+
+def test_countLiveCells():
+    np.random.seed(1)
+    grid = genRandGrid(np.array([31, 29]), 0.4)
+    assert countLiveCells(grid) == int(np.count_nonzero(grid))
@@ -0,0 +1,42 @@
+""" Checks Hashlife against the reference evolve2D on periodic, other torus
+    and bounded grids, including a node store small enough to be evicted.
+    Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2D, genRandGrid, initAdjGrid, stdAdjFunc, \
+    torusAdjFunc
+from hashlife import Hashlife
+
+
+def reference(grid, adjGrid, steps):
+    """ Returns grid after steps generations of evolve2D. """
+    rows, cols = grid.shape[0] - 1, grid.shape[1] - 1
+    for _ in range(steps):
+        newGrid = np.zeros_like(grid)
+        evolve2D(rows, cols, grid, adjGrid, newGrid)
+        grid = newGrid
+    return grid
+
+
+# a torus with sides that are powers of 2, any other torus, and a bounded
+# grid
+@pytest.mark.parametrize("dim, torus", [((16, 32), True), ((13, 21), True),
+                                        ((13, 21), False)])
+@pytest.mark.parametrize("maxNodes", [2**22, 256])
+def test_advance_matches_evolve2D(dim, torus, maxNodes):
+    dim = np.array(dim)
+    adjGrid = initAdjGrid(torusAdjFunc if torus else stdAdjFunc, dim, 1)
+    np.random.seed(3)
+    grid = genRandGrid(dim, 0.35)
+    hashlife = Hashlife(maxNodes)
+    # a jump that is not a power of 2, and one from where the last stopped
+    first = hashlife.advance(grid, torus, 37)
+    assert np.array_equal(first, reference(grid, adjGrid, 37))
+    assert np.array_equal(hashlife.advance(first, torus, 8),
+                          reference(grid, adjGrid, 45))
+
+def test_zero_steps_keeps_grid():
+    np.random.seed(4)
+    grid = genRandGrid(np.array([9, 12]), 0.5)
+    for torus in [True, False]:
+        assert np.array_equal(Hashlife().advance(grid, torus, 0), grid)
@@ -0,0 +1,76 @@
+""" Checks the incremental evolve against the reference evolve2D, on plain
+    and rewired grids, and that it only visits cells near the changes. Run
+    with pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2D, genRandGrid, initAdjGrid, \
+    smallWorldIfyHeterogeneous, torusAdjFunc
+from incremental import ActiveGrid, ReverseAdjacency, stepActive
+from backends import GridBuffers, getBackend
+
+DIM = np.array([29, 31])
+
+
+@pytest.mark.parametrize("rewired", [False, True])
+def test_stepActive_matches_evolve2D(rewired):
+    np.random.seed(14)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3 if rewired else 1)
+    if rewired:
+        smallWorldIfyHeterogeneous(adjGrid, 0.1, 0.5)
+    adj = ReverseAdjacency(adjGrid)
+    grid = genRandGrid(DIM, 0.35)
+    state = ActiveGrid.fromGrid(grid)
+    for _ in range(40):
+        newGrid = np.zeros_like(grid)
+        evolve2D(DIM[0], DIM[1], grid, adjGrid, newGrid)
+        numChanged = stepActive(state, adj)
+        assert numChanged == np.count_nonzero(newGrid != grid)
+        assert np.array_equal(state.toGrid(), newGrid)
+        grid = newGrid
+
+def test_only_changes_are_active():
+    adj = ReverseAdjacency(initAdjGrid(torusAdjFunc, DIM, 1))
+    # a block (still life) and a blinker, far apart
+    grid = np.zeros(tuple(DIM + 1), dtype=np.int8)
+    grid[2:4, 2:4] = 1
+    grid[15, 14:17] = 1
+    state = ActiveGrid.fromGrid(grid)
+    stepActive(state, adj)
+    stepActive(state, adj)
+    # the blinker flips 4 cells a generation; the block never changes
+    assert stepActive(state, adj) == 4
+    rows = state.active // DIM[1]
+    cols = state.active % DIM[1]
+    assert (rows >= 12).all() and (rows <= 18).all()
+    assert (cols >= 12).all() and (cols <= 18).all()
+
+def test_reverse_adjacency():
+    np.random.seed(15)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3)
+    smallWorldIfyHeterogeneous(adjGrid, 0.2, 0)
+    adj = ReverseAdjacency(adjGrid)
+    src, dst = adj.forward.edges()
+    rsrc, rdst = adj.reverse.edges()
+    assert sorted(zip(src.tolist(), dst.tolist())) == \
+        sorted(zip(rdst.tolist(), rsrc.tolist()))
+
+def test_ping_pong_copies_only_changes():
+    np.random.seed(16)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3)
+    smallWorldIfyHeterogeneous(adjGrid, 0.1, 0.5)
+    backend = getBackend("incremental")
+    d_adjGrid = backend.loadAdjGrid(adjGrid)
+    grid = genRandGrid(DIM, 0.35)
+    d_grid = backend.toDevice(grid)
+    buffers = GridBuffers(backend)
+    for step in range(40):
+        d_newGrid = buffers.next(d_grid)
+        live = d_newGrid.live
+        backend.evolve(d_grid, d_adjGrid, d_newGrid)
+        if step >= 2:
+            # updated in place, from the generation it was evolved into
+            assert d_newGrid.live is live
+        newGrid = np.zeros_like(grid)
+        evolve2D(DIM[0], DIM[1], grid, adjGrid, newGrid)
+        assert np.array_equal(backend.toHost(d_newGrid), newGrid)
+        d_grid, grid = d_newGrid, newGrid
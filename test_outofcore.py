@@ -0,0 +1,47 @@
+""" Checks the out-of-core torus graph and tiled evolve against the
+    in-memory ones, on memory-mapped grids. Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2DMetrics, initAdjGrid, \
+    smallWorldIfyHeterogeneous, torusAdjFunc
+from csrgraph import CSRGraph, indexDtype
+from outofcore import TiledEvolver, openGraph, randomGrid, saveGraph, \
+    tempGrid, torusGraph
+
+DIM = np.array([23, 17])
+
+
+def test_torusGraph_matches_fromAdjGrid(tmp_path):
+    graph = torusGraph(str(tmp_path / "torus"), DIM, tileRows=5)
+    expected = CSRGraph.fromAdjGrid(initAdjGrid(torusAdjFunc, DIM, 1))
+    assert isinstance(graph.indices, np.memmap)
+    assert np.array_equal(graph.indptr, expected.indptr)
+    assert np.array_equal(graph.indices, expected.indices)
+    assert graph.indices.dtype == expected.indices.dtype == np.int32
+
+def test_indexDtype_widens_past_int32():
+    assert indexDtype(2**31 - 1) == np.int32
+    assert indexDtype(2**31) == np.int64
+
+@pytest.mark.parametrize("rewired", [False, True])
+@pytest.mark.parametrize("tileRows, prefetch", [(1, True), (4, True),
+                                                (4, False), (None, True)])
+def test_tiled_evolve_matches_evolve2D(tmp_path, rewired, tileRows,
+                                       prefetch):
+    np.random.seed(23)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3)
+    if rewired:
+        smallWorldIfyHeterogeneous(adjGrid, 0.2, 0.5)
+    saveGraph(CSRGraph.fromAdjGrid(adjGrid), str(tmp_path / "graph"))
+    evolver = TiledEvolver(openGraph(str(tmp_path / "graph")), tileRows,
+                           prefetch)
+    grid = randomGrid(str(tmp_path / "grid.npy"), DIM, 0.4, tileRows=5)
+    expected = np.array(grid)
+    for _ in range(5):
+        newGrid = tempGrid(grid.shape, str(tmp_path))
+        metrics = evolver.evolve(grid, newGrid, True)
+        newExpected = np.zeros_like(expected)
+        assert metrics == tuple(int(count) for count in evolve2DMetrics(
+            DIM[0], DIM[1], expected, adjGrid, newExpected))
+        assert np.array_equal(newGrid, newExpected)
+        grid, expected = newGrid, newExpected
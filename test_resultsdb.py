@@ -0,0 +1,43 @@
+""" Checks that results written to a ResultsDB read back, per run and
+    summarized per swc. Run with pytest. """
+import pytest
+from resultsdb import ResultsDB
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "results.db")
+    # a small batch, so rows are written both by add and by close
+    with ResultsDB(path, batchSize=4) as db:
+        first = db.startRun(rows=64, cols=64, heterogeneity=0.5, seed=1)
+        db.addSims(0.1, [10, 20], [0.5, 0.7], [(3, 2), (-1, -1)])
+        db.addSteps(0.1, 0, [(0, 100, 0.4), (50, 60, 0.45)])
+        db.addSwc(0.1, 15, 5, 0.6, 0.1)
+        second = db.startRun(rows=64, cols=64, heterogeneity=0.5, seed=2)
+        db.addSims(0.1, [30], [0.9])
+        db.addSims(0.2, [40, 50], [0.2, 0.4])
+        db.startRun(rows=32, cols=32, heterogeneity=0.5, seed=3)
+        db.addSims(0.1, [1000], [1.0])
+    with ResultsDB(path) as db:
+        assert db.query("SELECT id, seed FROM runs ORDER BY id") == \
+            [(first, 1), (second, 2), (second + 1, 3)]
+        assert db.query("SELECT sim, live, cluster, transient, period FROM "
+                        "sims WHERE run = ? ORDER BY sim", (first,)) == \
+            [(0, 10.0, 0.5, 3, 2), (1, 20.0, 0.7, None, None)]
+        assert db.query("SELECT step, live FROM steps WHERE run = ?",
+                        (first,)) == [(0, 100), (50, 60)]
+        assert db.query("SELECT live, liveStd FROM swcs") == [(15.0, 5.0)]
+        summary = db.swcSummary(rows=64)
+        assert [row[0:2] for row in summary] == [(0.1, 3), (0.2, 2)]
+        swc, _, live, liveStd, cl, _ = summary[0]
+        assert live == pytest.approx(20)
+        assert liveStd == pytest.approx((200 / 3) ** 0.5)
+        assert cl == pytest.approx(0.7)
+
+def test_rejects_unknown_parameters(tmp_path):
+    with ResultsDB(str(tmp_path / "results.db")) as db:
+        with pytest.raises(ValueError):
+            db.startRun(color="blue")
+        with pytest.raises(ValueError):
+            db.addSwc(0.1, 1, 0, 0.5, 0)
+        with pytest.raises(ValueError):
+            db.swcSummary(color="blue")
@@ -0,0 +1,105 @@
+""" Checks the vectorized rewiring: edges stay symmetric, edge counts
+    add up, and edges that do not fit are dropped and counted; and that
+    nested rewiring gives nested graphs, however the swcs are stepped
+    through. Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import initAdjGrid, smallWorldIfy, \
+    smallWorldIfyHeterogeneous, stdAdjFunc, torusAdjFunc
+from csrgraph import CSRGraph
+from rewire import NestedRewiring, slotTargets
+
+DIM = np.array([19, 24])
+
+
+def edgeList(adjGrid):
+    """ Returns the sorted (u, v) flat index pairs of every real slot. """
+    targets = slotTargets(adjGrid)
+    numVertices = targets.shape[0]
+    u, slots = np.nonzero(targets < numVertices)
+    return sorted(zip(u.tolist(), targets[u, slots].tolist()))
+
+def isSymmetric(edges):
+    return edges == sorted((v, u) for u, v in edges)
+
+
+@pytest.mark.parametrize("adjFunc", [torusAdjFunc, stdAdjFunc])
+@pytest.mark.parametrize("extraSpace", [1, 3])
+def test_smallWorldIfy(adjFunc, extraSpace):
+    np.random.seed(8)
+    adjGrid = initAdjGrid(adjFunc, DIM, extraSpace)
+    before = edgeList(adjGrid)
+    dropped = smallWorldIfy(adjGrid, 0.3)
+    after = edgeList(adjGrid)
+    assert isSymmetric(after)
+    # every edge is moved or, if it did not fit, kept
+    assert len(after) == len(before)
+    if extraSpace > 1:
+        assert after != before
+    assert 0 <= dropped < len(before) // 2
+    assert all(u != v for u, v in after)
+
+@pytest.mark.parametrize("replace", [True, False])
+def test_smallWorldIfyHeterogeneous(replace):
+    np.random.seed(9)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 4)
+    before = edgeList(adjGrid)
+    dropped = smallWorldIfyHeterogeneous(adjGrid, 0.2, 0.5, replace)
+    after = edgeList(adjGrid)
+    assert isSymmetric(after)
+    added = len(set(after) - set(before)) // 2
+    assert added > 0
+    # each new edge that fit replaced a chosen edge, if replace
+    removed = len(set(before) - set(after)) // 2
+    assert removed == (added if replace else 0)
+    assert len(after) == len(before) + 2 * (added - removed)
+    assert dropped >= 0
+
+def test_full_grid_drops_every_new_edge():
+    # no blank slots, and nothing removed: no new edge can fit
+    np.random.seed(10)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 1)
+    before = adjGrid.copy()
+    numEdges = len(edgeList(adjGrid)) // 2
+    assert smallWorldIfyHeterogeneous(adjGrid, 1, 0, False) == numEdges
+    assert np.array_equal(adjGrid, before)
+
+
+def csrEdges(graph):
+    src, dst = graph.edges()
+    return sorted(zip(src.tolist(), dst.tolist()))
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_nested_rewiring(sparse):
+    np.random.seed(12)
+    adjGrid = initAdjGrid(torusAdjFunc, DIM, 3)
+    original = set(edgeList(adjGrid))
+    if sparse:
+        adjGrid = CSRGraph.fromAdjGrid(adjGrid)
+    edges = csrEdges if sparse else edgeList
+    nested = NestedRewiring(adjGrid, 0.5)
+    graphs = [edges(nested.advance(swc)) for swc in [0, 0.1, 0.25, 0.25, 0.4]]
+    assert graphs[0] == sorted(original)
+    assert graphs[2] == graphs[3]
+    for smaller, larger in zip(graphs, graphs[1:]):
+        assert isSymmetric(larger)
+        # the graph for a larger swc keeps the new edges of the smaller
+        # one, and removes more of the original ones
+        assert set(smaller) - original <= set(larger) - original
+        assert set(larger) & original <= set(smaller) & original
+    assert nested.dropped == 0
+    # replaced edges are removed one for one
+    assert len(graphs[-1]) == len(graphs[0])
+    with pytest.raises(ValueError):
+        nested.advance(0.3)
+
+def test_nested_rewiring_is_path_independent():
+    np.random.seed(13)
+    graph = CSRGraph.fromAdjGrid(initAdjGrid(torusAdjFunc, DIM, 1))
+    stepped = NestedRewiring(graph, 0.5)
+    for swc in [0.05, 0.15, 0.3]:
+        stepped.advance(swc)
+    np.random.seed(13)
+    straight = NestedRewiring(graph, 0.5)
+    straight.advance(0.3)
+    assert csrEdges(stepped.adjGrid) == csrEdges(straight.adjGrid)
@@ -0,0 +1,44 @@
+""" Checks the temporally blocked evolve against the reference evolve2D and
+    evolve2DMetrics, on torus and standard grids of sizes that do not
+    divide into tiles, including grids smaller than a tile's halo. Run with
+    pytest. """
+import numpy as np
+import pytest
+from gameoflife import evolve2D, evolve2DMetrics, genRandGrid, initAdjGrid, \
+    stdAdjFunc, torusAdjFunc
+from tiled import TemporalBlocker
+
+
+def reference(grid, adjGrid, steps):
+    """ Returns grid after steps generations of evolve2D. """
+    rows, cols = grid.shape[0] - 1, grid.shape[1] - 1
+    for _ in range(steps):
+        newGrid = np.zeros_like(grid)
+        evolve2D(rows, cols, grid, adjGrid, newGrid)
+        grid = newGrid
+    return grid
+
+
+@pytest.mark.parametrize("dim", [(19, 27), (32, 16), (5, 3)])
+@pytest.mark.parametrize("torus", [True, False])
+@pytest.mark.parametrize("steps", [1, 3, 6])
+def test_advance_matches_evolve2D(dim, torus, steps):
+    dim = np.array(dim)
+    adjGrid = initAdjGrid(torusAdjFunc if torus else stdAdjFunc, dim, 1)
+    np.random.seed(24)
+    grid = genRandGrid(dim, 0.4)
+    blocker = TemporalBlocker(torus, tile=8, depth=6)
+    newGrid = np.zeros_like(grid)
+    blocker.advance(grid, newGrid, steps)
+    assert np.array_equal(newGrid, reference(grid, adjGrid, steps))
+
+@pytest.mark.parametrize("torus", [True, False])
+def test_metrics_match_evolve2DMetrics(torus):
+    dim = np.array([19, 27])
+    adjGrid = initAdjGrid(torusAdjFunc if torus else stdAdjFunc, dim, 1)
+    np.random.seed(25)
+    grid = genRandGrid(dim, 0.4)
+    expected = evolve2DMetrics(dim[0], dim[1], grid, adjGrid,
+                               np.zeros_like(grid))
+    assert TemporalBlocker(torus, tile=8).metrics(grid) == \
+        tuple(int(count) for count in expected)
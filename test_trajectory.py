@@ -0,0 +1,56 @@
+""" Checks that trajectory files give back the grids written to them, in
+    order and at random, closed or not. Run with pytest. """
+import numpy as np
+import pytest
+from gameoflife import genRandGrid
+from trajectory import TrajectoryReader, TrajectoryWriter
+
+DIM = np.array([13, 21])
+
+
+def makeGrids(numFrames):
+    """ Returns (step, grid) for numFrames grids that change a little from
+        one to the next. """
+    np.random.seed(16)
+    grid = genRandGrid(DIM, 0.3)
+    frames = []
+    for i in range(numFrames):
+        grid = grid.copy()
+        flips = np.random.randint(0, DIM[0]), np.random.randint(0, DIM[1])
+        grid[flips] ^= 1
+        frames.append((10 * i, grid))
+    return frames
+
+
+@pytest.mark.parametrize("delta, level", [(True, 1), (False, 1), (True, 0)])
+def test_round_trip(tmp_path, delta, level):
+    path = str(tmp_path / "run.traj")
+    frames = makeGrids(40)
+    with TrajectoryWriter(path, DIM + 1, delta, 16, level) as writer:
+        for step, grid in frames:
+            writer.append(step, grid)
+    with TrajectoryReader(path) as reader:
+        assert reader.shape == tuple(DIM + 1)
+        assert reader.steps == [step for step, _ in frames]
+        for (step, grid), (readStep, readGrid) in zip(frames,
+                                                      reader.frames()):
+            assert step == readStep
+            assert np.array_equal(grid, readGrid)
+        # random access, backwards, from the key frame before each one
+        for step, grid in reversed(frames):
+            assert np.array_equal(reader.read(step), grid)
+        with pytest.raises(KeyError):
+            reader.read(5)
+
+def test_unclosed_file(tmp_path):
+    path = str(tmp_path / "run.traj")
+    frames = makeGrids(20)
+    writer = TrajectoryWriter(path, DIM + 1)
+    for step, grid in frames:
+        writer.append(step, grid)
+    writer.file.flush()
+    # no index yet; the frames are found by their headers
+    with TrajectoryReader(path) as reader:
+        assert len(reader) == len(frames)
+        assert np.array_equal(reader.read(frames[-1][0]), frames[-1][1])
+    writer.close()
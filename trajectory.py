@@ -0,0 +1,189 @@
+""" Binary trajectory files, for the grids sampled in output mode 4.
+
+    All the sampled grids of a simulation are appended to a single file.
+    Each frame is the bit-packed real cells of one grid (8 cells to a byte),
+    optionally XOR-ed with the previous frame (most cells do not change
+    between samples, so the result is mostly zero bytes) and compressed
+    with zlib. Every keyInterval'th frame is stored whole, so any step can
+    be decoded from the key frame before it.
+
+    Layout: a header (MAGIC, the number of dimensions, and the shape of the
+    grid, including its dead last row and column), then one record per
+    frame (FRAME header, then the frame bytes), then an index of every
+    frame's (step, offset, flags) and a footer pointing at the index. A file
+    that was never closed has no index; TrajectoryReader then finds the
+    frames by reading through their headers. """
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b"GOLTRAJ1"
+# step, flags, number of bytes that follow
+FRAME = struct.Struct("<qBI")
+# step, offset of the frame record, flags
+INDEX = struct.Struct("<qqB")
+# offset of the index, number of frames, end marker
+FOOTER = struct.Struct("<qq8s")
+END = b"GOLTEND1"
+
+# frame flags
+KEY = 1
+COMPRESSED = 2
+
+
+def packGrid(grid):
+    """ Returns the real cells of an int8 grid, bit-packed into bytes. """
+    real = tuple(slice(0, d - 1) for d in grid.shape)
+    return np.packbits(grid[real] == 1, axis=None, bitorder="little")
+
+def unpackGrid(packed, shape):
+    """ Inverse of packGrid: returns an int8 grid of the given shape (with
+        its dead last row and column). """
+    grid = np.zeros(shape, dtype=np.int8)
+    real = tuple(slice(0, d - 1) for d in shape)
+    numCells = int(np.prod([d - 1 for d in shape]))
+    bits = np.unpackbits(packed, count=numCells, bitorder="little")
+    grid[real] = bits.reshape(grid[real].shape)
+    return grid
+
+
+class TrajectoryWriter:
+    """ Appends sampled grids to a trajectory file (see the module
+        docstring). If delta, frames are XOR-ed with the previous one,
+        except every keyInterval'th; level is the zlib compression level (0
+        stores frames uncompressed). Use as a context manager, or call
+        close to write the index. """
+    def __init__(self, path, shape, delta=True, keyInterval=16, level=1):
+        self.file = open(path, "wb")
+        self.shape = tuple(int(d) for d in shape)
+        self.delta = delta
+        self.keyInterval = keyInterval
+        self.level = level
+        self.index = []
+        self.previous = None
+        self.file.write(MAGIC)
+        self.file.write(struct.pack("<q", len(self.shape)))
+        self.file.write(struct.pack("<" + "q" * len(self.shape), *self.shape))
+
+    def append(self, step, grid):
+        """ Appends the grid at step. """
+        packed = packGrid(grid)
+        flags = 0
+        data = packed
+        if not self.delta or self.previous is None or \
+                len(self.index) % self.keyInterval == 0:
+            flags |= KEY
+        else:
+            data = packed ^ self.previous
+        self.previous = packed
+        data = data.tobytes()
+        if self.level > 0:
+            flags |= COMPRESSED
+            data = zlib.compress(data, self.level)
+        self.index.append((step, self.file.tell(), flags))
+        self.file.write(FRAME.pack(step, flags, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        """ Writes the index and closes the file. """
+        if self.file.closed:
+            return
+        indexOffset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX.pack(*entry))
+        self.file.write(FOOTER.pack(indexOffset, len(self.index), END))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    """ Reads a trajectory file written by TrajectoryWriter. steps lists the
+        sampled steps in order; read(step) decodes the grid at any one of
+        them, and frames() iterates over all of them. """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + " is not a trajectory file.")
+        ndim, = struct.unpack("<q", self.file.read(8))
+        self.shape = struct.unpack("<" + "q" * ndim, self.file.read(8 * ndim))
+        self.index = self.readIndex()
+        self.steps = [step for step, _, _ in self.index]
+        self.positions = {step: i for i, step in enumerate(self.steps)}
+
+    def readIndex(self):
+        """ Returns the (step, offset, flags) of every frame, from the index
+            if the file was closed, or else by reading through the frames. """
+        start = self.file.tell()
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        if size - start >= FOOTER.size:
+            self.file.seek(size - FOOTER.size)
+            indexOffset, numFrames, end = FOOTER.unpack(
+                self.file.read(FOOTER.size))
+            if end == END:
+                self.file.seek(indexOffset)
+                data = self.file.read(numFrames * INDEX.size)
+                return [INDEX.unpack_from(data, i * INDEX.size)
+                        for i in range(numFrames)]
+        index = []
+        offset = start
+        # a frame cut off by a crash is left out
+        while offset + FRAME.size <= size:
+            self.file.seek(offset)
+            step, flags, length = FRAME.unpack(self.file.read(FRAME.size))
+            if offset + FRAME.size + length > size:
+                break
+            index.append((step, offset, flags))
+            offset += FRAME.size + length
+        return index
+
+    def __len__(self):
+        return len(self.index)
+
+    def readFrame(self, i):
+        """ Returns the stored bytes of the i'th frame, decompressed, and
+            whether it is a key frame. """
+        _, offset, flags = self.index[i]
+        self.file.seek(offset)
+        _, _, length = FRAME.unpack(self.file.read(FRAME.size))
+        data = self.file.read(length)
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=np.uint8), bool(flags & KEY)
+
+    def read(self, step):
+        """ Returns the grid at step, which must be one of the sampled
+            steps. """
+        if step not in self.positions:
+            raise KeyError("Step " + str(step) + " was not sampled.")
+        i = self.positions[step]
+        # go back to the key frame, then apply the deltas after it
+        key = i
+        while not self.index[key][2] & KEY:
+            key -= 1
+        packed, _ = self.readFrame(key)
+        for j in range(key + 1, i + 1):
+            packed = packed ^ self.readFrame(j)[0]
+        return unpackGrid(packed, self.shape)
+
+    def frames(self):
+        """ Yields (step, grid) for every frame, in order. """
+        packed = None
+        for i, step in enumerate(self.steps):
+            data, isKey = self.readFrame(i)
+            packed = data if isKey else packed ^ data
+            yield step, unpackGrid(packed, self.shape)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()